@@ -0,0 +1,250 @@
+from math import sqrt
+
+from saleae.range_measurements import AnalogMeasurer
+
+from instrumentation import instrument
+from lazy_import import lazy_import
+from period_stats import PeriodStats
+
+# Imported by the first measurement, see lazy_import.py.
+numpy = lazy_import('numpy', globals())
+
+EDGES_RISING = 'edgesRising'
+EDGES_FALLING = 'edgesFalling'
+FREQUENCY_AVG = 'frequencyAvg'
+FREQUENCY_MIN = 'frequencyMin'
+FREQUENCY_MAX = 'frequencyMax'
+PERIOD_STD_DEV = 'periodStdDev'
+DUTY_CYCLE = 'dutyCycle'
+
+# Schmitt trigger states. UNKNOWN is the state before the signal first leaves the hysteresis band.
+LOW = 0
+HIGH = 1
+UNKNOWN = -1
+
+# Without a threshold, the threshold is the middle of the range of the first THRESHOLD_WINDOW_SAMPLES samples, and
+# without a hysteresis, the hysteresis is this fraction of their peak to peak voltage. The window has a fixed size, so
+# the defaults, and with them every result, do not depend on how the samples are split into chunks. It should span a few
+# periods of the slowest clock to be measured.
+DEFAULT_HYSTERESIS_FRACTION = 0.1
+THRESHOLD_WINDOW_SAMPLES = 1 << 16
+
+
+@instrument
+class AnalogClockStatsMeasurer(AnalogMeasurer):
+    # The clockStats metrics, plus the duty cycle, for a clock captured on an analog channel.
+    #
+    # The samples go through a Schmitt trigger: the signal goes high when it reaches threshold + hysteresis / 2, and low
+    # when it drops below threshold - hysteresis / 2, so noise within the hysteresis band does not produce edges. The time
+    # of an edge is where the signal last crossed the threshold itself before the trigger switched, interpolated linearly
+    # between the two samples around the crossing.
+    #
+    # Every chunk is handled with numpy alone. The trigger state, the last sample and the time of the last threshold
+    # crossing in each direction are carried from one chunk to the next, so edges whose threshold crossing and trigger
+    # point fall in different chunks are timed as if the range were a single chunk. When the threshold or the hysteresis
+    # is not given, the chunks are held back until THRESHOLD_WINDOW_SAMPLES samples have arrived to set them from.
+    #
+    # Times are kept in samples from the start of the range. Periods and frequencies are converted to seconds and Hz with
+    # the sample_rate passed to the constructor, or else the sample_rate of the chunks if they have one; without either,
+    # only the edge counts and the duty cycle are reported.
+    supported_measurements = [EDGES_RISING, EDGES_FALLING, FREQUENCY_AVG, FREQUENCY_MIN, FREQUENCY_MAX, PERIOD_STD_DEV,
+                              DUTY_CYCLE]
+
+    def __init__(self, requested_measurements, threshold=None, hysteresis=None, sample_rate=None):
+        super().__init__(requested_measurements)
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.sample_rate = sample_rate
+
+        # Chunks held back until the default threshold and hysteresis are set, and their total sample count.
+        self.pending = []
+        self.pending_count = 0
+
+        self.sample_offset = 0
+        self.state = UNKNOWN
+        self.last_sample = None
+        # Times of the last crossing of the threshold upwards and downwards.
+        self.last_crossing = {HIGH: None, LOW: None}
+
+        self.edge_counts = {HIGH: 0, LOW: 0}
+        self.first_edge_type = None
+        self.first_edge = {}
+        self.last_edge = {}
+        self.periods = {HIGH: PeriodStats(), LOW: PeriodStats()}
+        # Total time high of the pulses starting at a rising edge, and the time high of the last one.
+        self.high_time = 0.0
+        self.last_high_time = 0.0
+
+    def process_data(self, data):
+        samples = numpy.asarray(data.samples, dtype=numpy.float64)
+        if samples.size == 0:
+            return
+        if self.sample_rate is None:
+            self.sample_rate = getattr(data, 'sample_rate', None)
+        if self.threshold is None or self.hysteresis is None:
+            self.pending.append(samples)
+            self.pending_count += samples.size
+            if self.pending_count >= THRESHOLD_WINDOW_SAMPLES:
+                self.process_pending()
+            return
+        self.process_samples(samples)
+
+    def process_pending(self):
+        # Sets the threshold and hysteresis that were not given from the first THRESHOLD_WINDOW_SAMPLES samples (all of
+        # them in a shorter range), then processes the chunks held back.
+        samples = numpy.concatenate(self.pending)
+        self.pending = []
+        self.pending_count = 0
+        window = samples[:THRESHOLD_WINDOW_SAMPLES]
+        minimum = float(window.min())
+        maximum = float(window.max())
+        if self.threshold is None:
+            self.threshold = (minimum + maximum) / 2
+        if self.hysteresis is None:
+            self.hysteresis = DEFAULT_HYSTERESIS_FRACTION * (maximum - minimum)
+        self.process_samples(samples)
+
+    def process_samples(self, samples):
+        states = self.trigger_states(samples)
+        previous_states = numpy.concatenate(([self.state], states[:-1]))
+        edge_indexes = numpy.flatnonzero((states != previous_states) & (previous_states != UNKNOWN))
+        edge_types = states[edge_indexes]
+
+        edge_times = numpy.empty(edge_indexes.size)
+        for edge_type in (HIGH, LOW):
+            of_type = edge_types == edge_type
+            edge_times[of_type] = self.crossing_times(samples, edge_indexes[of_type], edge_type)
+
+        self.add_edges(edge_times, edge_types)
+        self.state = int(states[-1])
+        self.last_sample = float(samples[-1])
+        self.sample_offset += samples.size
+
+    def trigger_states(self, samples):
+        # The Schmitt trigger state after every sample: samples outside the hysteresis band set the state, and samples
+        # within it keep the state of the last sample outside it.
+        high_level = self.threshold + self.hysteresis / 2
+        low_level = self.threshold - self.hysteresis / 2
+        levels = numpy.where(samples >= high_level, HIGH, numpy.where(samples < low_level, LOW, UNKNOWN)).astype(numpy.int8)
+        last_set = numpy.maximum.accumulate(numpy.where(levels != UNKNOWN, numpy.arange(samples.size), -1))
+        return numpy.where(last_set >= 0, levels[last_set], self.state).astype(numpy.int8)
+
+    def crossing_times(self, samples, edge_indexes, edge_type):
+        # For each edge, the time of the last crossing of the threshold in the direction of the edge at or before the
+        # sample where the trigger switched.
+        if self.last_sample is None:
+            before = samples[:-1]
+            after = samples[1:]
+            first_index = 1
+        else:
+            before = numpy.concatenate(([self.last_sample], samples[:-1]))
+            after = samples
+            first_index = 0
+        if edge_type == HIGH:
+            crossed = (before < self.threshold) & (after >= self.threshold)
+        else:
+            crossed = (before >= self.threshold) & (after < self.threshold)
+        crossing_indexes = numpy.flatnonzero(crossed)
+        # The crossing is between the samples at index - 1 and index (index - 1 being the last sample of the previous
+        # chunk for index 0).
+        previous = before[crossing_indexes]
+        fractions = (self.threshold - previous) / (after[crossing_indexes] - previous)
+        crossing_indexes += first_index
+        crossing_times = self.sample_offset + crossing_indexes - 1 + fractions
+
+        positions = numpy.searchsorted(crossing_indexes, edge_indexes, side='right') - 1
+        times = crossing_times[numpy.maximum(positions, 0)] if crossing_times.size else numpy.empty(edge_indexes.size)
+        if (positions < 0).any():
+            times = numpy.where(positions < 0, self.last_crossing[edge_type], times)
+        if crossing_times.size:
+            self.last_crossing[edge_type] = float(crossing_times[-1])
+        return times
+
+    def add_edges(self, edge_times, edge_types):
+        if edge_times.size == 0:
+            return
+        if self.first_edge_type is None:
+            self.first_edge_type = int(edge_types[0])
+
+        for edge_type in (HIGH, LOW):
+            times = edge_times[edge_types == edge_type]
+            if times.size == 0:
+                continue
+            self.edge_counts[edge_type] += times.size
+            if edge_type in self.last_edge:
+                periods = numpy.diff(times, prepend=self.last_edge[edge_type])
+            else:
+                self.first_edge[edge_type] = float(times[0])
+                periods = numpy.diff(times)
+            self.periods[edge_type].merge(PeriodStats.from_periods(periods))
+
+        # Edges alternate, so every falling edge ends the pulse started by the edge before it, except for a first falling
+        # edge (from the chunk or the range) without a rising edge before it.
+        previous_rising = numpy.concatenate(([self.last_edge.get(HIGH, numpy.nan)], edge_times[:-1]))
+        previous_types = numpy.concatenate(([HIGH if HIGH in self.last_edge else UNKNOWN], edge_types[:-1]))
+        pulse_ends = (edge_types == LOW) & (previous_types == HIGH)
+        high_times = edge_times[pulse_ends] - previous_rising[pulse_ends]
+        if high_times.size:
+            self.high_time += float(high_times.sum())
+            self.last_high_time = float(high_times[-1])
+
+        for edge_type in (HIGH, LOW):
+            times = edge_times[edge_types == edge_type]
+            if times.size:
+                self.last_edge[edge_type] = float(times[-1])
+
+    def snapshot(self):
+        # As measure only reads the state, process_data can be called with more samples afterwards.
+        return self.measure()
+
+    def measure(self):
+        if self.pending:
+            # The range is shorter than the threshold window. A new measurer gets the held back chunks, so this one can
+            # still be passed more chunks after a snapshot.
+            measurer = type(self)(self.requested_measurements, self.threshold, self.hysteresis, self.sample_rate)
+            measurer.pending = list(self.pending)
+            measurer.process_pending()
+            return measurer.measured_values()
+        return self.measured_values()
+
+    def measured_values(self):
+        values = {}
+        periods = self.periods[self.first_edge_type] if self.first_edge_type is not None else PeriodStats()
+        sample_rate = self.sample_rate
+
+        if EDGES_RISING in self.requested_measurements:
+            values[EDGES_RISING] = self.edge_counts[HIGH]
+
+        if EDGES_FALLING in self.requested_measurements:
+            values[EDGES_FALLING] = self.edge_counts[LOW]
+
+        if sample_rate:
+            # Periods are measured between edges of the same type as the first edge.
+            if FREQUENCY_AVG in self.requested_measurements:
+                if periods.count > 0:
+                    span = self.last_edge[self.first_edge_type] - self.first_edge[self.first_edge_type]
+                    values[FREQUENCY_AVG] = periods.count / span * sample_rate
+
+            if FREQUENCY_MIN in self.requested_measurements:
+                if periods.max is not None and periods.max != 0:
+                    values[FREQUENCY_MIN] = sample_rate / periods.max
+
+            if FREQUENCY_MAX in self.requested_measurements:
+                if periods.min is not None and periods.min != 0:
+                    values[FREQUENCY_MAX] = sample_rate / periods.min
+
+            if PERIOD_STD_DEV in self.requested_measurements:
+                if periods.count > 1:
+                    values[PERIOD_STD_DEV] = sqrt(periods.m2 / (periods.count - 1)) / sample_rate
+
+        if DUTY_CYCLE in self.requested_measurements:
+            rising = self.periods[HIGH]
+            if rising.count > 0:
+                # The pulses of the whole periods from the first to the last rising edge, without the pulse started by
+                # the last rising edge if it has already ended.
+                high_time = self.high_time
+                if self.last_edge.get(LOW, -1.0) > self.last_edge[HIGH]:
+                    high_time -= self.last_high_time
+                values[DUTY_CYCLE] = 100 * high_time / (self.last_edge[HIGH] - self.first_edge[HIGH])
+
+        return values
@@ -0,0 +1,58 @@
+# Running statistics of the periods between edges, shared by the digital and analog clock measurers.
+#
+# This file is copied into every extension directory that uses it, as each extension is loaded on its own. The copies
+# must be kept identical.
+from lazy_import import lazy_import
+
+# Imported by the first measurement, see lazy_import.py.
+numpy = lazy_import('numpy', globals())
+
+
+class PeriodStats:
+    # Count, mean, M2 (sum of squared differences from the mean), min and max of a set of periods.
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    @classmethod
+    def from_periods(cls, periods):
+        stats = cls()
+        if periods.size > 0:
+            stats.count = int(periods.size)
+            stats.mean = float(periods.mean())
+            stats.m2 = float(numpy.square(periods - stats.mean).sum())
+            stats.min = float(periods.min())
+            stats.max = float(periods.max())
+        return stats
+
+    def add(self, period):
+        # Welford's online update, for a single period, such as the one spanning the seam between two chunks.
+        if self.min is None or self.min > period:
+            self.min = period
+        if self.max is None or self.max < period:
+            self.max = period
+        self.count += 1
+        delta = period - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (period - self.mean)
+        return self
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        if self.min is None or self.min > other.min:
+            self.min = other.min
+        if self.max is None or self.max < other.max:
+            self.max = other.max
+
+        # This uses the parallel variance algorithm (Chan et al.), which gives the same result as applying Welford's
+        # online update to every period of the other set in turn.
+        total_count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total_count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total_count
+        self.count = total_count
+        return self
@@ -2,6 +2,14 @@ from math import sqrt
 
 from saleae.range_measurements import DigitalMeasurer
 
+from instrumentation import instrument
+from lazy_import import lazy_import
+from period_stats import PeriodStats
+import quantile_sketch
+
+# Imported by the first measurement, see lazy_import.py.
+numpy = lazy_import('numpy', globals())
+
 EDGES_RISING = 'edgesRising'
 EDGES_FALLING = 'edgesFalling'
 # NOTE: currently f_avg = 1/T_avg, which is strictly speaking not the arithmetic mean of the frequency
@@ -9,79 +17,264 @@ FREQUENCY_AVG = 'frequencyAvg'
 FREQUENCY_MIN = 'frequencyMin'
 FREQUENCY_MAX = 'frequencyMax'
 PERIOD_STD_DEV = 'periodStdDev'
+PERIOD_P1 = 'periodP1'
+PERIOD_P50 = 'periodP50'
+PERIOD_P99 = 'periodP99'
+PERIOD_P999 = 'periodP999'
+HIGH_TIME_P1 = 'highTimeP1'
+HIGH_TIME_P50 = 'highTimeP50'
+HIGH_TIME_P99 = 'highTimeP99'
+HIGH_TIME_P999 = 'highTimeP999'
 
-class ClockStatsMeasurer(DigitalMeasurer):
-    supported_measurements = [EDGES_RISING, EDGES_FALLING, FREQUENCY_AVG, PERIOD_STD_DEV, FREQUENCY_MIN, FREQUENCY_MAX]
+# Percentile metrics and the fraction of the sorted periods (or high times) they report.
+PERIOD_PERCENTILES = {PERIOD_P1: 0.01, PERIOD_P50: 0.5, PERIOD_P99: 0.99, PERIOD_P999: 0.999}
+HIGH_TIME_PERCENTILES = {HIGH_TIME_P1: 0.01, HIGH_TIME_P50: 0.5, HIGH_TIME_P99: 0.99, HIGH_TIME_P999: 0.999}
+PERCENTILE_MEASUREMENTS = list(PERIOD_PERCENTILES) + list(HIGH_TIME_PERCENTILES)
 
-    def __init__(self, requested_measurements):
-        super().__init__(requested_measurements)
-        # We always need rising/falling edges
+# Percentiles are estimated with quantile sketches of fixed size, so that ranges with any number of edges can be
+# measured. This is the error bound of the estimates, as a fraction of the number of periods: with 0.001, the value
+# reported for p99 lies between the true p98.9 and p99.1. Memory and time grow roughly as 1 / PERCENTILE_RANK_ERROR.
+PERCENTILE_RANK_ERROR = 0.001
+PERCENTILE_SKETCH_K = quantile_sketch.k_for_rank_error(PERCENTILE_RANK_ERROR)
+
+# The numpy work on a run of entries costs about as much as reading a few hundred entries, whatever the length of the
+# run, so ClockStatsMeasurer collects the entries of consecutive chunks until it has at least this many.
+MINIMUM_ARRAY_ENTRIES = 4096
+
+
+class EntryBuffer:
+    # The entries of consecutive DigitalData chunks, as the time of the first entry, and the offset in seconds of every
+    # entry from that time and its bit state. Reading the entries and subtracting their times is the only per entry work
+    # done in python; everything else is done with numpy on the arrays.
+    def __init__(self):
+        self.reference = None
+        self.offsets = []
+        self.states = []
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def add(self, data):
+        entries = iter(data)
+        if self.reference is None:
+            first = next(entries, None)
+            if first is None:
+                return
+            self.reference = first[0]
+            self.offsets.append(0.0)
+            self.states.append(first[1])
+        reference = self.reference
+        append_offset = self.offsets.append
+        append_state = self.states.append
+        for t, bitstate in entries:
+            append_offset(t - reference)
+            append_state(bitstate)
+
+    def arrays(self):
+        return self.reference, numpy.array(self.offsets), numpy.array(self.states, dtype=bool)
+
+
+def data_arrays(data):
+    # Converts a DigitalData chunk to the time of its first entry, and arrays of the offset in seconds of every entry from
+    # that time and of their bit states, so that all of the per-edge work can be done with numpy instead of a python loop.
+    entries = EntryBuffer()
+    entries.add(data)
+    return entries.arrays()
+
+
+class ClockStatsPartial:
+    # The state of ClockStatsMeasurer for one contiguous run of DigitalData entries.
+    #
+    # A partial state can be built from any chunk on its own, and the partial states of neighbouring chunks can be merged
+    # in time order. Since the measured periods depend on the type of the very first transition in the range, periods
+    # are tracked for both transition types, along with the first and last transition of each type so that periods
+    # spanning the boundary between two chunks can be reconstructed when they are merged.
+    #
+    # When percentiles are gathered, the periods of each transition type and the high times (rising edge to the next
+    # falling edge) are also added to quantile sketches, and percentiles is True. Otherwise the sketches are None.
+    #
+    # Offsets are in seconds relative to reference_time, the time of the first entry. Instances are plain objects and
+    # can be pickled to move them between processes.
+    def __init__(self):
+        self.reference_time = None
+        self.first_state = None
+        self.last_state = None
         self.edges_rising = 0
         self.edges_falling = 0
-        self.first_transition_type = None
-        self.first_transition_time = None
-        self.last_transition_of_first_type_time = None
+        self.first_offset = {}
+        self.last_offset = {}
+        self.periods = {True: PeriodStats(), False: PeriodStats()}
+        self.percentiles = False
+        self.period_sketches = {True: None, False: None}
+        self.high_time_sketch = None
 
-        self.period_min = None
-        self.period_max = None
-        self.full_period_count = 0
-        self.running_mean_period = 0
-        self.running_m2_period = 0
+    @classmethod
+    def from_data(cls, data, percentiles=True):
+        return cls.from_arrays(*data_arrays(data), percentiles=percentiles)
 
-    def process_data(self, data):
-        for t, bitstate in data:
-            if self.first_transition_type is None:
-                self.first_transition_type = bitstate
-                self.first_transition_time = t
-            elif self.first_transition_type == bitstate:
-                current_period = t - (self.last_transition_of_first_type_time if self.last_transition_of_first_type_time is not None else self.first_transition_time)
-                self.last_transition_of_first_type_time = t
-
-                if self.period_min is None or self.period_min > current_period:
-                    self.period_min = current_period
-                elif self.period_max is None or self.period_max < current_period:
-                    self.period_max = current_period
-
-                # This uses Welford's online algorithm for calculating a variance
-                self.full_period_count += 1
-                delta = current_period - self.running_mean_period
-                self.running_mean_period += delta / self.full_period_count
-                delta2 = current_period - self.running_mean_period
-                self.running_m2_period += delta * delta2
-            if bitstate:
-                self.edges_rising += 1
+    @classmethod
+    def from_arrays(cls, reference, offsets, states, percentiles=True):
+        # Same as from_data, for a chunk already converted by data_arrays.
+        partial = cls()
+        if offsets.size == 0:
+            return partial
+
+        partial.reference_time = reference
+        partial.first_state = bool(states[0])
+        partial.last_state = bool(states[-1])
+        partial.edges_rising = int(numpy.count_nonzero(states))
+        partial.edges_falling = offsets.size - partial.edges_rising
+
+        for state in (True, False):
+            state_offsets = offsets[states == state]
+            if state_offsets.size > 0:
+                partial.first_offset[state] = float(state_offsets[0])
+                partial.last_offset[state] = float(state_offsets[-1])
+                partial.periods[state] = PeriodStats.from_periods(numpy.diff(state_offsets))
+                if percentiles:
+                    partial.period_sketches[state] = quantile_sketch.KllSketch.from_values(
+                        numpy.diff(state_offsets), PERCENTILE_SKETCH_K)
+
+        partial.percentiles = percentiles
+        if percentiles:
+            # A high time runs from a rising edge to the falling edge that directly follows it.
+            high_ends = states[:-1] & ~states[1:]
+            high_times = offsets[1:][high_ends] - offsets[:-1][high_ends]
+            partial.high_time_sketch = quantile_sketch.KllSketch.from_values(high_times, PERCENTILE_SKETCH_K)
+
+        return partial
+
+    def merge(self, other):
+        # Merges the partial state of the entries directly following this one into this one.
+        if other.reference_time is None:
+            return self
+        if self.reference_time is None:
+            self.__dict__.update(other.__dict__)
+            return self
+
+        shift = other.reference_time - self.reference_time
+        self.edges_rising += other.edges_rising
+        self.edges_falling += other.edges_falling
+
+        self.percentiles = self.percentiles and other.percentiles
+        if self.percentiles:
+            if self.last_state and not other.first_state:
+                seam_high_time = other.first_offset[False] + shift - self.last_offset[True]
+                self.high_time_sketch.update([seam_high_time])
+            self.high_time_sketch.merge(other.high_time_sketch)
+        else:
+            self.period_sketches = {True: None, False: None}
+            self.high_time_sketch = None
+
+        for state in (True, False):
+            if state not in other.first_offset:
+                continue
+            seam_period = None
+            if state in self.last_offset:
+                seam_period = other.first_offset[state] + shift - self.last_offset[state]
+                self.periods[state].add(seam_period)
             else:
-                self.edges_falling += 1
-    
+                self.first_offset[state] = other.first_offset[state] + shift
+            self.periods[state].merge(other.periods[state])
+            self.last_offset[state] = other.last_offset[state] + shift
+            if self.percentiles:
+                self.merge_period_sketch(state, other.period_sketches[state], seam_period)
+
+        self.last_state = other.last_state
+        return self
+
+    def merge_period_sketch(self, state, other_sketch, seam_period):
+        sketch = self.period_sketches[state]
+        if sketch is None:
+            # The first transition of this type.
+            sketch = self.period_sketches[state] = quantile_sketch.KllSketch(other_sketch.k)
+        if seam_period is not None:
+            sketch.update([seam_period])
+        sketch.merge(other_sketch)
+
+
+@instrument
+class ClockStatsMeasurer(DigitalMeasurer):
+    supported_measurements = [EDGES_RISING, EDGES_FALLING, FREQUENCY_AVG, PERIOD_STD_DEV, FREQUENCY_MIN,
+                              FREQUENCY_MAX] + PERCENTILE_MEASUREMENTS
+    partial_state_type = ClockStatsPartial
+
+    def __init__(self, requested_measurements):
+        super().__init__(requested_measurements)
+        self.partial_state = ClockStatsPartial()
+        # The quantile sketches are the most expensive part of the state, so they are only kept for percentile metrics.
+        self.needs_percentiles = any(m in self.requested_measurements for m in PERCENTILE_MEASUREMENTS)
+        # Entries of the chunks passed to process_data that are not in partial_state yet.
+        self.pending = EntryBuffer()
+
+    def process_data(self, data):
+        # Chunks can have as few as one entry, so their entries are only converted to arrays and merged into the
+        # partial state once there are MINIMUM_ARRAY_ENTRIES of them.
+        self.pending.add(data)
+        if len(self.pending) >= MINIMUM_ARRAY_ENTRIES:
+            self.merge_pending()
+
+    def merge_pending(self):
+        if len(self.pending) > 0:
+            self.partial_state.merge(ClockStatsPartial.from_arrays(*self.pending.arrays(), self.needs_percentiles))
+            self.pending = EntryBuffer()
+
+    def merge_partial_state(self, partial_state):
+        # Used instead of process_data when the chunks were reduced elsewhere, for instance in a process pool.
+        self.merge_pending()
+        self.partial_state.merge(partial_state)
+
+    def snapshot(self):
+        # The values measure would return for the data passed so far. measure only merges the pending entries into the
+        # partial state, so during a live capture snapshot can be called after every refresh and process_data can keep
+        # being called with only the data added since, instead of measuring the whole range again.
+        return self.measure()
+
     def measure(self):
+        self.merge_pending()
         values = {}
+        state = self.partial_state
+        # Periods are measured between transitions of the same type as the first transition.
+        periods = state.periods[state.first_state] if state.first_state is not None else PeriodStats()
 
         if EDGES_RISING in self.requested_measurements:
-            values[EDGES_RISING] = self.edges_rising
+            values[EDGES_RISING] = state.edges_rising
 
         if EDGES_FALLING in self.requested_measurements:
-            values[EDGES_FALLING] = self.edges_falling
+            values[EDGES_FALLING] = state.edges_falling
 
         if FREQUENCY_AVG in self.requested_measurements:
-            if self.first_transition_time is not None and self.last_transition_of_first_type_time is not None:
+            if periods.count > 0:
                 # To make the frequency measurement insensitive to exactly where the measurement falls relative to the edge, we only use the
                 # sample count of full periods in the range, not the count of samples on the edge.
                 #
                 # The period count will be the number of transition of the same type as the first transition minus one (fence post problem)
-                period_count = (self.edges_rising if self.first_transition_type else self.edges_falling) - 1
-                values[FREQUENCY_AVG] = float(period_count) / (self.last_transition_of_first_type_time - self.first_transition_time)
+                period_count = (state.edges_rising if state.first_state else state.edges_falling) - 1
+                values[FREQUENCY_AVG] = float(period_count) / state.last_offset[state.first_state]
 
         if FREQUENCY_MIN in self.requested_measurements:
-            if self.period_max is not None and self.period_max != 0:
-                values[FREQUENCY_MIN] = 1 / self.period_max
+            if periods.max is not None and periods.max != 0:
+                values[FREQUENCY_MIN] = 1 / periods.max
 
         if FREQUENCY_MAX in self.requested_measurements:
-            if self.period_min is not None and self.period_min != 0:
-                values[FREQUENCY_MAX] = 1 / self.period_min
+            if periods.min is not None and periods.min != 0:
+                values[FREQUENCY_MAX] = 1 / periods.min
 
         if PERIOD_STD_DEV in self.requested_measurements:
-            if self.full_period_count > 1:
-                period_variance = self.running_m2_period / (self.full_period_count - 1)
+            if periods.count > 1:
+                period_variance = periods.m2 / (periods.count - 1)
                 values[PERIOD_STD_DEV] = sqrt(period_variance)
 
+        if state.first_state is not None:
+            self.measure_percentiles(values, state.period_sketches[state.first_state], PERIOD_PERCENTILES)
+        self.measure_percentiles(values, state.high_time_sketch, HIGH_TIME_PERCENTILES)
+
         return values
+
+    def measure_percentiles(self, values, sketch, percentiles):
+        requested = [m for m in percentiles if m in self.requested_measurements]
+        if not requested or sketch is None or sketch.count == 0:
+            return
+        estimates = sketch.quantiles([percentiles[m] for m in requested])
+        for measurement, estimate in zip(requested, estimates.tolist()):
+            values[measurement] = estimate
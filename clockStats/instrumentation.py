@@ -0,0 +1,229 @@
+# Opt-in profiling of measurers and HLAs.
+#
+# The instrument class decorator wraps the process_data and measure methods of a measurer, and the decode, decode_batch
+# and set_settings methods of an HLA, so that every call records its duration and the number of samples, transitions or
+# frames it handled, and one call in ALLOCATION_SAMPLE_INTERVAL also the change in the number of memory blocks allocated
+# by Python. The records of an instance are written as a line of JSON to a profile file when measure returns, before
+# set_settings starts another run of an HLA, and for anything not written yet, when the interpreter exits.
+#
+# Profiling is enabled with the SALEAE_EXTENSION_PROFILE environment variable, set to the path of the profile file, or
+# with a "profile" key in the extension.json of the extension, either true (for profile.jsonl next to extension.json) or
+# a path relative to the extension directory. When neither is set, instrument returns the class unchanged, so disabled
+# profiling costs nothing. It also loads nothing but a few built in modules, and only parses extension.json when the
+# file mentions the "profile" key, so it adds next to nothing to the time taken to load an extension.
+#
+# This file is copied into every extension directory, as each extension is loaded on its own. The copies must be kept
+# identical.
+import atexit
+import math
+import os
+import sys
+import time
+
+ENVIRONMENT_VARIABLE = 'SALEAE_EXTENSION_PROFILE'
+EXTENSION_SETTING = 'profile'
+DEFAULT_FILE_NAME = 'profile.jsonl'
+
+INSTRUMENTED_METHODS = ('process_data', 'measure', 'decode', 'decode_batch', 'set_settings')
+
+# Durations are counted in a histogram with this many buckets per doubling (a power of 2). Percentiles are reported as
+# the upper bound of their bucket, which is at most 1 / BUCKETS_PER_OCTAVE (12.5%) above the exact value, whatever the
+# number of calls.
+BUCKETS_PER_OCTAVE = 8
+BUCKET_BITS = BUCKETS_PER_OCTAVE.bit_length() - 1
+
+# Counting the memory blocks allocated by Python takes longer as the heap grows, so it is only done for one call in this
+# many, and the count per call is the mean of those calls.
+ALLOCATION_SAMPLE_INTERVAL = 16
+
+# Created when the first class is instrumented.
+write_lock = None
+pending_profiles = set()
+
+
+def profile_path(directory):
+    # The profile file for the extension in directory, or None when profiling is disabled.
+    path = os.environ.get(ENVIRONMENT_VARIABLE)
+    if path:
+        return path
+    try:
+        with open(os.path.join(directory, 'extension.json')) as file:
+            text = file.read()
+        if '"{}"'.format(EXTENSION_SETTING) not in text:
+            return None
+        import json
+        setting = json.loads(text).get(EXTENSION_SETTING)
+    except (OSError, ValueError, AttributeError):
+        return None
+    if not setting:
+        return None
+    return os.path.join(directory, DEFAULT_FILE_NAME if setting is True else setting)
+
+
+def item_count(name, args):
+    # The number of samples, transitions or frames passed to a call, or None when it is not known without reading them.
+    if name == 'decode':
+        return 1
+    if not args or name not in ('process_data', 'decode_batch'):
+        return None
+    data = args[0]
+    count = getattr(data, 'sample_count', None)
+    if count is not None:
+        return count
+    try:
+        return len(data)
+    except TypeError:
+        return None
+
+
+class MethodStats:
+    def __init__(self):
+        self.calls = 0
+        self.nanoseconds = 0
+        self.items = 0
+        self.counted_calls = 0
+        self.allocated_blocks = 0
+        self.sampled_calls = 0
+        self.histogram = {}
+
+    def add(self, nanoseconds, items):
+        self.calls += 1
+        self.nanoseconds += nanoseconds
+        if items is not None:
+            self.items += items
+            self.counted_calls += 1
+        # The bucket is the position of the highest bit of the duration, followed by the BUCKET_BITS bits after it.
+        bits = nanoseconds.bit_length()
+        bucket = (bits << BUCKET_BITS) | (nanoseconds >> (bits - BUCKET_BITS - 1) & (BUCKETS_PER_OCTAVE - 1)) \
+            if bits > BUCKET_BITS else nanoseconds
+        histogram = self.histogram
+        histogram[bucket] = histogram.get(bucket, 0) + 1
+
+    def percentile(self, fraction):
+        # The upper bound of the histogram bucket holding the call at fraction of the calls, in seconds.
+        rank = math.ceil(fraction * self.calls)
+        seen = 0
+        for bucket in sorted(self.histogram):
+            seen += self.histogram[bucket]
+            if seen >= rank:
+                if bucket < BUCKETS_PER_OCTAVE:
+                    upper = bucket + 1
+                else:
+                    bits = bucket >> BUCKET_BITS
+                    upper = (BUCKETS_PER_OCTAVE + (bucket & (BUCKETS_PER_OCTAVE - 1)) + 1) << (bits - BUCKET_BITS - 1)
+                return upper * 1e-9
+        return None
+
+    def to_json(self):
+        seconds = self.nanoseconds * 1e-9
+        record = {
+            'calls': self.calls,
+            'seconds': seconds,
+            'p50Seconds': self.percentile(0.5),
+            'p99Seconds': self.percentile(0.99),
+        }
+        if self.sampled_calls:
+            record['allocatedBlocksPerCall'] = self.allocated_blocks / self.sampled_calls
+        if self.counted_calls:
+            record['items'] = self.items
+            if seconds > 0 and self.counted_calls == self.calls:
+                record['itemsPerSecond'] = self.items / seconds
+        return record
+
+
+class Profile:
+    # The calls of one measurer or HLA instance since its last record was written.
+    def __init__(self, path, class_name):
+        self.path = path
+        self.class_name = class_name
+        self.methods = {}
+
+    def method_stats(self, name):
+        stats = self.methods.get(name)
+        if stats is None:
+            stats = self.methods[name] = MethodStats()
+            pending_profiles.add(self)
+        return stats
+
+    def write(self):
+        if not self.methods:
+            return
+        record = {
+            'time': time.time(),
+            'pid': os.getpid(),
+            'class': self.class_name,
+            'instance': id(self),
+            'methods': {name: stats.to_json() for name, stats in self.methods.items()},
+        }
+        self.methods = {}
+        pending_profiles.discard(self)
+        import json
+        line = json.dumps(record) + '\n'
+        with write_lock:
+            try:
+                with open(self.path, 'a') as file:
+                    file.write(line)
+            except OSError:
+                # Profiling must never break the measurement or the analyzer.
+                pass
+
+
+@atexit.register
+def write_pending_profiles():
+    for profile in list(pending_profiles):
+        profile.write()
+
+
+def instrumented(method, name, path, class_name):
+    import functools
+    perf_counter_ns = time.perf_counter_ns
+    getallocatedblocks = sys.getallocatedblocks
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        profile = self.__dict__.get('_profile')
+        if profile is None:
+            profile = self.__dict__['_profile'] = Profile(path, class_name)
+        elif name == 'set_settings':
+            # set_settings starts another run of the HLA.
+            profile.write()
+        stats = profile.method_stats(name)
+
+        if stats.calls % ALLOCATION_SAMPLE_INTERVAL:
+            start = perf_counter_ns()
+            result = method(self, *args, **kwargs)
+            stats.add(perf_counter_ns() - start, item_count(name, args))
+        else:
+            blocks = getallocatedblocks()
+            start = perf_counter_ns()
+            result = method(self, *args, **kwargs)
+            nanoseconds = perf_counter_ns() - start
+            stats.allocated_blocks += getallocatedblocks() - blocks
+            stats.sampled_calls += 1
+            stats.add(nanoseconds, item_count(name, args))
+
+        if name == 'measure':
+            profile.write()
+        return result
+
+    return wrapper
+
+
+def instrument(cls):
+    # Class decorator for measurers and HLAs, see the top of this file.
+    module = sys.modules.get(cls.__module__)
+    module_file = getattr(module, '__file__', None)
+    path = profile_path(os.path.dirname(os.path.abspath(module_file))) if module_file else os.environ.get(ENVIRONMENT_VARIABLE)
+    if not path:
+        return cls
+
+    global write_lock
+    if write_lock is None:
+        import threading
+        write_lock = threading.Lock()
+    class_name = '{}.{}'.format(cls.__module__, cls.__qualname__)
+    for name in INSTRUMENTED_METHODS:
+        method = cls.__dict__.get(name)
+        if method is not None:
+            setattr(cls, name, instrumented(method, name, path, class_name))
+    return cls
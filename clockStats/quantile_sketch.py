@@ -0,0 +1,137 @@
+import math
+
+from lazy_import import lazy_import
+
+numpy = lazy_import('numpy', globals())
+
+# Capacity of the top level, relative to which all of the other level capacities are set. The memory of a sketch is
+# bounded by about 3 * k values, whatever the number of values added.
+DEFAULT_K = 200
+# Each level is this much smaller than the level above it.
+CAPACITY_RATIO = 2.0 / 3.0
+MINIMUM_CAPACITY = 8
+
+# Normalized rank error of a sketch as a function of k, error ~= RANK_ERROR_SCALE / k ** RANK_ERROR_EXPONENT. This is the
+# empirical fit published for KLL sketches with these level capacities, for the error of a single quantile query.
+RANK_ERROR_SCALE = 2.446
+RANK_ERROR_EXPONENT = 0.9433
+
+
+def k_for_rank_error(rank_error):
+    # The smallest k for which queries are expected to be within rank_error of the true rank (as a fraction of the count).
+    return max(MINIMUM_CAPACITY, int(math.ceil((RANK_ERROR_SCALE / rank_error) ** (1 / RANK_ERROR_EXPONENT))))
+
+
+class KllSketch:
+    # A KLL quantile sketch (Karnin, Lang & Liberty) of a stream of floats, in fixed memory.
+    #
+    # Values are kept in levels, where each value at level h stands for 2 ** h values of the stream. When a level grows past
+    # its capacity it is sorted and every other value is promoted to the level above, alternating between the even and
+    # odd values on successive compactions of the level. That choice is the only source of randomness in KLL, so
+    # alternating it instead keeps the sketch deterministic: the same values added in the same batches always give the
+    # same sketch, which keeps measurements repeatable.
+    #
+    # Values are added in batches with update, and sketches of neighbouring (or any) sets of values can be merged. The
+    # exact count, min and max are kept alongside. Instances are plain objects and can be pickled.
+    def __init__(self, k=DEFAULT_K):
+        self.k = k
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.levels = [numpy.empty(0)]
+        self.compactions = [0]
+
+    @classmethod
+    def from_values(cls, values, k=DEFAULT_K):
+        sketch = cls(k)
+        sketch.update(values)
+        return sketch
+
+    @property
+    def rank_error(self):
+        return RANK_ERROR_SCALE / self.k ** RANK_ERROR_EXPONENT
+
+    @property
+    def retained(self):
+        return sum(level.size for level in self.levels)
+
+    @property
+    def nbytes(self):
+        return sum(level.nbytes for level in self.levels)
+
+    def capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(MINIMUM_CAPACITY, int(math.ceil(self.k * CAPACITY_RATIO ** depth)))
+
+    def update(self, values):
+        values = numpy.asarray(values, dtype=numpy.float64).ravel()
+        if values.size == 0:
+            return self
+        self._update_extrema(values.size, float(values.min()), float(values.max()))
+        self.levels[0] = numpy.concatenate((self.levels[0], values))
+        self.compress()
+        return self
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        self.k = min(self.k, other.k)
+        self._update_extrema(other.count, other.min, other.max)
+        while len(self.levels) < len(other.levels):
+            self.levels.append(numpy.empty(0))
+            self.compactions.append(0)
+        for level, values in enumerate(other.levels):
+            if values.size > 0:
+                self.levels[level] = numpy.concatenate((self.levels[level], values))
+        self.compress()
+        return self
+
+    def _update_extrema(self, count, minimum, maximum):
+        self.count += count
+        self.min = minimum if self.min is None else min(self.min, minimum)
+        self.max = maximum if self.max is None else max(self.max, maximum)
+
+    def compress(self):
+        # Compacts levels until every level is within its capacity. Adding a level lowers the capacity of the levels
+        # below it, so this can take more than one pass.
+        compacted = True
+        while compacted:
+            compacted = False
+            for level in range(len(self.levels)):
+                if self.levels[level].size > self.capacity(level):
+                    self._compact(level)
+                    compacted = True
+
+    def _compact(self, level):
+        values = numpy.sort(self.levels[level])
+        # With an odd number of values the smallest one stays, so the total weight is unchanged.
+        kept = values.size & 1
+        offset = self.compactions[level] & 1
+        self.compactions[level] += 1
+        if level + 1 == len(self.levels):
+            self.levels.append(numpy.empty(0))
+            self.compactions.append(0)
+        self.levels[level] = values[:kept]
+        self.levels[level + 1] = numpy.concatenate((self.levels[level + 1], values[kept + offset::2]))
+
+    def quantiles(self, fractions):
+        # The value at each fraction of the sorted stream: the smallest retained value whose estimated rank reaches
+        # fraction * count. 0 and 1 give the exact min and max. Does not modify the sketch.
+        fractions = numpy.asarray(fractions, dtype=numpy.float64)
+        if self.count == 0:
+            return numpy.full(fractions.shape, numpy.nan)
+
+        values = numpy.concatenate(self.levels)
+        weights = numpy.concatenate([numpy.full(level.size, 1 << height, dtype=numpy.int64)
+                                     for height, level in enumerate(self.levels)])
+        order = numpy.argsort(values, kind='stable')
+        values = values[order]
+        cumulative_weights = numpy.cumsum(weights[order])
+
+        indexes = numpy.searchsorted(cumulative_weights, fractions * self.count, side='left')
+        result = values[numpy.minimum(indexes, values.size - 1)]
+        result = numpy.where(fractions <= 0, self.min, result)
+        return numpy.where(fractions >= 1, self.max, result)
+
+    def quantile(self, fraction):
+        return float(self.quantiles([fraction])[0])
@@ -0,0 +1,120 @@
+import numpy
+
+from clock_stats import ClockStatsMeasurer, ClockStatsPartial, data_arrays
+
+# Fields of the array returned by WindowedClockStatsMeasurer.windows(). start and end are in seconds from the first
+# entry of the range, periods is the number of whole periods in the window, and metrics that cannot be computed for a
+# window (no periods, or a single period for the standard deviation) are NaN.
+WINDOW_DTYPE = numpy.dtype([
+    ('start', numpy.float64),
+    ('end', numpy.float64),
+    ('periods', numpy.int64),
+    ('frequencyAvg', numpy.float64),
+    ('frequencyMin', numpy.float64),
+    ('frequencyMax', numpy.float64),
+    ('periodStdDev', numpy.float64),
+])
+
+
+class WindowedClockStatsMeasurer(ClockStatsMeasurer):
+    # ClockStatsMeasurer that also measures the clock in windows of window seconds, starting every hop seconds from the
+    # first entry of the range, so frequency drift can be followed through a range in a single pass over its data.
+    #
+    # Like the whole range measurement, a window measures the periods between transitions of the same type as the first
+    # transition of the range, counting the periods that start and end within the window. The transitions of windows
+    # that are not complete yet are kept between calls to process_data; all of the windows completed by a chunk are then
+    # measured at once with numpy, whatever their number. measure() returns the metrics of the whole range as usual, and
+    # windows() the metrics of every window.
+    def __init__(self, requested_measurements, window, hop=None):
+        super().__init__(requested_measurements)
+        if window <= 0 or (hop is not None and hop <= 0):
+            raise ValueError('window and hop must be positive')
+        self.window = float(window)
+        self.hop = float(window if hop is None else hop)
+        self.reference_time = None
+        # Offsets from reference_time of the transitions of the period type from the start of the first incomplete
+        # window on, and the offset of the last entry of any type.
+        self.edges = numpy.empty(0)
+        self.last_offset = None
+        self.completed = []
+        self.next_window = 0
+
+    def process_data(self, data):
+        reference, offsets, states = data_arrays(data)
+        if offsets.size == 0:
+            return
+        self.partial_state.merge(ClockStatsPartial.from_arrays(reference, offsets, states, self.needs_percentiles))
+
+        if self.reference_time is None:
+            self.reference_time = reference
+        shift = reference - self.reference_time
+        edges = offsets[states == self.partial_state.first_state]
+        if shift != 0:
+            edges = edges + shift
+        self.edges = numpy.concatenate((self.edges, edges))
+        self.last_offset = float(offsets[-1]) + shift
+
+        # Windows ending at or before the last entry can not get any more transitions.
+        complete_count = int(numpy.floor((self.last_offset - self.window) / self.hop)) + 1 - self.next_window
+        if complete_count > 0:
+            starts = (self.next_window + numpy.arange(complete_count)) * self.hop
+            self.completed.append(self.measure_windows(starts, starts + self.window))
+            self.next_window += complete_count
+            # Transitions before the start of the next window are not part of any window still to be measured.
+            self.edges = self.edges[numpy.searchsorted(self.edges, self.next_window * self.hop):]
+
+    def measure_windows(self, starts, ends, include_end=False):
+        windows = numpy.zeros(starts.size, dtype=WINDOW_DTYPE)
+        windows['start'] = starts
+        windows['end'] = ends
+        for name in ('frequencyAvg', 'frequencyMin', 'frequencyMax', 'periodStdDev'):
+            windows[name] = numpy.nan
+
+        edges = self.edges
+        first = numpy.searchsorted(edges, starts, side='left')
+        last = numpy.searchsorted(edges, ends, side='right' if include_end else 'left')
+        # Window i has the periods first[i] to last[i] - 2, between the transitions first[i] to last[i] - 1.
+        counts = numpy.maximum(last - first - 1, 0)
+        windows['periods'] = counts
+        measured = counts > 0
+        if not measured.any():
+            return windows
+
+        periods = numpy.diff(edges)
+        first = first[measured]
+        last = last[measured] - 1
+        counts = counts[measured]
+
+        # The sum of the periods of a window is the time between its first and last transitions.
+        windows['frequencyAvg'][measured] = counts / (edges[last] - edges[first])
+
+        # Each window's periods are reduced with reduceat over the (start, stop) pairs of all of the windows, which
+        # handles overlapping windows. A trailing element keeps the stop indexes within bounds.
+        indexes = numpy.stack((first, last), axis=1).ravel()
+        padded = numpy.append(periods, 0.0)
+        windows['frequencyMin'][measured] = 1 / numpy.maximum.reduceat(padded, indexes)[::2]
+        windows['frequencyMax'][measured] = 1 / numpy.minimum.reduceat(padded, indexes)[::2]
+
+        # Deviations are taken from the mean period of all of the windows first, so the sum of squares does not lose the
+        # jitter (which can be a millionth of the period) to rounding.
+        deviations = padded - periods.mean()
+        sums = numpy.add.reduceat(deviations, indexes)[::2]
+        squares = numpy.add.reduceat(deviations * deviations, indexes)[::2]
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            variances = (squares - sums * sums / counts) / (counts - 1)
+        windows['periodStdDev'][measured] = numpy.where(counts > 1, numpy.sqrt(numpy.maximum(variances, 0.0)), numpy.nan)
+        return windows
+
+    def windows(self):
+        # The metrics of every window, as an array of WINDOW_DTYPE. The windows that start before the last entry but end
+        # after it are included, measured up to and including the last entry, which becomes their end. Like measure,
+        # this does not change the state, so process_data can be called again afterwards.
+        completed = list(self.completed)
+        if self.last_offset is not None and self.next_window * self.hop < self.last_offset:
+            count = int(numpy.ceil(self.last_offset / self.hop)) - self.next_window
+            starts = (self.next_window + numpy.arange(count)) * self.hop
+            ends = numpy.minimum(starts + self.window, self.last_offset)
+            completed.append(self.measure_windows(starts, ends, include_end=True))
+        if not completed:
+            return numpy.zeros(0, dtype=WINDOW_DTYPE)
+        return numpy.concatenate(completed)
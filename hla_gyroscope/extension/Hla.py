@@ -1,3 +1,6 @@
+from instrumentation import instrument
+from transaction_index import TransactionIndex
+
 gyro_register_map = {
     0x20: 'CTRL_REG1',
     0x21: 'CTRL_REG2',
@@ -26,6 +29,34 @@ gyro_register_map = {
     0x38: 'INT1_DURATION',
 }
 
+# Angular rate registers of each axis, low byte first.
+axis_registers = (('x', 0x28), ('y', 0x2A), ('z', 0x2C))
+
+# Full scale of +/-180 degrees per second over the signed 16 bit range.
+degrees_per_second_per_lsb = 180 / 32768.0
+
+# Settings. The angular rates are exported to the export file when one is given (see gyro_export.py, which is only
+# imported then).
+EXPORT_FILE_SETTING = 'Export File (.npy, optional)'
+EXPORT_RAW_SETTING = 'Export Raw Registers'
+EXPORT_RAW_CHOICES = ('No', 'Yes')
+# The transactions decoded are indexed and the index is saved to the index file when one is given (see
+# transaction_index.py).
+INDEX_FILE_SETTING = 'Index File (optional)'
+
+
+class AxisOffsets(dict):
+    # For every register address a read can start at, the axes it can include and the offset of their low byte in the
+    # data read, so decoding needs no per-transaction register map. The entry of an address is built the first time a
+    # read starts at it, instead of building all 256 when the HLA is loaded.
+    def __missing__(self, start):
+        offsets = self[start] = tuple(
+            (axis, low_register - start) for axis, low_register in axis_registers if low_register >= start)
+        return offsets
+
+
+axis_offsets = AxisOffsets()
+
 
 class Transaction:
     is_multibyte_read: bool
@@ -41,74 +72,106 @@ class Transaction:
         self.is_multibyte_read = False
 
 
+@instrument
 class Gyro():
     def __init__(self):
         self.current_transaction = None
         self.last_write_transaction = None
+        # Every transaction decoded when an index file is given, for looking transactions up by address, register and
+        # time (see transaction_index.py).
+        self.index = None
+        self.export = None
 
     def get_capabilities(self):
-        pass
+        return {
+            'settings': {
+                EXPORT_FILE_SETTING: {
+                    'type': 'string'
+                },
+                EXPORT_RAW_SETTING: {
+                    'type': 'choices',
+                    'choices': EXPORT_RAW_CHOICES
+                },
+                INDEX_FILE_SETTING: {
+                    'type': 'string'
+                }
+            }
+        }
 
     def set_settings(self, settings):
+        # set_settings starts a new run, which starts a new export file and a new index.
+        if self.index is not None:
+            self.index.close()
+        index_file = settings.get(INDEX_FILE_SETTING, '')
+        self.index = TransactionIndex(index_file) if index_file else None
+        if self.export is not None:
+            self.export.close()
+            self.export = None
+        export_file = settings.get(EXPORT_FILE_SETTING, '')
+        if export_file:
+            from gyro_export import GyroExport
+            raw_registers = settings.get(EXPORT_RAW_SETTING) == 'Yes'
+            self.export = GyroExport(export_file, degrees_per_second_per_lsb, raw_registers)
         return {
             'result_types': {
                 'transaction': {
-                    'format': '{{data.angular_rate}}'
-                    # 'format': '{{data.registers}}'
+                    # Axes the read did not include are not in the frame data, and are displayed empty.
+                    'format': 'X:{{data.x}} Y:{{data.y}} Z:{{data.z}}'
+                    # 'format': 'register {{data.register}}: {{data.register_data}}'
                 }
             }
         }
 
+    def transaction_frame(self, write_transaction, read_transaction):
+        # Builds the output frame for a read of the registers starting at the address set by the preceding write.
+        # Output frames carry numbers only, the display text is produced by the format string from set_settings.
+        register_address = write_transaction.data[0]
+        register_data = bytes(read_transaction.data)
+        data = {
+            'register': register_address,
+            'register_data': register_data,
+        }
+        raw_values = {}
+        for axis, offset in axis_offsets[register_address]:
+            if offset + 2 <= len(register_data):
+                value = int.from_bytes(register_data[offset:offset + 2], 'little', signed=True)
+                raw_values[axis] = value
+                data[axis] = round(value * degrees_per_second_per_lsb, 2)
+        if self.export is not None and raw_values:
+            self.export.append(write_transaction.start_time, read_transaction.end_time, register_address, raw_values)
+
+        return {
+            'type': 'transaction',
+            'start_time': write_transaction.start_time,
+            'end_time': read_transaction.end_time,
+            'data': data
+        }
+
+    def index_transaction(self, transaction, write_transaction):
+        # A read starts at the register address set by the preceding write, and a write sets the register address with its
+        # first byte.
+        if transaction.is_read:
+            has_register = write_transaction is not None and len(write_transaction.data) > 0
+            register = write_transaction.data[0] if has_register else None
+        else:
+            register = transaction.data[0] if len(transaction.data) > 0 else None
+        self.index.add(transaction.start_time, transaction.end_time, transaction.address, register)
+
     def decode(self, frame):
         type = frame['type']
         if type == 'start':
             self.current_transaction = Transaction(frame['start_time'])
         elif type == 'stop' and self.current_transaction:
             self.current_transaction.end_time = frame['end_time']
+            if self.index is not None:
+                self.index_transaction(self.current_transaction, self.last_write_transaction)
 
             if self.current_transaction.is_read:
-                if self.last_write_transaction is None:
+                if self.last_write_transaction is None or len(self.last_write_transaction.data) == 0:
                     self.current_transaction = None
                     return
 
-                registers = {}
-                register_address = self.last_write_transaction.data[0]
-                for byte in self.current_transaction.data:
-                    registers[gyro_register_map[register_address]] = byte
-                    register_address += 1
-
-                def get_axis(axis):
-                    low_register = 'OUT_' + axis + '_L'
-                    high_register = 'OUT_' + axis + '_H'
-                    if low_register in registers and high_register in registers:
-                        low = registers[low_register]
-                        high = registers[high_register]
-                        value = (high << 8) + low
-                        if value >= 32768:
-                            value = value - 65536
-                        return (float(value) / 32768.0) * 180
-                    return None
-
-                angular_rate_str = ''
-                for axis in ('X', 'Y', 'Z'):
-                    axis_value = get_axis(axis)
-                    if axis_value is not None:
-                        angular_rate_str += ' ' + axis + ':' + \
-                            '{0:.2f}'.format(axis_value)
-
-                register_str = ''
-                for name, value in registers.items():
-                    register_str += ' ' + name + ':' + str(value)
-
-                new_frame = {
-                    'type': 'transaction',
-                    'start_time': self.last_write_transaction.start_time,
-                    'end_time': self.current_transaction.end_time,
-                    'data': {
-                        'registers': register_str,
-                        'angular_rate': angular_rate_str,
-                    }
-                }
+                new_frame = self.transaction_frame(self.last_write_transaction, self.current_transaction)
 
                 self.current_transaction = None
 
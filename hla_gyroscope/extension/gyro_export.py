@@ -0,0 +1,109 @@
+# Export of the angular rates decoded by the Gyro HLA to a NumPy .npy file, for analysis without parsing output frames.
+#
+# Every read of the rate registers appends one record with the start and end time of the transaction and the X, Y and Z
+# rates in degrees per second (NaN for axes the read did not include), optionally followed by the first register read
+# and the raw signed register values. The records are written in place into a memory map of the file, which is grown in
+# blocks of BLOCK_RECORDS records, and the number of records in the header of the file is updated in place after every
+# append. Appending therefore takes the same time whatever the size of the file, and the file can be opened while it is
+# being written:
+#
+#     import gyro_export
+#     rates = gyro_export.read_export('gyro.npy')
+#     rates['x'].mean(), rates['start_time'][-1]
+#
+# read_export memory maps the file, so the records are not copied. The file is trimmed to its records when the export is
+# closed. Writing needs nothing but the standard library, and NumPy is only imported by read_export.
+import atexit
+import math
+import mmap
+import struct
+import weakref
+
+BLOCK_RECORDS = 1 << 16
+
+RECORD_FIELDS = "('start_time', '<f8'), ('end_time', '<f8'), ('x', '<f4'), ('y', '<f4'), ('z', '<f4')"
+RAW_FIELDS = ", ('register', '|u1'), ('raw', '<i2', (3,))"
+AXES = ('x', 'y', 'z')
+
+# The header of a version 1.0 .npy file: the magic string, the version, the length of the header text, and the header
+# text, a python dict literal padded with spaces to HEADER_SIZE bytes. The shape is written as a fixed width number, so it
+# can be updated in place.
+MAGIC = b'\x93NUMPY\x01\x00'
+HEADER_SIZE = 256
+SHAPE_WIDTH = 20
+
+open_exports = weakref.WeakSet()
+
+
+class GyroExport:
+    def __init__(self, path, degrees_per_second_per_lsb, raw_registers=False, block_records=BLOCK_RECORDS):
+        self.degrees_per_second_per_lsb = degrees_per_second_per_lsb
+        self.raw_registers = raw_registers
+        self.block_records = block_records
+        self.record = struct.Struct('<ddfff' + ('B3h' if raw_registers else ''))
+        self.count = 0
+        self.capacity = 0
+        self.map = None
+
+        text = "{{'descr': [{}], 'fortran_order': False, 'shape': (".format(
+            RECORD_FIELDS + (RAW_FIELDS if raw_registers else ''))
+        prefix = MAGIC + struct.pack('<H', HEADER_SIZE - len(MAGIC) - 2) + text.encode('latin1')
+        self.shape_offset = len(prefix)
+        header = prefix + b' ' * SHAPE_WIDTH + b', ), }'
+        header = header.ljust(HEADER_SIZE - 1) + b'\n'
+
+        self.file = open(path, 'w+b')
+        self.file.write(header)
+        self.grow()
+        self.write_count()
+        # Exports still open when python exits are closed, so their files are trimmed.
+        open_exports.add(self)
+
+    def grow(self):
+        # The memory map is recreated for every block, as a map can not be resized on every platform.
+        self.capacity += self.block_records
+        if self.map is not None:
+            self.map.close()
+        self.file.truncate(HEADER_SIZE + self.capacity * self.record.size)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+    def write_count(self):
+        self.map[self.shape_offset:self.shape_offset + SHAPE_WIDTH] = b'%*d' % (SHAPE_WIDTH, self.count)
+
+    def append(self, start_time, end_time, register, raw_values):
+        # start_time and end_time are the times of the frames, in seconds from the start of the recording. raw_values maps
+        # the axes read ('x', 'y' and 'z') to their signed raw register values.
+        if self.count == self.capacity:
+            self.grow()
+        scale = self.degrees_per_second_per_lsb
+        rates = [raw_values[axis] * scale if axis in raw_values else math.nan for axis in AXES]
+        offset = HEADER_SIZE + self.count * self.record.size
+        if self.raw_registers:
+            self.record.pack_into(self.map, offset, start_time, end_time, *rates, register,
+                                  *(raw_values.get(axis, 0) for axis in AXES))
+        else:
+            self.record.pack_into(self.map, offset, start_time, end_time, *rates)
+        self.count += 1
+        self.write_count()
+
+    def close(self):
+        # Trims the file to its records. Until then, the blocks allocated after them are part of the file, but not of the
+        # array it holds.
+        if self.file.closed:
+            return
+        self.map.close()
+        self.file.truncate(HEADER_SIZE + self.count * self.record.size)
+        self.file.close()
+        open_exports.discard(self)
+
+
+@atexit.register
+def close_open_exports():
+    for export in list(open_exports):
+        export.close()
+
+
+def read_export(path):
+    # The records of an export as a read only NumPy structured array, memory mapped from the file.
+    import numpy
+    return numpy.load(path, mmap_mode='r')
@@ -0,0 +1,210 @@
+# Index of the I2C transactions decoded by an HLA, for looking transactions up by address, register and time without
+# decoding the capture again.
+#
+# Transactions are numbered in the order they are added, which must be the order of their start times, as it is when
+# they are added while decoding. Times are the start_time and end_time of the frames, in seconds from the start of the
+# recording, and are stored as given. The times, address bytes and registers are held in typed arrays, and the numbers
+# of the transactions of each address and of each register in postings arrays, so the index takes about 27 bytes per
+# transaction. Adding a transaction only appends to the typed arrays, to keep decoding fast: the postings are
+# brought up to date by the first query or save after it. Queries find the transactions starting in a time range by
+# binary search on the start times, and the transactions of an address or register within it by binary search on the
+# postings, in O(log n + k) for k transactions found.
+#
+# The register of a write is the register address it sets (its first data byte, as interpreted by the HLA). The register
+# of a read is the register it starts reading at, which the HLA passes when it knows it, and which is otherwise the
+# register set by the last write to the same address.
+#
+# An index created with a path is saved to it by close. An HLA has no call at the end of a run, so it closes the index
+# of a run when the next run starts (in set_settings), and the indexes still open when python exits are closed then.
+#
+# This file is copied into every HLA directory that uses it, as each extension is loaded on its own. The copies must be
+# kept identical.
+import array
+import atexit
+import bisect
+import struct
+import sys
+import weakref
+
+NO_REGISTER = -1
+
+MAGIC = b'I2CIDX'
+VERSION = 1
+# Magic, version, byte order of the arrays (0 little, 1 big endian), transaction count, and the number of entries of the
+# address postings, register postings and register pointers. The arrays follow, then the postings, then the pointers.
+HEADER = struct.Struct('<6sBBQIII')
+POSTINGS_HEADER = struct.Struct('<hQ')
+POINTER = struct.Struct('<Bh')
+
+open_indexes = weakref.WeakSet()
+
+
+class TransactionIndex:
+    def __init__(self, path=None):
+        self.start_times = array.array('d')
+        self.end_times = array.array('d')
+        self.address_bytes = array.array('B')
+        self.registers = array.array('h')
+        # Postings of 7 bit addresses and of registers, for the transactions before postings_end.
+        self.address_postings = {}
+        self.register_postings = {}
+        self.postings_end = 0
+        # The register set by the last write to each address.
+        self.register_pointers = {}
+        # The file close saves the index to, if any.
+        self.path = path
+        if path is not None:
+            open_indexes.add(self)
+
+    def __len__(self):
+        return len(self.start_times)
+
+    def add(self, start_time, end_time, address_byte, register=None):
+        # Adds a transaction with the 8 bit address byte of its address frame (7 bit address and read bit), and returns
+        # its number.
+        if register is None:
+            register = self.register_pointers.get(address_byte >> 1, NO_REGISTER) if address_byte & 0x01 else NO_REGISTER
+        elif not address_byte & 0x01:
+            self.register_pointers[address_byte >> 1] = register
+        self.start_times.append(start_time)
+        self.end_times.append(end_time)
+        self.address_bytes.append(address_byte)
+        self.registers.append(register)
+        return len(self.registers) - 1
+
+    def update_postings(self):
+        for number in range(self.postings_end, len(self.registers)):
+            address = self.address_bytes[number] >> 1
+            postings = self.address_postings.get(address)
+            if postings is None:
+                postings = self.address_postings[address] = array.array('I')
+            postings.append(number)
+            register = self.registers[number]
+            if register != NO_REGISTER:
+                postings = self.register_postings.get(register)
+                if postings is None:
+                    postings = self.register_postings[register] = array.array('I')
+                postings.append(number)
+        self.postings_end = len(self.registers)
+
+    def transaction(self, number):
+        return {
+            'start_time': self.start_times[number],
+            'end_time': self.end_times[number],
+            'address': self.address_bytes[number] >> 1,
+            'read': bool(self.address_bytes[number] & 0x01),
+            'register': None if self.registers[number] == NO_REGISTER else self.registers[number],
+        }
+
+    def time_range(self, start_time=None, end_time=None):
+        # The numbers first to last - 1 of the transactions starting at or after start_time and before end_time.
+        first = 0 if start_time is None else bisect.bisect_left(self.start_times, start_time)
+        last = len(self.start_times) if end_time is None else bisect.bisect_left(self.start_times, end_time)
+        return first, max(first, last)
+
+    def query(self, address=None, register=None, start_time=None, end_time=None, read=None):
+        # The numbers of the transactions matching every criterion given, in time order. address is a 7 bit address, and
+        # read is True for reads only, and False for writes only.
+        self.update_postings()
+        first, last = self.time_range(start_time, end_time)
+        candidates = []
+        if address is not None:
+            candidates.append(within(self.address_postings.get(address), first, last))
+        if register is not None:
+            candidates.append(within(self.register_postings.get(register), first, last))
+
+        if not candidates:
+            numbers = range(first, last)
+        else:
+            # The shortest postings are filtered with the other criteria.
+            numbers = min(candidates, key=len)
+            if address is not None and register is not None:
+                address_bytes = self.address_bytes
+                registers = self.registers
+                numbers = [number for number in numbers
+                           if address_bytes[number] >> 1 == address and registers[number] == register]
+        if read is not None:
+            address_bytes = self.address_bytes
+            numbers = [number for number in numbers if (address_bytes[number] & 0x01) == read]
+        return list(numbers)
+
+    def to_bytes(self):
+        self.update_postings()
+        byte_order = 0 if sys.byteorder == 'little' else 1
+        parts = [HEADER.pack(MAGIC, VERSION, byte_order, len(self), len(self.address_postings),
+                             len(self.register_postings), len(self.register_pointers))]
+        parts.extend(column.tobytes() for column in self.columns())
+        for postings in (self.address_postings, self.register_postings):
+            for key, numbers in postings.items():
+                parts.append(POSTINGS_HEADER.pack(key, len(numbers)))
+                parts.append(numbers.tobytes())
+        parts.extend(POINTER.pack(address, register) for address, register in self.register_pointers.items())
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = memoryview(data)
+        magic, version, byte_order, count, address_count, register_count, pointer_count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a version {} transaction index'.format(VERSION))
+        swap = byte_order != (0 if sys.byteorder == 'little' else 1)
+        offset = HEADER.size
+
+        def read_array(typecode, length):
+            nonlocal offset
+            values = array.array(typecode)
+            size = length * values.itemsize
+            values.frombytes(data[offset:offset + size])
+            if swap:
+                values.byteswap()
+            offset += size
+            return values
+
+        index = cls()
+        index.start_times, index.end_times, index.address_bytes, index.registers = (
+            read_array(column.typecode, count) for column in index.columns())
+        index.postings_end = count
+        for postings, postings_count in ((index.address_postings, address_count),
+                                         (index.register_postings, register_count)):
+            for _ in range(postings_count):
+                key, length = POSTINGS_HEADER.unpack_from(data, offset)
+                offset += POSTINGS_HEADER.size
+                postings[key] = read_array('I', length)
+        for _ in range(pointer_count):
+            address, register = POINTER.unpack_from(data, offset)
+            offset += POINTER.size
+            index.register_pointers[address] = register
+        return index
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            file.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            return cls.from_bytes(file.read())
+
+    def close(self):
+        # Saves the index to its file, once.
+        if self.path is None:
+            return
+        self.save(self.path)
+        self.path = None
+        open_indexes.discard(self)
+
+    def columns(self):
+        return self.start_times, self.end_times, self.address_bytes, self.registers
+
+
+@atexit.register
+def close_open_indexes():
+    for index in list(open_indexes):
+        index.close()
+
+
+def within(postings, first, last):
+    # The part of a postings array with the transaction numbers first to last - 1.
+    if postings is None:
+        return []
+    return postings[bisect.bisect_left(postings, first):bisect.bisect_left(postings, last)]
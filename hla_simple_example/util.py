@@ -1,16 +1,38 @@
+from instrumentation import instrument
+from transaction_index import TransactionIndex
+
+# the transactions decoded by Fancy I2C are indexed, and the index is saved to the index file when one is given (see transaction_index.py).
+INDEX_FILE_SETTING = 'Index File (optional)'
+
 # This HLA only supports the I2C analyzer results, and will produce a single frame for every transaction. (from start condition to stop condition).
 # It demonstrates a custom format string, and how to parse frames produced by the I2C analyzer.
+@instrument
 class I2cHla():
 
     temp_frame = None
+    # address byte and first data byte of the transaction being built, for the transaction index.
+    temp_address = None
+    temp_register = None
 
     def __init__(self):
-      pass
+      # every transaction decoded when an index file is given, for looking transactions up by address, register and time.
+      self.index = None
 
     def get_capabilities(self):
-      pass
+      return {
+          'settings': {
+              INDEX_FILE_SETTING: {
+                  'type': 'string'
+              }
+          }
+      }
 
     def set_settings(self, settings):
+      # set_settings starts a new run: the index of the previous run is saved, and a new one is started.
+      if self.index is not None:
+        self.index.close()
+      index_file = settings.get(INDEX_FILE_SETTING, '')
+      self.index = TransactionIndex(index_file) if index_file else None
       return {
           'result_types': {
               'error': {
@@ -45,13 +67,18 @@ class I2cHla():
             "count": 0
           }
         }
+        self.temp_address = None
+        self.temp_register = None
 
       if data["type"] == "address":
         address_byte = data["data"]["address"][0]
         self.temp_frame["data"]["address"] = hex(address_byte)
+        self.temp_address = address_byte
 
       if data["type"] == "data":
         data_byte = data["data"]["data"][0]
+        if self.temp_frame["data"]["count"] == 0:
+          self.temp_register = data_byte
         self.temp_frame["data"]["count"] += 1
         if len(self.temp_frame["data"]["data"]) > 0:
           self.temp_frame["data"]["data"] += ", "
@@ -62,8 +89,18 @@ class I2cHla():
         # "end_time": data["end_time"],
         new_frame = self.temp_frame
         self.temp_frame = None
+        if self.index is not None:
+          self.index_transaction(new_frame, self.temp_address, self.temp_register)
+        self.temp_address = None
         return new_frame
 
+    def index_transaction(self, frame, address_byte, first_byte):
+      # the first byte of a write is the register address. reads start at the register set by the last write to the same address.
+      if address_byte is None:
+        return
+      register = None if address_byte & 0x01 else first_byte
+      self.index.add(frame["start_time"], frame["end_time"], address_byte, register)
+
 # This HLA takes a stream of bytes (preferably ascii characters) and combines individual frames into larger frames in an attempt to make text strings easier to read.
 # For example, this should make reading serial log messages much easier in the software.
 # It supports delimiting on special characters, and after a certain delay is detected between characters.
@@ -73,6 +110,7 @@ class I2cHla():
 MESSAGE_PREFIX_SETTING = 'Message Prefix (optional)'
 PACKET_TIMEOUT_SETTING = 'Packet Timeout [s]'
 PACKET_DELIMITER_SETTING = 'Packet Delimiter'
+MAX_MESSAGE_LENGTH_SETTING = 'Maximum Message Length [chars]'
 
 DELIMITER_CHOICES = {
   'New Line [\\n]': '\n',
@@ -81,14 +119,22 @@ DELIMITER_CHOICES = {
   'Semicolon [;]': ';',
   'Tab [\\t]': '\t'
 }
+@instrument
 class TextMessages():
 
-    temp_frame = None
+    # the message being accumulated is held as a list of string pieces, which is only joined into a single string when the message frame is produced.
+    # appending to a string in place, one character at a time, would copy the whole message for every character.
+    message = None
+    message_length = 0
+    message_start_time = None
+    message_end_time = None
 
     # user selected settings used while decoding
     prefix = ''
     delimiter = '\n'
     packet_timeout = 0.5E-3
+    # messages are flushed once they reach this length, so memory and latency stay bounded when the delimiter never arrives.
+    max_message_length = 4096
 
     def __init__(self):
         pass
@@ -117,6 +163,11 @@ class TextMessages():
               PACKET_DELIMITER_SETTING: {
                   'type': 'choices',
                   'choices': DELIMITER_CHOICES.keys()
+              },
+              MAX_MESSAGE_LENGTH_SETTING: {
+                  'type': 'number',
+                  'minimum': 1,
+                  'maximum': 1E6
               }
           }
       }
@@ -137,6 +188,11 @@ class TextMessages():
           delimiter_selection = settings[PACKET_DELIMITER_SETTING]
           if delimiter_selection in DELIMITER_CHOICES.keys():
             self.delimiter = DELIMITER_CHOICES[delimiter_selection]
+        if MAX_MESSAGE_LENGTH_SETTING in settings.keys():
+          self.max_message_length = max(1, int(settings[MAX_MESSAGE_LENGTH_SETTING]))
+
+        # start over without a partial message from the previous run.
+        self.message = None
 
         # here, we need to return a format string for every distinct value of "type" in the frames returned by the "decode" class method.
         # for example, in this HLA, we have two types of frames, "error" and "message". "error" isn't actually used at the moment though.
@@ -158,27 +214,37 @@ class TextMessages():
         }
 
     def clear_stored_message(self, data):
-      self.temp_frame = {
-          "type": "message",
-          "start_time": data["start_time"],
-          "end_time": data["end_time"],
-          "data": {
-            "str": "",
-          }
-        }
+      self.message = []
+      self.message_length = 0
+      self.message_start_time = data["start_time"]
+      self.message_end_time = data["end_time"]
 
     def append_char(self, char):
-      self.temp_frame["data"]["str"] += char
+      self.message.append(char)
+      self.message_length += len(char)
 
     def have_existing_message(self):
-      if self.temp_frame is None:
+      if self.message is None:
         return False
-      if len(self.temp_frame["data"]["str"]) == 0:
+      if self.message_length == 0:
         return False
       return True
 
     def update_end_time(self, data):
-      self.temp_frame["end_time"] = data["end_time"]
+      self.message_end_time = data["end_time"]
+
+    def take_message(self):
+      # builds the frame for the stored message, and leaves no message stored.
+      frame = {
+          "type": "message",
+          "start_time": self.message_start_time,
+          "end_time": self.message_end_time,
+          "data": {
+            "str": "".join(self.message),
+          }
+        }
+      self.message = None
+      return frame
 
     def decode(self, data):
       # This class method is called once for each frame produced by the input analyzer.
@@ -205,13 +271,16 @@ class TextMessages():
 
       # setup initial result, if not present
       first_frame = False
-      if self.temp_frame is None:
+      if self.message is None:
         first_frame = True
         self.clear_stored_message(data)
 
       # handle serial data
       if data["type"] == "data" and "value" in data["data"].keys():
         value = data["data"]["value"]
+        # the serial analyzer passes the value as a single byte.
+        if type(value) is bytes:
+          value = value[0]
         char = chr(value)
 
       # handle I2C address
@@ -219,7 +288,7 @@ class TextMessages():
         value = data["data"]["address"][0]
         # if we have an existing message, send it
         if self.have_existing_message() == True:
-          ret = self.temp_frame
+          ret = self.take_message()
           self.clear_stored_message(data)
           self.append_char("address: " + hex(value) + ";")
           return ret
@@ -239,10 +308,8 @@ class TextMessages():
       # handle I2C stop condition
       if data["type"] == "stop":
         if self.have_existing_message() == True:
-          ret = self.temp_frame
-          self.temp_frame = None
-          return ret
-        self.temp_frame = None
+          return self.take_message()
+        self.message = None
         return
 
       # handle SPI byte
@@ -254,9 +321,9 @@ class TextMessages():
           char += chr(data["data"]["mosi"])
       
       # If we have a timeout event, commit the frame and make sure not to add the new frame after the delay, and add the current character to the next frame.
-      if first_frame == False and self.temp_frame is not None:
-        if self.temp_frame["end_time"] + maximum_delay < frame_start:
-          ret = self.temp_frame
+      if first_frame == False and self.message is not None:
+        if self.message_end_time + maximum_delay < frame_start:
+          ret = self.take_message()
           self.clear_stored_message(data)
           self.append_char(char)
           return ret
@@ -266,8 +333,99 @@ class TextMessages():
 
       # if the current character is a delimiter, commit it.
       if char in delimiters:
-        ret = self.temp_frame
-        # leave the temp_frame blank, so the next frame is the beginning of the next message.
-        self.temp_frame = None
-        return ret
+        # leave no message stored, so the next frame is the beginning of the next message.
+        return self.take_message()
+
+      # if the message has grown to the maximum length without a delimiter, commit it anyway.
+      if self.message_length >= self.max_message_length:
+        return self.take_message()
+
+    def decode_batch(self, frames):
+      # optional batch version of decode: takes a list of input frames and returns a list of all of the frames produced.
+      # the results are the same as calling decode for each frame in turn, but the message being accumulated is kept in local variables for the whole batch.
+      output = []
+      delimiter = self.delimiter
+      maximum_delay = self.packet_timeout
+      max_message_length = self.max_message_length
+      message = self.message
+      message_length = self.message_length
+      start_time = self.message_start_time
+      end_time = self.message_end_time
+
+      for data in frames:
+        frame_type = data["type"]
+        frame_data = data["data"]
+
+        first_frame = message is None
+        if first_frame:
+          message = []
+          message_length = 0
+          start_time = data["start_time"]
+          end_time = data["end_time"]
+
+        char = "unknown error."
+
+        if frame_type == "data":
+          # serial data
+          if "value" in frame_data:
+            value = frame_data["value"]
+            if type(value) is bytes:
+              value = value[0]
+            char = chr(value)
+          # I2C data byte
+          if "data" in frame_data and type(frame_data["data"]) is bytes:
+            char = chr(frame_data["data"][0])
+
+        elif frame_type == "address":
+          # I2C address, sends the existing message if there is one, and starts a new one with the address.
+          char = "address: " + hex(frame_data["address"][0]) + ";"
+          if message_length > 0:
+            output.append({"type": "message", "start_time": start_time, "end_time": end_time, "data": {"str": "".join(message)}})
+            message = []
+            message_length = 0
+            start_time = data["start_time"]
+            end_time = data["end_time"]
+          message.append(char)
+          message_length += len(char)
+          continue
+
+        elif frame_type == "start":
+          continue
+
+        elif frame_type == "stop":
+          if message_length > 0:
+            output.append({"type": "message", "start_time": start_time, "end_time": end_time, "data": {"str": "".join(message)}})
+          message = None
+          continue
+
+        elif frame_type == "result":
+          # SPI byte
+          char = ""
+          if "miso" in frame_data and frame_data["miso"] != 0:
+            char += chr(frame_data["miso"])
+          if "mosi" in frame_data and frame_data["mosi"] != 0:
+            char += chr(frame_data["mosi"])
+
+        # timeout, sends the existing message and starts a new one with the current character.
+        if not first_frame and end_time + maximum_delay < data["start_time"]:
+          output.append({"type": "message", "start_time": start_time, "end_time": end_time, "data": {"str": "".join(message)}})
+          message = [char]
+          message_length = len(char)
+          start_time = data["start_time"]
+          end_time = data["end_time"]
+          continue
+
+        message.append(char)
+        message_length += len(char)
+        end_time = data["end_time"]
+
+        if char == delimiter or message_length >= max_message_length:
+          output.append({"type": "message", "start_time": start_time, "end_time": end_time, "data": {"str": "".join(message)}})
+          message = None
+
+      self.message = message
+      self.message_length = message_length
+      self.message_start_time = start_time
+      self.message_end_time = end_time
+      return output
         
\ No newline at end of file
@@ -0,0 +1,44 @@
+# Imports deferred to the first use of the imported module.
+#
+# The Logic software loads the python files of an extension again every time a tab or capture is opened, and NumPy alone
+# takes around 100 ms to import, most of the time needed to load a measurer. Measurers therefore bind NumPy with
+#
+#     numpy = lazy_import('numpy', globals())
+#
+# which binds a stand-in that imports the module when one of its attributes is first used, and then replaces itself with
+# the module in the globals it was given. After the first use the name is the module itself, so the stand-in costs
+# nothing while measuring. Only whole modules can be deferred this way: a from ... import of a name in the module
+# imports it at once, so names such as numpy.lib.stride_tricks.sliding_window_view are used through the module instead.
+#
+# This file is copied into every extension directory that uses it, as each extension is loaded on its own. The copies
+# must be kept identical.
+import sys
+
+
+class LazyModule:
+    def __init__(self, name, namespace):
+        self._lazy_name = name
+        self._lazy_namespace = namespace
+
+    def __getattr__(self, attribute):
+        module = load(self._lazy_name)
+        if self._lazy_namespace.get(self._lazy_name) is self:
+            self._lazy_namespace[self._lazy_name] = module
+        return getattr(module, attribute)
+
+    def __repr__(self):
+        return '<module {!r}, not imported yet>'.format(self._lazy_name)
+
+
+def load(name):
+    __import__(name)
+    return sys.modules[name]
+
+
+def lazy_import(name, namespace):
+    # The module called name if it has already been imported, otherwise a stand-in for it, to be bound to name in
+    # namespace (the globals of the importing module).
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name, namespace)
@@ -0,0 +1,181 @@
+import math
+
+from saleae.range_measurements import AnalogMeasurer
+
+from instrumentation import instrument
+from lazy_import import lazy_import
+
+# Imported by the first measurement, see lazy_import.py.
+numpy = lazy_import('numpy', globals())
+
+DOMINANT_FREQUENCY = 'dominantFrequency'
+THD = 'thd'
+SNR = 'snr'
+SINAD = 'sinad'
+
+# The power spectrum is averaged over segments of SEGMENT_SIZE samples, each starting SEGMENT_HOP samples after the
+# previous one (Welch's method with 50% overlap). The frequency resolution is the sample rate / SEGMENT_SIZE.
+SEGMENT_SIZE = 1 << 16
+SEGMENT_HOP = SEGMENT_SIZE // 2
+# Segments are transformed this many at a time, which bounds the memory used whatever the size of a chunk.
+SEGMENTS_PER_BATCH = 8
+
+# Harmonics 2 to HARMONIC_COUNT of the fundamental are counted as distortion, up to the Nyquist frequency.
+HARMONIC_COUNT = 10
+
+# A 4 term Blackman-Harris window. Its side lobes are 92 dB down, so the power of a tone stays within LOBE_HALF_WIDTH bins
+# on either side of its frequency instead of leaking into the noise.
+WINDOW_COEFFICIENTS = (0.35875, -0.48829, 0.14128, -0.01168)
+LOBE_HALF_WIDTH = 4
+
+# The window of a full segment, shared by every measurer. It is built by segment_window on first use, so loading the
+# extension and constructing measurers stay fast.
+full_segment_window = None
+
+
+def window_function(size):
+    phase = 2 * numpy.pi * numpy.arange(size) / size
+    return sum(coefficient * numpy.cos(index * phase) for index, coefficient in enumerate(WINDOW_COEFFICIENTS))
+
+
+def segment_window():
+    global full_segment_window
+    if full_segment_window is None:
+        full_segment_window = window_function(SEGMENT_SIZE)
+    return full_segment_window
+
+
+def lobe(center, half_width, size):
+    # The bins of the main lobe of a tone at bin center, as a mask over the size bins of a spectrum.
+    bins = numpy.zeros(size, dtype=bool)
+    bins[max(center - half_width, 0):center + half_width + 1] = True
+    return bins
+
+
+@instrument
+class SpectralStatisticsMeasurer(AnalogMeasurer):
+    # Dominant frequency, total harmonic distortion, signal to noise ratio and SINAD of the range, from its Welch averaged
+    # power spectrum.
+    #
+    # The spectrum is accumulated as the chunks arrive: every complete segment is transformed and its power added to a
+    # single running sum, and the samples of the segments that continue into the next chunk are kept for it. The memory
+    # used is therefore a few segments, whatever the size of the range. Ranges shorter than one segment are measured
+    # from a single zero padded segment, with a coarser resolution.
+    #
+    # The dominant frequency is only reported in Hz when the chunks have a sample_rate. THD, SNR and SINAD are ratios in
+    # dB and do not need one.
+    supported_measurements = [DOMINANT_FREQUENCY, THD, SNR, SINAD]
+
+    def __init__(self, requested_measurements):
+        super().__init__(requested_measurements)
+        # The window and the arrays are created by the first call to process_data.
+        self.window = None
+        self.power = None
+        self.segment_count = 0
+        # The samples from the start of the next segment on, fewer than SEGMENT_SIZE.
+        self.tail = None
+        self.sample_rate = None
+
+    def process_data(self, data):
+        if self.power is None:
+            self.window = segment_window()
+            self.power = numpy.zeros(SEGMENT_SIZE // 2 + 1)
+            self.tail = numpy.empty(0)
+        if self.sample_rate is None:
+            self.sample_rate = getattr(data, 'sample_rate', None)
+        samples = numpy.asarray(data.samples)
+
+        if self.tail.size == 0 or samples.size < SEGMENT_SIZE:
+            self.tail = self.add_segments(numpy.concatenate((self.tail, samples)) if self.tail.size else samples)
+            return
+
+        # The segments that start in the tail end within the first SEGMENT_SIZE samples of the chunk, so only those are
+        # copied next to the tail. The rest of the chunk is transformed in place.
+        head = numpy.concatenate((self.tail, samples[:SEGMENT_SIZE]))
+        segment_count = (head.size - SEGMENT_SIZE) // SEGMENT_HOP + 1
+        self.add_segments(head)
+        self.tail = self.add_segments(samples[segment_count * SEGMENT_HOP - self.tail.size:])
+
+    def add_segments(self, samples):
+        # Adds the power spectrum of every complete segment of samples, starting with the first sample, and returns a copy
+        # of the samples left for the following segments.
+        segment_count = (samples.size - SEGMENT_SIZE) // SEGMENT_HOP + 1 if samples.size >= SEGMENT_SIZE else 0
+        for first in range(0, segment_count, SEGMENTS_PER_BATCH):
+            count = min(SEGMENTS_PER_BATCH, segment_count - first)
+            start = first * SEGMENT_HOP
+            end = start + (count - 1) * SEGMENT_HOP + SEGMENT_SIZE
+            segments = numpy.lib.stride_tricks.sliding_window_view(samples[start:end], SEGMENT_SIZE)[::SEGMENT_HOP]
+            self.power += self.segment_power(segments, self.window)
+        self.segment_count += segment_count
+        return samples[segment_count * SEGMENT_HOP:].copy()
+
+    @staticmethod
+    def segment_power(segments, window):
+        # Summed power spectra of the rows of segments, with the mean of each removed, zero padded to SEGMENT_SIZE.
+        segments = segments - segments.mean(axis=1, keepdims=True, dtype=numpy.float64)
+        spectra = numpy.fft.rfft(segments * window, n=SEGMENT_SIZE, axis=1)
+        return numpy.square(spectra.real).sum(axis=0) + numpy.square(spectra.imag).sum(axis=0)
+
+    def spectrum(self):
+        # The power spectrum of the data so far, in arbitrary units, and the half width in bins of the main lobe of a tone,
+        # without changing the state. Zero padding a short range to SEGMENT_SIZE widens the lobe by the same factor.
+        if self.segment_count > 0:
+            return self.power / self.segment_count, LOBE_HALF_WIDTH
+        if self.tail is not None and self.tail.size > 2 * LOBE_HALF_WIDTH:
+            lobe_half_width = int(math.ceil(LOBE_HALF_WIDTH * SEGMENT_SIZE / self.tail.size))
+            return self.segment_power(self.tail[numpy.newaxis, :], window_function(self.tail.size)), lobe_half_width
+        return None, None
+
+    def snapshot(self):
+        # Like the other measurers, the state is only read, so more data can be passed to process_data afterwards.
+        return self.measure()
+
+    def measure(self):
+        values = {}
+        power, lobe_half_width = self.spectrum()
+        if power is None:
+            return values
+
+        # Bins near DC hold what is left of the offset after the segment means were removed, and are not part of the
+        # signal, its harmonics or its noise.
+        claimed = numpy.zeros(power.size, dtype=bool)
+        claimed[:lobe_half_width + 1] = True
+        if claimed.all() or not power[~claimed].any():
+            return values
+
+        fundamental_bin = int(numpy.argmax(numpy.where(claimed, -1.0, power)))
+        fundamental_bins = lobe(fundamental_bin, lobe_half_width, power.size) & ~claimed
+        fundamental_power = power[fundamental_bins].sum()
+        # The frequency between bins is estimated from the power weighted mean of the bins of the main lobe.
+        fundamental = (numpy.flatnonzero(fundamental_bins) * power[fundamental_bins]).sum() / fundamental_power
+        claimed |= fundamental_bins
+
+        harmonic_power = 0.0
+        harmonics_measured = False
+        for harmonic in range(2, HARMONIC_COUNT + 1):
+            harmonic_bin = int(round(harmonic * fundamental))
+            if harmonic_bin + lobe_half_width >= power.size:
+                break
+            harmonic_bins = lobe(harmonic_bin, lobe_half_width, power.size) & ~claimed
+            harmonic_power += power[harmonic_bins].sum()
+            claimed |= harmonic_bins
+            harmonics_measured = True
+        noise_power = power[~claimed].sum()
+
+        if DOMINANT_FREQUENCY in self.requested_measurements:
+            if self.sample_rate:
+                values[DOMINANT_FREQUENCY] = float(fundamental * self.sample_rate / SEGMENT_SIZE)
+
+        if THD in self.requested_measurements:
+            if harmonics_measured and harmonic_power > 0:
+                values[THD] = 10 * math.log10(harmonic_power / fundamental_power)
+
+        if SNR in self.requested_measurements:
+            if noise_power > 0:
+                values[SNR] = 10 * math.log10(fundamental_power / noise_power)
+
+        if SINAD in self.requested_measurements:
+            if noise_power + harmonic_power > 0:
+                values[SINAD] = 10 * math.log10(fundamental_power / (noise_power + harmonic_power))
+
+        return values
@@ -0,0 +1,99 @@
+"""Compare the memory and decode speed of dict frames with the compact frames from compact_frames.py.
+
+Memory is measured with tracemalloc for the same synthetic stream held as a list of dict frames, a list of `Frame`
+objects, and a `FrameBatch`. Every HLA in this repository is then run on dict input frames, keeping its dict output
+frames, and on frames rebuilt from a FrameBatch, keeping its output frames as `Frame` objects (see
+`compact_frames.compact_decoder`), reporting the decode rate and the memory held by the output frames of each.
+
+    python tools/bench_frames.py --count 200000
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+TOOLS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TOOLS_DIRECTORY)
+sys.path.insert(0, TOOLS_DIRECTORY)
+
+from bench_hla_batch import CASES, new_hla  # noqa: E402
+import compact_frames  # noqa: E402
+from replay_hla import load_entry_points  # noqa: E402
+import synthetic_frames  # noqa: E402
+
+
+def traced_size(build):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        value = build()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return size, value
+
+
+def memory_report(count):
+    for stream in ('serial', 'i2c', 'spi'):
+        frames = list(synthetic_frames.GENERATORS[stream](count))
+        # Each form is built from fresh copies of the frames, so the measured size is the size of that form alone.
+        dict_size, _ = traced_size(lambda: [dict(frame, data=dict(frame['data'])) for frame in frames])
+        slots_size, _ = traced_size(lambda: [compact_frames.Frame(**dict(frame, data=dict(frame['data']))) for frame in frames])
+        batch_size, _ = traced_size(lambda: compact_frames.FrameBatch.from_frames(frames))
+        print('{:<7} {:>10,} frames   dict {:>7.1f} B/frame   Frame {:>7.1f} B/frame   FrameBatch {:>6.1f} B/frame'.format(
+            stream, count, dict_size / count, slots_size / count, batch_size / count))
+
+
+def decode_all(hla, frames, compact=False):
+    decode = compact_frames.compact_decoder(hla.decode) if compact else hla.decode
+    output = []
+    for frame in frames:
+        result = decode(frame)
+        if result is not None:
+            output.append(result)
+    return output
+
+
+def timed(function, *args):
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        output = function(*args)
+        return time.perf_counter() - start, output
+    finally:
+        gc.enable()
+
+
+def decode_report(count):
+    for extension, name, stream in CASES:
+        [(_, hla_type)] = load_entry_points(os.path.join(REPOSITORY_DIRECTORY, extension), [name])
+        frames = list(synthetic_frames.GENERATORS[stream](count))
+        batch = compact_frames.FrameBatch.from_frames(frames)
+
+        dict_seconds, dict_output = timed(decode_all, new_hla(hla_type), frames)
+        # Rebuilding the frames from the columns is part of the cost of keeping them compact.
+        compact_seconds, compact_output = timed(lambda: decode_all(new_hla(hla_type), batch.to_frames(), compact=True))
+        if compact_output != dict_output:
+            raise SystemExit('{} on {}: compact frames decode differently'.format(name, stream))
+        del dict_output, compact_output
+
+        dict_size, _ = traced_size(lambda: decode_all(new_hla(hla_type), frames))
+        input_frames = batch.to_frames()
+        compact_size, _ = traced_size(lambda: decode_all(new_hla(hla_type), input_frames, compact=True))
+        print('{:<14} {:<7} dict {:>11,.0f} frames/s {:>7.1f} MB out   compact {:>11,.0f} frames/s {:>7.1f} MB out'.format(
+            name, stream, count / dict_seconds, dict_size / 1e6, count / compact_seconds, compact_size / 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=200000, help='frames per stream')
+    args = parser.parse_args()
+    memory_report(args.count)
+    decode_report(args.count)
+
+
+if __name__ == '__main__':
+    main()
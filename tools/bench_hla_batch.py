@@ -0,0 +1,97 @@
+"""Compare per-frame `decode` calls with `decode_batch` for the HLAs in this repository.
+
+Each HLA replays the same synthetic stream twice, once through `decode` and once through `decode_batch` in batches of
+--batch-size frames. The stream is generated up front so neither side pays for it, and as in timeit, garbage collection
+is paused while timing. The outputs are checked to be identical, and the best of --repeat runs of each side is reported.
+
+    python tools/bench_hla_batch.py --count 500000 --batch-size 4096
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+
+TOOLS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TOOLS_DIRECTORY)
+sys.path.insert(0, TOOLS_DIRECTORY)
+
+from hla_batch import batch_decoder  # noqa: E402
+from replay_hla import load_entry_points  # noqa: E402
+import synthetic_frames  # noqa: E402
+
+# (extension.json, HLA name, synthetic stream)
+CASES = [
+    ('hla_simple_example/extension.json', 'Fancy I2C', 'i2c'),
+    ('hla_simple_example/extension.json', 'Text Messages', 'serial'),
+    ('hla_simple_example/extension.json', 'Text Messages', 'spi'),
+    ('hla_gyroscope/extension/extension.json', 'Gyro L3G4200D', 'i2c'),
+]
+
+
+def new_hla(hla_type):
+    hla = hla_type()
+    hla.get_capabilities()
+    hla.set_settings({})
+    return hla
+
+
+def timed(function, *args):
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        output = function(*args)
+        return time.perf_counter() - start, output
+    finally:
+        gc.enable()
+
+
+def per_frame(hla_type, frames):
+    hla = new_hla(hla_type)
+    decode = hla.decode
+    output = []
+    for frame in frames:
+        result = decode(frame)
+        if result is None:
+            continue
+        if isinstance(result, (list, tuple)):
+            output.extend(result)
+        else:
+            output.append(result)
+    return output
+
+
+def batched(hla_type, frames, batch_size):
+    decode_batch = batch_decoder(new_hla(hla_type))
+    output = []
+    for index in range(0, len(frames), batch_size):
+        output.extend(decode_batch(frames[index:index + batch_size]))
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=500000, help='input frames per case')
+    parser.add_argument('--batch-size', type=int, default=4096, help='frames per decode_batch call')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each side, the fastest is reported')
+    args = parser.parse_args()
+
+    for extension, name, stream in CASES:
+        [(_, hla_type)] = load_entry_points(os.path.join(REPOSITORY_DIRECTORY, extension), [name])
+        frames = list(synthetic_frames.GENERATORS[stream](args.count))
+        frame_seconds = batch_seconds = None
+        for _ in range(args.repeat):
+            elapsed, frame_output = timed(per_frame, hla_type, frames)
+            frame_seconds = elapsed if frame_seconds is None else min(frame_seconds, elapsed)
+            elapsed, batch_output = timed(batched, hla_type, frames, args.batch_size)
+            batch_seconds = elapsed if batch_seconds is None else min(batch_seconds, elapsed)
+            if frame_output != batch_output:
+                raise SystemExit('{} on {}: decode_batch output differs from decode'.format(name, stream))
+            del frame_output, batch_output
+        print('{:<14} {:<7} decode {:>12,.0f} frames/s   decode_batch {:>12,.0f} frames/s   speedup {:.2f}x'.format(
+            name, stream, len(frames) / frame_seconds, len(frames) / batch_seconds, frame_seconds / batch_seconds))
+
+
+if __name__ == '__main__':
+    main()
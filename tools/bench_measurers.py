@@ -0,0 +1,151 @@
+"""Throughput benchmark for the range measurers in this repository.
+
+Runs ClockStatsMeasurer over synthetic clocks, and VoltageStatisticsMeasurer, SpectralStatisticsMeasurer and
+AnalogClockStatsMeasurer over synthetic sine waves of several sizes, with the offline stand-in for
+`saleae.range_measurements`, and reports edges/s and samples/s. Every metric of a measurer is requested, except in the
+voltageStats/rms case, which requests the RMS alone, the only metric of the original VoltageStatisticsMeasurer. The
+voltageStats/rms-original case runs that measurer (see original_measurers.py) on the same samples.
+
+The clockStats/chunks-N cases measure the largest clock in chunks of N edges (--small-chunk-sizes), as the Logic
+software can pass chunks of any size, with the metrics of the original ClockStatsMeasurer, and the
+clockStats/chunks-N-original cases run that measurer on the same chunks.
+
+    python tools/bench_measurers.py
+    python tools/bench_measurers.py --save baseline.json
+    python tools/bench_measurers.py --compare baseline.json --tolerance 0.2
+
+With --compare, the exit status is 1 if any case is slower than the saved run by more than the tolerance.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+TOOLS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TOOLS_DIRECTORY)
+sys.path[:0] = [
+    TOOLS_DIRECTORY,
+    os.path.join(REPOSITORY_DIRECTORY, 'clockStats'),
+    os.path.join(REPOSITORY_DIRECTORY, 'voltageStats'),
+    os.path.join(REPOSITORY_DIRECTORY, 'spectralStats'),
+    os.path.join(REPOSITORY_DIRECTORY, 'analogClockStats'),
+]
+
+from saleae.range_measurements import run_measurement  # noqa: E402
+from original_measurers import OriginalClockStatsMeasurer, OriginalVoltageStatisticsMeasurer  # noqa: E402
+import synthetic  # noqa: E402
+
+from analog_clock_stats import AnalogClockStatsMeasurer  # noqa: E402
+from clock_stats import ClockStatsMeasurer  # noqa: E402
+from spectral_statistics import SpectralStatisticsMeasurer  # noqa: E402
+import summary_index  # noqa: E402
+from voltage_statistics import VoltageStatisticsMeasurer  # noqa: E402
+
+DEFAULT_EDGE_COUNTS = [10 ** 4, 10 ** 5, 10 ** 6]
+DEFAULT_SAMPLE_COUNTS = [10 ** 5, 10 ** 6, 10 ** 7]
+DEFAULT_SMALL_CHUNK_SIZES = [16, 256, 4096]
+
+
+def time_measurement(measurer_type, chunks, repeat, measurements=None):
+    # Times a measurement of every supported metric, or of the given metrics.
+    if measurements is None:
+        measurements = measurer_type.supported_measurements
+    best = None
+    for _ in range(repeat):
+        # Every run should pay for reading the samples, as the first measurement of a range does.
+        summary_index.cache.clear()
+        start = time.perf_counter()
+        run_measurement(measurer_type, measurements, chunks)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_cases(edge_counts, sample_counts, chunk_size, small_chunk_sizes, repeat):
+    results = []
+    for edge_count in edge_counts:
+        chunks = synthetic.clock(1e6, edge_count, jitter=1e-9, chunk_size=chunk_size)
+        elapsed = time_measurement(ClockStatsMeasurer, chunks, repeat)
+        results.append({'case': 'clockStats/clock', 'size': edge_count, 'unit': 'edges', 'seconds': elapsed})
+    for edge_count in edge_counts:
+        chunks = synthetic.pwm(1e5, edge_count // 2, chunk_size=chunk_size)
+        elapsed = time_measurement(ClockStatsMeasurer, chunks, repeat)
+        results.append({'case': 'clockStats/pwm', 'size': edge_count, 'unit': 'edges', 'seconds': elapsed})
+    for small_chunk_size in small_chunk_sizes:
+        edge_count = max(edge_counts)
+        chunks = synthetic.clock(1e6, edge_count, jitter=1e-9, chunk_size=small_chunk_size)
+        measurements = OriginalClockStatsMeasurer.supported_measurements
+        for suffix, measurer_type in (('', ClockStatsMeasurer), ('-original', OriginalClockStatsMeasurer)):
+            elapsed = time_measurement(measurer_type, chunks, repeat, measurements)
+            results.append({'case': 'clockStats/chunks-{}{}'.format(small_chunk_size, suffix), 'size': edge_count,
+                            'unit': 'edges', 'seconds': elapsed})
+    for sample_count in sample_counts:
+        chunks = synthetic.sine(1e6, 1e3, sample_count, noise=0.01, chunk_size=chunk_size * 16)
+        elapsed = time_measurement(VoltageStatisticsMeasurer, chunks, repeat)
+        results.append({'case': 'voltageStats/sine', 'size': sample_count, 'unit': 'samples', 'seconds': elapsed})
+    for sample_count in sample_counts:
+        # The RMS of a DC level with a little noise, where the sum of squares is the most prone to rounding.
+        chunks = synthetic.sine(1e6, 1e3, sample_count, amplitude=0.01, offset=12.0, noise=1e-5,
+                                chunk_size=chunk_size * 16)
+        for case, measurer_type in (('voltageStats/rms', VoltageStatisticsMeasurer),
+                                    ('voltageStats/rms-original', OriginalVoltageStatisticsMeasurer)):
+            elapsed = time_measurement(measurer_type, chunks, repeat, ['voltageRms'])
+            results.append({'case': case, 'size': sample_count, 'unit': 'samples', 'seconds': elapsed})
+    for sample_count in sample_counts:
+        chunks = synthetic.sine(1e6, 1e3, sample_count, noise=0.01, harmonics=[(3, 0.01)], chunk_size=chunk_size * 16)
+        elapsed = time_measurement(SpectralStatisticsMeasurer, chunks, repeat)
+        results.append({'case': 'spectralStats/sine', 'size': sample_count, 'unit': 'samples', 'seconds': elapsed})
+    for sample_count in sample_counts:
+        chunks = synthetic.sine(1e6, 1e4, sample_count, noise=0.01, chunk_size=chunk_size * 16)
+        elapsed = time_measurement(AnalogClockStatsMeasurer, chunks, repeat)
+        results.append({'case': 'analogClockStats/sine', 'size': sample_count, 'unit': 'samples', 'seconds': elapsed})
+    for result in results:
+        result['rate'] = result['size'] / result['seconds']
+    return results
+
+
+def compare(results, baseline, tolerance):
+    previous = {(result['case'], result['size']): result['rate'] for result in baseline}
+    regressions = []
+    for result in results:
+        key = (result['case'], result['size'])
+        if key in previous and result['rate'] < previous[key] * (1 - tolerance):
+            regressions.append('{} size {}: {:.3g} {}/s, was {:.3g}'.format(
+                result['case'], result['size'], result['rate'], result['unit'], previous[key]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--edges', type=int, nargs='+', default=DEFAULT_EDGE_COUNTS, help='edge counts for clockStats')
+    parser.add_argument('--samples', type=int, nargs='+', default=DEFAULT_SAMPLE_COUNTS, help='sample counts for the analog measurers')
+    parser.add_argument('--chunk-size', type=int, default=65536, help='digital entries per chunk (analog chunks are 16x larger)')
+    parser.add_argument('--small-chunk-sizes', type=int, nargs='*', default=DEFAULT_SMALL_CHUNK_SIZES,
+                        help='chunk sizes of the clockStats/chunks cases')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case, the fastest is reported')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='compare against results saved with --save')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown for --compare, as a fraction')
+    args = parser.parse_args()
+
+    results = run_cases(args.edges, args.samples, args.chunk_size, args.small_chunk_sizes, args.repeat)
+    for result in results:
+        print('{:<32} {:>12,} {:<8} {:>10.4f} s {:>14,.0f} {}/s'.format(
+            result['case'], result['size'], result['unit'], result['seconds'], result['rate'], result['unit']))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION: ' + regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Accuracy and speed of the quantile sketch used for the clockStats percentile metrics, against exact sorting.
+
+For several distributions, value counts and rank error bounds, values are added to a KllSketch in chunks, the way
+ClockStatsMeasurer adds the periods of each chunk, and the p1, p50, p99 and p99.9 estimates are compared with the exact
+percentiles of the sorted values. The error reported is the largest distance, as a fraction of the count, between the
+requested rank and the rank of the value reported. The memory reported is that of the values the sketch retains.
+
+Then ClockStatsMeasurer is run over a jittered synthetic clock with and without the percentile metrics requested.
+
+    python tools/bench_quantiles.py
+    python tools/bench_quantiles.py --counts 1000000 100000000 --rank-errors 0.001
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy
+
+TOOLS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TOOLS_DIRECTORY)
+sys.path[:0] = [TOOLS_DIRECTORY, os.path.join(REPOSITORY_DIRECTORY, 'clockStats')]
+
+from saleae.range_measurements import run_measurement  # noqa: E402
+import synthetic  # noqa: E402
+
+import clock_stats  # noqa: E402
+import quantile_sketch  # noqa: E402
+
+FRACTIONS = numpy.array([0.01, 0.5, 0.99, 0.999])
+
+
+def distributions(seed):
+    rng = numpy.random.default_rng(seed)
+    return {
+        # A 1 MHz clock with 1 ns of gaussian jitter.
+        'jitter': lambda count: rng.normal(1e-6, 1e-9, count),
+        'lognormal': lambda count: rng.lognormal(-14, 0.5, count),
+        # A clock that occasionally stretches, as with clock stretching or a spread spectrum clock.
+        'bimodal': lambda count: numpy.where(rng.random(count) < 0.02, 2.5e-6, 1e-6) + rng.normal(0, 1e-9, count),
+    }
+
+
+def rank_error(sorted_values, estimates):
+    low = numpy.searchsorted(sorted_values, estimates, side='left') / sorted_values.size
+    high = numpy.searchsorted(sorted_values, estimates, side='right') / sorted_values.size
+    return float(numpy.max(numpy.maximum(low - FRACTIONS, FRACTIONS - high).clip(min=0)))
+
+
+def sketch_report(counts, rank_errors, chunk_size, seed):
+    print('{:<10} {:>11} {:>8} | {:>9} {:>10} {:>10} | {:>9} {:>10}'.format(
+        'values', 'count', 'bound', 'error', 'memory', 'seconds', 'exact s', 'exact mem'))
+    for name, generate in distributions(seed).items():
+        for count in counts:
+            values = generate(count)
+            start = time.perf_counter()
+            sorted_values = numpy.sort(values)
+            numpy.quantile(sorted_values, FRACTIONS, method='inverted_cdf')
+            exact_seconds = time.perf_counter() - start
+
+            for bound in rank_errors:
+                start = time.perf_counter()
+                sketch = quantile_sketch.KllSketch(quantile_sketch.k_for_rank_error(bound))
+                for offset in range(0, count, chunk_size):
+                    sketch.merge(quantile_sketch.KllSketch.from_values(values[offset:offset + chunk_size], sketch.k))
+                estimates = sketch.quantiles(FRACTIONS)
+                seconds = time.perf_counter() - start
+                print('{:<10} {:>11,} {:>8.4f} | {:>9.6f} {:>8.1f}KB {:>10.3f} | {:>9.3f} {:>8.1f}MB'.format(
+                    name, count, bound, rank_error(sorted_values, estimates), sketch.nbytes / 1e3, seconds,
+                    exact_seconds, values.nbytes / 1e6))
+
+
+def measurer_report(edge_count, chunk_size):
+    chunks = synthetic.clock(1e6, edge_count, jitter=1e-9, chunk_size=chunk_size)
+    basic = [m for m in clock_stats.ClockStatsMeasurer.supported_measurements
+             if m not in clock_stats.PERCENTILE_MEASUREMENTS]
+    for label, requested in (('without percentiles', basic),
+                             ('with percentiles', clock_stats.ClockStatsMeasurer.supported_measurements)):
+        start = time.perf_counter()
+        values = run_measurement(clock_stats.ClockStatsMeasurer, requested, chunks)
+        seconds = time.perf_counter() - start
+        print('clockStats {:,} edges {:<20} {:.3f} s  {:>11,.0f} edges/s'.format(
+            edge_count, label, seconds, edge_count / seconds))
+    for measurement in clock_stats.PERCENTILE_MEASUREMENTS:
+        print('  {:<13} {:.6e} s'.format(measurement, values[measurement]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--counts', type=int, nargs='+', default=[10 ** 5, 10 ** 6, 10 ** 7])
+    parser.add_argument('--rank-errors', type=float, nargs='+', default=[0.01, 0.001, 0.0001])
+    parser.add_argument('--chunk-size', type=int, default=65536, help='values per sketch update')
+    parser.add_argument('--edges', type=int, default=10 ** 6, help='edges of the ClockStatsMeasurer run')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    sketch_report(args.counts, args.rank_errors, args.chunk_size, args.seed)
+    print()
+    measurer_report(args.edges, args.chunk_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Startup benchmark for the extensions in this repository.
+
+The Logic software loads the python files of an extension again every time a tab or capture is opened, and constructs
+its classes, so the time taken to import an entry point and construct its class is paid over and over. For every entry
+point of every extension.json given (by default, every one in the repository), this imports the entry point module in
+a new python process, with the offline stand-in for `saleae.range_measurements` already imported as it is in the
+Logic software, and constructs the class: measurers with every metric requested, HLAs followed by get_capabilities and
+set_settings with no settings. The median import and construction times of --repeat processes are reported, along
+with the number of modules the entry point loaded and whether NumPy was among them.
+
+    python tools/bench_startup.py
+    python tools/bench_startup.py --budget 10 --repeat 9
+
+The first process of each entry point is not counted, as it also writes the bytecode caches when Python is allowed to
+(it is not with PYTHONDONTWRITEBYTECODE set, where check_extensions.py --compile writes them instead). Without
+bytecode, compiling the source takes most of the time. The exit status is 1 if the import and construction of any
+entry point take longer than the budget, in milliseconds.
+"""
+import argparse
+import ast
+import os
+import statistics
+import subprocess
+import sys
+
+TOOLS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TOOLS_DIRECTORY)
+
+from check_extensions import HIGH_LEVEL_ANALYZER, entry_points, extension_files, read_extension  # noqa: E402
+
+DEFAULT_BUDGET_MILLISECONDS = 50.0
+DEFAULT_REPEAT = 5
+
+# Run in each new process, with the arguments tools directory, extension directory, module, class, type and the metrics
+# separated by commas. Nothing but sys and time is imported before the timing starts.
+STARTUP_SCRIPT = '''
+import sys
+import time
+
+tools_directory, directory, module_name, class_name, extension_type, metrics = sys.argv[1:7]
+sys.path[:0] = [directory, tools_directory]
+import saleae.range_measurements
+
+loaded = set(sys.modules)
+start = time.perf_counter()
+cls = getattr(__import__(module_name), class_name)
+imported = time.perf_counter()
+if extension_type == HIGH_LEVEL_ANALYZER:
+    instance = cls()
+    instance.get_capabilities()
+    instance.set_settings({})
+else:
+    instance = cls(metrics.split(',') if metrics else [])
+constructed = time.perf_counter()
+print(repr({
+    'import': imported - start,
+    'construct': constructed - imported,
+    'modules': sorted(set(sys.modules) - loaded),
+}))
+'''.replace('HIGH_LEVEL_ANALYZER', repr(HIGH_LEVEL_ANALYZER))
+
+
+def time_startup(directory, module_name, class_name, extension_type, metrics):
+    result = subprocess.run(
+        [sys.executable, '-c', STARTUP_SCRIPT, TOOLS_DIRECTORY, directory, module_name, class_name,
+         extension_type or '', ','.join(metrics)],
+        capture_output=True, text=True, cwd=directory)
+    if result.returncode != 0:
+        raise SystemExit('{}.{} failed to load:\n{}'.format(module_name, class_name, result.stderr))
+    return ast.literal_eval(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('extension', nargs='*', help='extension.json files (default: all in the repository)')
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET_MILLISECONDS,
+                        help='maximum import and construction time of an entry point, in ms')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='number of processes per entry point')
+    args = parser.parse_args()
+
+    over_budget = []
+    print('{:<28} {:>10} {:>12} {:>10} {:>8} {:>6}'.format(
+        'entry point', 'import ms', 'construct ms', 'total ms', 'modules', 'numpy'))
+    for path in args.extension or extension_files():
+        directory = os.path.dirname(os.path.abspath(path))
+        for name, entry, module_name, class_name in entry_points(read_extension(path)):
+            arguments = (directory, module_name, class_name, entry.get('type'), list(entry.get('metrics', {})))
+            time_startup(*arguments)
+            runs = [time_startup(*arguments) for _ in range(args.repeat)]
+            import_milliseconds = statistics.median(run['import'] for run in runs) * 1e3
+            construct_milliseconds = statistics.median(run['construct'] for run in runs) * 1e3
+            total_milliseconds = statistics.median(run['import'] + run['construct'] for run in runs) * 1e3
+            modules = runs[-1]['modules']
+            print('{:<28} {:>10.2f} {:>12.2f} {:>10.2f} {:>8} {:>6}'.format(
+                name, import_milliseconds, construct_milliseconds, total_milliseconds, len(modules),
+                'yes' if 'numpy' in modules else 'no'))
+            if total_milliseconds > args.budget:
+                over_budget.append(name)
+
+    if over_budget:
+        print('over the budget of {:g} ms: {}'.format(args.budget, ', '.join(over_budget)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
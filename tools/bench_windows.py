@@ -0,0 +1,140 @@
+"""Compare windowed measurement against placing a separate measurement on every window.
+
+A synthetic drifting clock, a synthetic sine wave and a DC level are measured over the whole capture and in windows,
+twice: with the windowed measurers, in a single pass over the chunks, and with a ClockStatsMeasurer or
+VoltageStatisticsMeasurer for the whole capture plus a new one for each window, fed the data of that window only, as when
+measurements are placed by hand. The window metrics of both must agree. The DC level (12 V with 10 uV of noise, in float32) is measured with the
+windows and hops of DC_WINDOWS, and checks that the standard deviation of the noise is not lost to the offset.
+
+Separate measurements read the data of overlapping windows once per window, while the windowed measurers read every
+chunk once whatever the overlap, set with --overlap as the number of windows covering each point.
+
+    python tools/bench_windows.py
+    python tools/bench_windows.py --windows 1000 --overlap 4
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy
+
+TOOLS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TOOLS_DIRECTORY)
+sys.path[:0] = [
+    TOOLS_DIRECTORY,
+    os.path.join(REPOSITORY_DIRECTORY, 'clockStats'),
+    os.path.join(REPOSITORY_DIRECTORY, 'voltageStats'),
+]
+
+from saleae.range_measurements import AnalogData, DigitalData, run_measurement  # noqa: E402
+import synthetic  # noqa: E402
+
+from clock_stats import ClockStatsMeasurer  # noqa: E402
+import summary_index  # noqa: E402
+from voltage_statistics import VoltageStatisticsMeasurer  # noqa: E402
+from windowed_clock_stats import WindowedClockStatsMeasurer  # noqa: E402
+from windowed_voltage_statistics import WindowedVoltageStatisticsMeasurer  # noqa: E402
+
+CLOCK_METRICS = ['frequencyAvg', 'frequencyMin', 'frequencyMax', 'periodStdDev']
+VOLTAGE_METRICS = ['voltageRms', 'voltageMean', 'voltageStdDev', 'voltageMin', 'voltageMax', 'voltagePeakToPeak']
+DC_WINDOWS = ((4000, 1000), (65536, 16384))
+
+
+def drifting_clock(edge_count, chunk_size):
+    # A 1 MHz clock whose frequency drifts by 1% over the capture, with 1 ns of jitter.
+    rng = numpy.random.default_rng(0)
+    half_periods = 0.5e-6 * (1 + 0.01 * numpy.linspace(0, 1, edge_count)) + rng.normal(0, 1e-9, edge_count)
+    offsets = numpy.concatenate(([0.0], numpy.cumsum(half_periods)))
+    states = numpy.arange(edge_count + 1) % 2 == 0
+    return offsets, states, synthetic.digital_chunks(offsets, states, chunk_size)
+
+
+def check(windowed, separate, metrics):
+    for row, values in zip(windowed, separate):
+        for metric in metrics:
+            expected = values.get(metric, math.nan)
+            if not (math.isclose(row[metric], expected, rel_tol=1e-6) or (math.isnan(row[metric]) and math.isnan(expected))):
+                raise SystemExit('window at {}: {} is {}, separately {}'.format(row['start'], metric, row[metric], expected))
+
+
+def clock_case(edge_count, window_count, overlap, chunk_size):
+    offsets, states, chunks = drifting_clock(edge_count, chunk_size)
+    window = offsets[-1] / window_count
+
+    start = time.perf_counter()
+    measurer = WindowedClockStatsMeasurer(CLOCK_METRICS, window, window / overlap)
+    for data in chunks:
+        measurer.process_data(data)
+    windows = measurer.windows()
+    windowed_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    run_measurement(ClockStatsMeasurer, CLOCK_METRICS, chunks)
+    separate = []
+    for row in windows:
+        # The transitions of the window, starting with a transition of the same type as the first of the range.
+        first = numpy.searchsorted(offsets, row['start'])
+        first += states[first] != states[0]
+        # A window cut short by the end of the capture includes its last transition.
+        last = numpy.searchsorted(offsets, row['end'], side='right' if row['end'] < row['start'] + window else 'left')
+        data = DigitalData(synthetic.DEFAULT_START_TIME, offsets[first:last], states[first:last])
+        separate.append(run_measurement(ClockStatsMeasurer, CLOCK_METRICS, [data]))
+    separate_seconds = time.perf_counter() - start
+
+    check(windows, separate, CLOCK_METRICS)
+    return windowed_seconds, separate_seconds, len(windows)
+
+
+def sine_case(sample_count, window_count, overlap, chunk_size):
+    chunks = synthetic.sine(1e6, 1e3, sample_count, noise=0.01, chunk_size=chunk_size)
+    window = sample_count // window_count
+    return voltage_case(chunks, window, window // overlap)
+
+
+def dc_case(sample_count, window, hop, chunk_size):
+    chunks = synthetic.sine(1e6, 1e3, sample_count, amplitude=0.0, offset=12.0, noise=1e-5, chunk_size=chunk_size)
+    return voltage_case(chunks, window, hop)
+
+
+def voltage_case(chunks, window, hop):
+    samples = numpy.concatenate([data.samples for data in chunks])
+
+    start = time.perf_counter()
+    measurer = WindowedVoltageStatisticsMeasurer(VOLTAGE_METRICS, window, hop)
+    for data in chunks:
+        measurer.process_data(data)
+    windows = measurer.windows()
+    windowed_seconds = time.perf_counter() - start
+
+    summary_index.cache.clear()
+    start = time.perf_counter()
+    run_measurement(VoltageStatisticsMeasurer, VOLTAGE_METRICS, chunks)
+    separate = [run_measurement(VoltageStatisticsMeasurer, VOLTAGE_METRICS, [AnalogData(samples[row['start']:row['end']])])
+                for row in windows]
+    separate_seconds = time.perf_counter() - start
+
+    check(windows, separate, VOLTAGE_METRICS)
+    return windowed_seconds, separate_seconds, len(windows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--edges', type=int, default=10 ** 6)
+    parser.add_argument('--samples', type=int, default=10 ** 7)
+    parser.add_argument('--windows', type=int, default=100, help='number of back to back windows over the capture')
+    parser.add_argument('--overlap', type=int, default=1, help='number of windows covering each point')
+    args = parser.parse_args()
+
+    results = [('clockStats', clock_case(args.edges, args.windows, args.overlap, 65536)),
+               ('voltageStats', sine_case(args.samples, args.windows, args.overlap, 1 << 20))]
+    for window, hop in DC_WINDOWS:
+        results.append(('DC {}/{}'.format(window, hop), dc_case(args.samples, window, hop, 1 << 20)))
+    for name, (windowed_seconds, separate_seconds, count) in results:
+        print('{:<16} {:>6} windows   windowed {:8.3f} s   separate measurements {:8.3f} s'.format(
+            name, count, windowed_seconds, separate_seconds))
+
+
+if __name__ == '__main__':
+    main()
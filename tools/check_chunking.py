@@ -0,0 +1,147 @@
+"""Check that the measurers give the same results however the Logic software splits a range into chunks.
+
+Every case measures one synthetic capture split into chunks of each of --chunk-sizes, and compares the results with a
+reference: for clockStats, a plain loop over every transition, like the original ClockStatsMeasurer, and for
+analogClockStats, the measurement of the capture as a single chunk. Edge counts must be identical, and the other values
+equal within --tolerance (relative), which allows for the different order of the floating point operations. Small chunk
+sizes put chunk seams between almost every pair of edges. ClockStatsMeasurer collects the entries of small chunks before
+measuring them, so clockStats is also measured by merging the partial state of every chunk, as the process pool of
+parallel_measure.py does, which checks the seams.
+
+    python tools/check_chunking.py
+    python tools/check_chunking.py --chunk-sizes 1 7 4096 --edges 50000 --samples 500000
+
+The exit status is 1 if any result differs.
+"""
+import argparse
+import math
+import os
+import sys
+
+TOOLS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TOOLS_DIRECTORY)
+sys.path[:0] = [
+    TOOLS_DIRECTORY,
+    os.path.join(REPOSITORY_DIRECTORY, 'clockStats'),
+    os.path.join(REPOSITORY_DIRECTORY, 'analogClockStats'),
+]
+
+from saleae.range_measurements import run_measurement  # noqa: E402
+import synthetic  # noqa: E402
+
+from analog_clock_stats import AnalogClockStatsMeasurer  # noqa: E402
+from clock_stats import ClockStatsMeasurer  # noqa: E402
+
+DEFAULT_CHUNK_SIZES = [1, 2, 3, 5, 16, 100, 1000, 4096]
+DEFAULT_EDGE_COUNT = 20000
+DEFAULT_SAMPLE_COUNT = 100000
+
+CLOCK_MEASUREMENTS = ['edgesRising', 'edgesFalling', 'frequencyAvg', 'frequencyMin', 'frequencyMax', 'periodStdDev']
+COUNT_MEASUREMENTS = ('edgesRising', 'edgesFalling')
+
+
+def reference_clock_stats(chunks):
+    # The clock metrics from a loop over every transition, with Welford's update for the period variance.
+    first_type = first_time = last_time = None
+    edges = {True: 0, False: 0}
+    period_min = period_max = None
+    count = 0
+    mean = m2 = 0.0
+    for data in chunks:
+        for t, bitstate in data:
+            if first_type is None:
+                first_type = bitstate
+                first_time = t
+            elif bitstate == first_type:
+                period = t - (first_time if last_time is None else last_time)
+                last_time = t
+                period_min = period if period_min is None else min(period_min, period)
+                period_max = period if period_max is None else max(period_max, period)
+                count += 1
+                delta = period - mean
+                mean += delta / count
+                m2 += delta * (period - mean)
+            edges[bitstate] += 1
+
+    values = {'edgesRising': edges[True], 'edgesFalling': edges[False]}
+    if last_time is not None:
+        values['frequencyAvg'] = (edges[first_type] - 1) / (last_time - first_time)
+        values['frequencyMin'] = 1 / period_max
+        values['frequencyMax'] = 1 / period_min
+    if count > 1:
+        values['periodStdDev'] = math.sqrt(m2 / (count - 1))
+    return values
+
+
+def merged_partial_states(measurer_type, measurements, chunks):
+    measurer = measurer_type(measurements)
+    for data in chunks:
+        measurer.merge_partial_state(measurer_type.partial_state_type.from_data(data))
+    return measurer.measure()
+
+
+def differences(values, expected, tolerance):
+    found = []
+    for key in sorted(set(values) | set(expected)):
+        value, reference = values.get(key), expected.get(key)
+        if value is None or reference is None:
+            same = value is reference
+        elif key in COUNT_MEASUREMENTS:
+            same = value == reference
+        else:
+            same = math.isclose(value, reference, rel_tol=tolerance)
+        if not same:
+            found.append('{}: {!r}, expected {!r}'.format(key, value, reference))
+    return found
+
+
+def clock_cases(edge_count):
+    # (name, function returning the capture split into chunks of a given size)
+    return [
+        ('clockStats/clock', lambda chunk_size: synthetic.clock(1e6, edge_count, jitter=1e-8, chunk_size=chunk_size)),
+        ('clockStats/pwm', lambda chunk_size: synthetic.pwm(1e5, edge_count // 2, chunk_size=chunk_size)),
+    ]
+
+
+def analog_clock_cases(sample_count):
+    # A noisy sine, measured with the default threshold and hysteresis, which are set from the first samples.
+    return [
+        ('analogClockStats/sine', lambda chunk_size: synthetic.sine(1e6, 1e4, sample_count, noise=0.02,
+                                                                    chunk_size=chunk_size)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunk-sizes', type=int, nargs='+', default=DEFAULT_CHUNK_SIZES)
+    parser.add_argument('--edges', type=int, default=DEFAULT_EDGE_COUNT, help='edge count of the digital captures')
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLE_COUNT, help='sample count of the analog captures')
+    parser.add_argument('--tolerance', type=float, default=1e-9, help='allowed relative difference of the values')
+    args = parser.parse_args()
+
+    cases = [(case_name, capture, run, ClockStatsMeasurer, CLOCK_MEASUREMENTS,
+              lambda capture: reference_clock_stats(capture(max(args.chunk_sizes))))
+             for name, capture in clock_cases(args.edges)
+             for case_name, run in ((name, run_measurement), (name + ' merged', merged_partial_states))]
+    analog_measurements = AnalogClockStatsMeasurer.supported_measurements
+    cases += [(name, capture, run_measurement, AnalogClockStatsMeasurer, analog_measurements,
+               lambda capture: run_measurement(AnalogClockStatsMeasurer, analog_measurements, capture(args.samples)))
+              for name, capture in analog_clock_cases(args.samples)]
+
+    failures = []
+    for name, capture, run, measurer_type, measurements, reference in cases:
+        expected = reference(capture)
+        for chunk_size in args.chunk_sizes:
+            values = run(measurer_type, measurements, capture(chunk_size))
+            found = differences(values, expected, args.tolerance)
+            print('{:<31} chunks of {:<6} {}'.format(name, chunk_size, 'ok' if not found else 'FAILED'))
+            failures += ['{} chunks of {}: {}'.format(name, chunk_size, difference) for difference in found]
+
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
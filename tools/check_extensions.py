@@ -0,0 +1,213 @@
+"""Check the extensions in this repository the way the Logic software will load them.
+
+For every extension.json given (by default, every one in the repository), this compiles every python file in the
+extension directory, and checks that:
+
+- extension.json has the name, version, apiVersion and extensions fields, and every extension in it has a known type
+  and an entryPoint of the form module.Class, with the module in the extension directory,
+- the entry point can be imported, with the offline stand-in for `saleae.range_measurements`, and is a class,
+- a measurement class derives from the measurer class of its type, and the metrics of the measurement match the
+  supported_measurements of the class: every metric is supported, and every supported measurement has a metric, with a
+  name,
+- a HighLevelAnalyzer class has get_capabilities, set_settings and decode methods,
+- the python files copied into more than one extension directory (such as instrumentation.py) are identical.
+
+With --compile, the bytecode of the python files of every extension without problems is also written to its
+__pycache__ directory. Python then loads the bytecode instead of compiling the source every time the extension is
+loaded, which is most of the time taken to import an extension that does not import NumPy up front (see
+bench_startup.py). The bytecode is checked against a hash of the source, so it stays valid when the directory is copied,
+and is ignored once the source changes.
+
+    python tools/check_extensions.py
+    python tools/check_extensions.py clockStats/extension.json
+    python tools/check_extensions.py --compile
+
+Every problem found is printed, and the exit status is 1 if there are any.
+"""
+import argparse
+import glob
+import importlib
+import json
+import os
+import py_compile
+import sys
+
+TOOLS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TOOLS_DIRECTORY)
+sys.path.insert(0, TOOLS_DIRECTORY)
+
+from saleae import range_measurements  # noqa: E402
+
+REQUIRED_FIELDS = ('name', 'version', 'apiVersion', 'extensions')
+MEASURER_BASES = {
+    'DigitalMeasurement': range_measurements.DigitalMeasurer,
+    'AnalogMeasurement': range_measurements.AnalogMeasurer,
+}
+HIGH_LEVEL_ANALYZER = 'HighLevelAnalyzer'
+HLA_METHODS = ('get_capabilities', 'set_settings', 'decode')
+
+
+def extension_files():
+    # Every extension.json in the repository, at most two directories down (hla_gyroscope keeps its own in extension/).
+    paths = glob.glob(os.path.join(REPOSITORY_DIRECTORY, '*', 'extension.json'))
+    paths += glob.glob(os.path.join(REPOSITORY_DIRECTORY, '*', '*', 'extension.json'))
+    return sorted(path for path in paths if os.path.dirname(path) != TOOLS_DIRECTORY)
+
+
+def read_extension(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def entry_points(extension):
+    # (name, entry, module name, class name) for every extension with a well formed entryPoint, where entry is its
+    # object in extension.json.
+    found = []
+    for name, entry in extension.get('extensions', {}).items():
+        module_name, _, class_name = str(entry.get('entryPoint', '')).rpartition('.')
+        if module_name and class_name:
+            found.append((name, entry, module_name, class_name))
+    return found
+
+
+def import_classes(directory, modules):
+    # Imports the entry point modules of an extension, and returns {module name: module or the exception raised}.
+    # Extensions are loaded on their own, and several of them have modules with the same name, so the modules loaded
+    # from the directory are unloaded again.
+    loaded = set(sys.modules)
+    sys.path.insert(0, directory)
+    imported = {}
+    try:
+        for module_name in modules:
+            try:
+                imported[module_name] = importlib.import_module(module_name)
+            except Exception as error:
+                imported[module_name] = error
+    finally:
+        sys.path.remove(directory)
+        for name in set(sys.modules) - loaded:
+            module_file = getattr(sys.modules[name], '__file__', None)
+            if module_file and os.path.dirname(os.path.abspath(module_file)) == directory:
+                del sys.modules[name]
+    return imported
+
+
+def check_extension(path):
+    # The problems found in the extension of an extension.json, as a list of messages.
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        extension = read_extension(path)
+    except (OSError, ValueError) as error:
+        return ['{}: can not be read: {}'.format(path, error)]
+    problems = ['{}: no "{}" field'.format(path, field) for field in REQUIRED_FIELDS if field not in extension]
+
+    for file_name in sorted(os.listdir(directory)):
+        if file_name.endswith('.py'):
+            file_path = os.path.join(directory, file_name)
+            with open(file_path, 'rb') as file:
+                source = file.read()
+            try:
+                compile(source, file_path, 'exec')
+            except SyntaxError as error:
+                problems.append('{}: {}'.format(file_path, error))
+
+    for name, entry in extension.get('extensions', {}).items():
+        if entry.get('type') not in MEASURER_BASES and entry.get('type') != HIGH_LEVEL_ANALYZER:
+            problems.append('{}: {}: unknown type {!r}'.format(path, name, entry.get('type')))
+        module_name, _, class_name = str(entry.get('entryPoint', '')).rpartition('.')
+        if not module_name or not class_name:
+            problems.append('{}: {}: entryPoint must be module.Class, not {!r}'.format(
+                path, name, entry.get('entryPoint')))
+        elif not os.path.isfile(os.path.join(directory, module_name + '.py')):
+            problems.append('{}: {}: no {}.py in {}'.format(path, name, module_name, directory))
+
+    points = [point for point in entry_points(extension)
+              if os.path.isfile(os.path.join(directory, point[2] + '.py'))]
+    modules = import_classes(directory, sorted(set(module_name for _, _, module_name, _ in points)))
+    for name, entry, module_name, class_name in points:
+        prefix = '{}: {}'.format(path, name)
+        module = modules[module_name]
+        if isinstance(module, Exception):
+            problems.append('{}: importing {} failed: {!r}'.format(prefix, module_name, module))
+            continue
+        cls = getattr(module, class_name, None)
+        if not isinstance(cls, type):
+            problems.append('{}: {} has no class {}'.format(prefix, module_name, class_name))
+            continue
+
+        if entry.get('type') in MEASURER_BASES:
+            base = MEASURER_BASES[entry['type']]
+            if not issubclass(cls, base):
+                problems.append('{}: {} does not derive from {}'.format(prefix, class_name, base.__name__))
+            metrics = entry.get('metrics', {})
+            supported = getattr(cls, 'supported_measurements', None)
+            if supported is None:
+                problems.append('{}: {} has no supported_measurements'.format(prefix, class_name))
+                continue
+            for metric in metrics:
+                if metric not in supported:
+                    problems.append('{}: metric {} is not in {}.supported_measurements'.format(
+                        prefix, metric, class_name))
+                elif not metrics[metric].get('name'):
+                    problems.append('{}: metric {} has no name'.format(prefix, metric))
+            for measurement in supported:
+                if measurement not in metrics:
+                    problems.append('{}: {}.supported_measurements has {}, which has no metric'.format(
+                        prefix, class_name, measurement))
+        elif entry.get('type') == HIGH_LEVEL_ANALYZER:
+            for method in HLA_METHODS:
+                if not callable(getattr(cls, method, None)):
+                    problems.append('{}: {} has no {} method'.format(prefix, class_name, method))
+    return problems
+
+
+def write_bytecode(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    for file_path in sorted(glob.glob(os.path.join(directory, '*.py'))):
+        py_compile.compile(file_path, doraise=True, invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH)
+
+
+def check_copies(paths):
+    # Python files with the same name in several extension directories are copies of one shared file, and must be
+    # identical.
+    copies = {}
+    for path in paths:
+        directory = os.path.dirname(os.path.abspath(path))
+        for file_path in glob.glob(os.path.join(directory, '*.py')):
+            copies.setdefault(os.path.basename(file_path), []).append(file_path)
+    problems = []
+    for file_name, file_paths in sorted(copies.items()):
+        contents = {}
+        for file_path in file_paths:
+            with open(file_path, 'rb') as file:
+                contents.setdefault(file.read(), []).append(file_path)
+        if len(contents) > 1:
+            problems.append('{} differs between the copies in {}'.format(
+                file_name, '; '.join(', '.join(os.path.relpath(os.path.dirname(file_path), REPOSITORY_DIRECTORY)
+                                               for file_path in group) for group in contents.values())))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('extension', nargs='*', help='extension.json files (default: all in the repository)')
+    parser.add_argument('--compile', action='store_true', help='write the bytecode of the extensions without problems')
+    args = parser.parse_args()
+
+    paths = args.extension or extension_files()
+    problems = []
+    for path in paths:
+        extension_problems = check_extension(path)
+        if args.compile and not extension_problems:
+            write_bytecode(path)
+        print('{:<50} {}'.format(os.path.relpath(path), 'ok' if not extension_problems else 'FAILED'))
+        problems += extension_problems
+    problems += check_copies(paths)
+    for problem in problems:
+        print(problem)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
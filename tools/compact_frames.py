@@ -0,0 +1,267 @@
+"""Compact alternatives to the dict frames passed to and returned from HLAs.
+
+`Frame` is a single frame with `__slots__` instead of a dict. It offers the dict accessors the HLAs use
+(`frame['type']`, `frame['data']`, `'end_time' in frame`, ...) and compares equal to the dict frame with the same
+contents.
+
+`FrameBatch` holds many frames as columns: NumPy arrays of start and end times, a type code per frame indexing a string
+table of frame types, and one array per payload key, with single bytes stored as uint8. It is the form to keep frames
+in at rest, at a tenth of the memory of dict frames. HLAs read dict frames fastest, so `materialize` rebuilds a batch
+as dict frames for decoding, and `rows` streams frames through one batch at a time.
+
+The HLAs in this repository build their output frames as dict literals, which is faster than building any other kind
+of object. `compact_decoder` wraps their `decode` or `decode_batch` to replace the frames returned with `Frame` objects,
+for output frames that are kept.
+"""
+import numpy
+
+FRAME_KEYS = ('type', 'start_time', 'end_time', 'data')
+
+# Single byte bytes objects, indexed by their value, so byte columns can be turned back into bytes without allocating.
+SINGLE_BYTES = [bytes((value,)) for value in range(256)]
+
+_MISSING = object()
+
+
+class Frame:
+    __slots__ = FRAME_KEYS
+
+    def __init__(self, type, start_time, end_time=_MISSING, data=_MISSING):
+        self.type = type
+        self.start_time = start_time
+        # Like a dict frame, a frame may be built before its end time is known.
+        if end_time is not _MISSING:
+            self.end_time = end_time
+        self.data = {} if data is _MISSING else data
+
+    @classmethod
+    def from_dict(cls, frame):
+        return cls(**frame)
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in FRAME_KEYS if hasattr(self, key)}
+
+    def __getitem__(self, key):
+        if key in FRAME_KEYS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in FRAME_KEYS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in FRAME_KEYS and hasattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in FRAME_KEYS else default
+
+    def keys(self):
+        return [key for key in FRAME_KEYS if hasattr(self, key)]
+
+    def __eq__(self, other):
+        if isinstance(other, Frame):
+            other = other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return 'Frame({!r})'.format(self.to_dict())
+
+
+def column_kind(value):
+    if isinstance(value, bytes) and len(value) == 1:
+        return 'byte'
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int) and -2 ** 63 <= value < 2 ** 63:
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    return 'object'
+
+
+COLUMN_DTYPES = {
+    'byte': numpy.uint8,
+    'bool': numpy.bool_,
+    'int': numpy.int64,
+    'float': numpy.float64,
+    'object': object,
+}
+
+
+class PayloadColumn:
+    # Values of one payload key for every frame of a batch, and which frames have the key at all.
+    def __init__(self, kind, values, present):
+        self.kind = kind
+        self.values = values
+        self.present = present
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.present.nbytes
+
+    def take(self, indexes):
+        values = self.values[indexes].tolist()
+        if self.kind == 'byte':
+            values = [SINGLE_BYTES[value] for value in values]
+        return values
+
+
+class FrameBatch:
+    def __init__(self, types, type_codes, start_times, end_times, payload):
+        self.types = types
+        self.type_codes = type_codes
+        self.start_times = start_times
+        self.end_times = end_times
+        self.payload = payload
+        self.rows = None
+
+    @classmethod
+    def from_frames(cls, frames):
+        types = []
+        type_indexes = {}
+        type_codes = []
+        start_times = []
+        end_times = []
+        payload_values = {}
+        frames = list(frames)
+
+        for index, frame in enumerate(frames):
+            frame_type = frame['type']
+            code = type_indexes.get(frame_type)
+            if code is None:
+                code = type_indexes[frame_type] = len(types)
+                types.append(frame_type)
+            type_codes.append(code)
+            start_times.append(frame['start_time'])
+            end_times.append(frame['end_time'])
+            for key, value in frame['data'].items():
+                column = payload_values.get(key)
+                if column is None:
+                    column = payload_values[key] = [None] * len(frames)
+                column[index] = (value,)
+
+        payload = {}
+        for key, column in payload_values.items():
+            present = numpy.fromiter((item is not None for item in column), dtype=bool, count=len(column))
+            values = [item[0] for item in column if item is not None]
+            kinds = set(column_kind(value) for value in values)
+            kind = kinds.pop() if len(kinds) == 1 else 'object'
+            if kind == 'byte':
+                values = [value[0] for value in values]
+            filled = numpy.zeros(len(column), dtype=COLUMN_DTYPES[kind])
+            filled[present] = numpy.array(values, dtype=COLUMN_DTYPES[kind]) if kind != 'object' else _object_array(values)
+            payload[key] = PayloadColumn(kind, filled, present)
+
+        type_code_dtype = numpy.uint8 if len(types) <= 256 else numpy.uint16
+        return cls(types, numpy.array(type_codes, dtype=type_code_dtype), numpy.array(start_times, dtype=numpy.float64),
+                   numpy.array(end_times, dtype=numpy.float64), payload)
+
+    @property
+    def nbytes(self):
+        return (self.type_codes.nbytes + self.start_times.nbytes + self.end_times.nbytes +
+                sum(column.nbytes for column in self.payload.values()))
+
+    def __len__(self):
+        return len(self.type_codes)
+
+    def materialize(self):
+        # The dict frames of the batch, built on the first call and kept until release.
+        if self.rows is None:
+            self.rows = self.to_frames()
+        return self.rows
+
+    def to_frames(self):
+        # Builds the dict frames of the batch. Columns are converted to python lists once per batch, and the payload
+        # dicts are built per group of frames with the same payload keys by build_payloads, so the per frame work is a
+        # few list and dict operations, with no per frame lookup of the keys a frame has.
+        types = self.types
+        return [
+            {'type': types[code], 'start_time': start_time, 'end_time': end_time, 'data': payload}
+            for code, start_time, end_time, payload in zip(
+                self.type_codes.tolist(), self.start_times.tolist(), self.end_times.tolist(), self.payloads())
+        ]
+
+    def payloads(self):
+        keys = list(self.payload)
+        data = [None] * len(self)
+        if not keys:
+            return [{} for _ in data]
+        # One bit per payload key, set when the frame has that key.
+        signatures = numpy.zeros(len(self), dtype=numpy.int64)
+        for bit, key in enumerate(keys):
+            signatures |= self.payload[key].present.astype(numpy.int64) << bit
+        for signature in numpy.unique(signatures).tolist():
+            indexes = numpy.flatnonzero(signatures == signature)
+            group_keys = [key for bit, key in enumerate(keys) if signature >> bit & 1]
+            columns = [self.payload[key].take(indexes) for key in group_keys]
+            payloads = build_payloads(group_keys, columns) if columns else [{} for _ in indexes]
+            for index, payload in zip(indexes.tolist(), payloads):
+                data[index] = payload
+        return data
+
+    def release(self):
+        # Drops the rows built by materialize, leaving only the columns.
+        self.rows = None
+
+    def __iter__(self):
+        return iter(self.materialize())
+
+
+def build_payloads(keys, columns):
+    # Builds the payload dicts with the given keys from one list of values per key. Filling in one key at a time for
+    # every dict is about three times faster than dict(zip(keys, values)) per dict, which builds a zip and a tuple for
+    # every dict.
+    payloads = [{} for _ in columns[0]]
+    for key, column in zip(keys, columns):
+        for payload, value in zip(payloads, column):
+            payload[key] = value
+    return payloads
+
+
+def compact_output(output):
+    # The output of decode or decode_batch, with every frame replaced by a Frame.
+    if output is None:
+        return None
+    if isinstance(output, (list, tuple)):
+        return [Frame.from_dict(frame) for frame in output]
+    return Frame.from_dict(output)
+
+
+def compact_decoder(decode):
+    # Wraps the decode or decode_batch method of an HLA to return Frame output frames.
+    def decode_compact(frames):
+        return compact_output(decode(frames))
+    return decode_compact
+
+
+def _object_array(values):
+    array = numpy.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def rows(frames, batch_size=65536):
+    # Passes a stream of dict frames through FrameBatch instances of batch_size frames, so no more than one batch of dict
+    # frames exists at a time.
+    for batch in batches(frames, batch_size):
+        yield from batch.materialize()
+        batch.release()
+
+
+def batches(frames, batch_size):
+    # Groups a stream of dict frames into FrameBatch instances of batch_size frames.
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == batch_size:
+            yield FrameBatch.from_frames(batch)
+            batch = []
+    if batch:
+        yield FrameBatch.from_frames(batch)
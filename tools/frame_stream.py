@@ -0,0 +1,52 @@
+"""Reading and writing streams of HLA frames.
+
+Frames are stored one per line as JSON, in exactly the shape passed to `decode` (see "Input Frame Types" in the
+repository README). JSON has no bytes type, so bytes values are written as `{"$bytes": "<hex>"}`:
+
+    {"type": "address", "start_time": 0.0052, "end_time": 0.0076, "data": {"address": {"$bytes": "d2"}}}
+
+Files are read one line at a time, so streams far larger than memory can be replayed.
+"""
+import json
+
+BYTES_KEY = '$bytes'
+
+
+def encode_value(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {BYTES_KEY: bytes(value).hex()}
+    return value
+
+
+def decode_value(value):
+    if isinstance(value, dict) and BYTES_KEY in value:
+        return bytes.fromhex(value[BYTES_KEY])
+    return value
+
+
+def encode_frame(frame):
+    data = {key: encode_value(value) for key, value in frame['data'].items()}
+    return json.dumps({'type': frame['type'], 'start_time': frame['start_time'], 'end_time': frame['end_time'], 'data': data})
+
+
+def decode_frame(line):
+    frame = json.loads(line)
+    frame['data'] = {key: decode_value(value) for key, value in frame['data'].items()}
+    return frame
+
+
+def read_frames(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield decode_frame(line)
+
+
+def write_frames(path, frames):
+    count = 0
+    with open(path, 'w') as f:
+        for frame in frames:
+            f.write(encode_frame(frame))
+            f.write('\n')
+            count += 1
+    return count
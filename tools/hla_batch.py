@@ -0,0 +1,34 @@
+"""Batch decoding for High Level Analyzers.
+
+An HLA may implement an optional `decode_batch(frames)` method, which takes a list of input frames and returns a flat
+list of every output frame, the same frames that calling `decode` on each input frame in turn would produce. Text
+Messages implements it natively. `BatchDecodeMixin` adds it to any HLA that only implements `decode`:
+
+    class MyHla(BatchDecodeMixin, Hla):
+        ...
+
+and `batch_decoder` returns a batch decode function for any HLA instance, native or not.
+"""
+
+
+class BatchDecodeMixin:
+    def decode_batch(self, frames):
+        output = []
+        decode = self.decode
+        for frame in frames:
+            result = decode(frame)
+            if result is None:
+                continue
+            # decode may return nothing, a single frame, or a list of frames.
+            if isinstance(result, (list, tuple)):
+                output.extend(result)
+            else:
+                output.append(result)
+        return output
+
+
+def batch_decoder(hla):
+    decode_batch = getattr(hla, 'decode_batch', None)
+    if decode_batch is not None:
+        return decode_batch
+    return BatchDecodeMixin.decode_batch.__get__(hla)
@@ -0,0 +1,92 @@
+"""Simulate measuring a range that grows during a live capture, by rebuilding the measurer or with snapshot().
+
+The synthetic capture is revealed a few chunks at a time. At each refresh the range is measured twice: by building a new
+measurer and passing it every chunk so far, as the Logic software does when a range changes, and by passing only the new
+chunks to one long-lived measurer and calling its `snapshot()`. The values must agree to RELATIVE_TOLERANCE, as the
+voltageStats summary index adds the samples of a chunk it has read before in a different order; the report shows the time
+of both approaches over all refreshes, and for the last refresh alone.
+
+    python tools/live_measure.py
+    python tools/live_measure.py --measurer voltageStats --refreshes 200
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+TOOLS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TOOLS_DIRECTORY)
+sys.path[:0] = [
+    TOOLS_DIRECTORY,
+    os.path.join(REPOSITORY_DIRECTORY, 'clockStats'),
+    os.path.join(REPOSITORY_DIRECTORY, 'voltageStats'),
+]
+
+RELATIVE_TOLERANCE = 1e-12
+
+from saleae.range_measurements import process_chunks, run_measurement  # noqa: E402
+import synthetic  # noqa: E402
+
+from clock_stats import ClockStatsMeasurer  # noqa: E402
+from voltage_statistics import VoltageStatisticsMeasurer  # noqa: E402
+
+
+def capture(name, size, chunk_size):
+    if name == 'clockStats':
+        return ClockStatsMeasurer, synthetic.clock(1e6, size, jitter=1e-9, chunk_size=chunk_size)
+    return VoltageStatisticsMeasurer, synthetic.sine(1e6, 1e3, size, noise=0.01, chunk_size=chunk_size)
+
+
+def agree(snapshot, rebuilt):
+    return snapshot.keys() == rebuilt.keys() and all(
+        snapshot[name] == rebuilt[name] or math.isclose(snapshot[name], rebuilt[name], rel_tol=RELATIVE_TOLERANCE)
+        for name in snapshot)
+
+
+def live_measure(measurer_type, chunks, refreshes):
+    requested = measurer_type.supported_measurements
+    step = max(1, len(chunks) // refreshes)
+    measurer = measurer_type(requested)
+    rebuild_seconds = []
+    snapshot_seconds = []
+
+    for begin in range(0, len(chunks), step):
+        end = min(begin + step, len(chunks))
+        start = time.perf_counter()
+        rebuilt = run_measurement(measurer_type, requested, chunks[:end])
+        rebuild_seconds.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        process_chunks(measurer, chunks[begin:end])
+        snapshot = measurer.snapshot()
+        snapshot_seconds.append(time.perf_counter() - start)
+
+        if not agree(snapshot, rebuilt):
+            raise SystemExit('snapshot after {} chunks differs from a rebuilt measurement:\n{}\n{}'.format(
+                end, snapshot, rebuilt))
+    return rebuild_seconds, snapshot_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--measurer', choices=['clockStats', 'voltageStats'], default='clockStats')
+    parser.add_argument('--size', type=int, help='edges or samples in the whole capture')
+    parser.add_argument('--chunk-size', type=int, help='edges or samples per chunk')
+    parser.add_argument('--refreshes', type=int, default=50)
+    args = parser.parse_args()
+
+    digital = args.measurer == 'clockStats'
+    size = args.size or (10 ** 6 if digital else 10 ** 7)
+    chunk_size = args.chunk_size or (16384 if digital else 65536)
+    measurer_type, chunks = capture(args.measurer, size, chunk_size)
+    rebuild_seconds, snapshot_seconds = live_measure(measurer_type, chunks, args.refreshes)
+
+    print('{} over {:,} {}, {} refreshes'.format(
+        args.measurer, size, 'edges' if digital else 'samples', len(rebuild_seconds)))
+    print('  rebuild   total {:8.3f} s   last refresh {:8.4f} s'.format(sum(rebuild_seconds), rebuild_seconds[-1]))
+    print('  snapshot  total {:8.3f} s   last refresh {:8.4f} s'.format(sum(snapshot_seconds), snapshot_seconds[-1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""Decode an I2C frame stream with an HLA in a process pool.
+
+I2C HLAs such as the Fancy I2C HLA in hla_simple_example and the gyroscope HLA build their output from transactions,
+which run from a `start` frame to a `stop` frame, and carry little state from one transaction to the next: nothing for
+I2cHla, and only the last write transaction (the register address of the following reads) for Gyro. The frames are
+therefore split into shards just after stop frames, and every shard is decoded by a new HLA instance in a worker process.
+
+Before decoding its shard, the instance is warmed up with the frames of the last write transaction before the shard (up
+to the next start frame), and of the last transaction before the shard if that is not the write, and the output of
+those frames is dropped. This leaves it in the state that decoding every frame before the shard would have, so the
+output frames of the shards, joined in shard order, are the same frames in the same order as decoding the whole stream
+with a single instance. The warm up is at most two transactions, however long ago the last write was, and the search for
+the last write before a shard stops at the previous shard, whose last write is used when there is none in between.
+
+Settings that make the HLA write a file, such as the Export File setting of the gyroscope HLA and the Index File
+setting of both HLAs, are rejected, as every worker would write the file over again.
+
+The frames are held in a list, which the workers share with the calling process when processes are forked, so only
+shard boundaries and output frames are passed between processes. Elsewhere the list is copied to each worker once.
+
+    from parallel_hla import decode_parallel
+    output = decode_parallel(Gyro, frames)
+
+    python tools/parallel_hla.py hla_gyroscope/extension/extension.json --synthetic i2c --count 5000000
+    python tools/parallel_hla.py hla_simple_example/extension.json --entry "Fancy I2C" --input i2c.jsonl --workers 4
+
+The command line decodes the frames serially and in parallel, checks that the output frames are identical, and reports
+both times.
+"""
+import argparse
+import gc
+import math
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+TOOLS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TOOLS_DIRECTORY)
+
+from hla_batch import batch_decoder  # noqa: E402
+from replay_hla import load_entry_points, open_frames, parse_settings  # noqa: E402
+import synthetic_frames  # noqa: E402
+
+# Shards per worker by default, so workers that finish early can take another shard.
+SHARDS_PER_WORKER = 4
+
+# Names of the module constants holding the name of a setting that makes an HLA write a file.
+FILE_SETTINGS = ('EXPORT_FILE_SETTING', 'INDEX_FILE_SETTING')
+
+# The frames being decoded, in the worker processes.
+worker_frames = None
+
+
+def is_write_transaction(frames, start, end):
+    # Whether the frames from start (a start frame) to end are a write transaction that ends with a stop frame.
+    is_write = None
+    for index in range(start + 1, end):
+        frame = frames[index]
+        if frame['type'] == 'address' and is_write is None:
+            is_write = (frame['data']['address'][0] & 0x01) == 0
+        elif frame['type'] == 'stop':
+            return bool(is_write)
+    return False
+
+
+def last_write_transaction(frames, boundary, limit):
+    # (start, end) of the last write transaction starting at or after limit and before boundary, from its start frame up
+    # to the next start frame (or boundary), or None if there is none.
+    end = boundary
+    for index in range(boundary - 1, limit - 1, -1):
+        if frames[index]['type'] == 'start':
+            if is_write_transaction(frames, index, end):
+                return index, end
+            end = index
+    return None
+
+
+def last_transaction_start(frames, boundary):
+    # The index of the last start frame before boundary, or None if there is none.
+    for index in range(boundary - 1, -1, -1):
+        if frames[index]['type'] == 'start':
+            return index
+    return None
+
+
+def shard_bounds(frames, shard_size):
+    # (warm up slices, start, end) for each shard, splitting just after the first stop frame at or after every multiple
+    # of shard_size. The warm up slices are (start, end) pairs of the frames to decode before the shard.
+    bounds = []
+    start = 0
+    previous_start = 0
+    write = None
+    while start < len(frames):
+        end = start + shard_size
+        while end < len(frames) and frames[end - 1]['type'] != 'stop':
+            end += 1
+        end = min(end, len(frames))
+
+        write = last_write_transaction(frames, start, previous_start) or write
+        warm_up = [write] if write is not None else []
+        # A read after the write leaves no transaction in progress, unlike the end of the write.
+        last_start = last_transaction_start(frames, start)
+        if last_start is not None and last_start >= (write[1] if write is not None else 0):
+            warm_up.append((last_start, start))
+        bounds.append((tuple(warm_up), start, end))
+        previous_start = start
+        start = end
+    return bounds
+
+
+def check_settings(hla_type, settings):
+    # Raises ValueError for settings that make the HLA write a file, like the export file of the gyroscope HLA and the
+    # index file of the I2C HLAs (named by the FILE_SETTINGS of their module): every worker would write the file over
+    # again.
+    module = sys.modules.get(hla_type.__module__)
+    for name in FILE_SETTINGS:
+        file_setting = getattr(module, name, None)
+        if file_setting is not None and settings.get(file_setting):
+            raise ValueError('the {!r} setting can not be used when decoding in parallel, as every worker would write '
+                             'the file; decode serially to write it'.format(file_setting))
+
+
+def set_worker_frames(frames):
+    global worker_frames
+    worker_frames = frames
+    # Objects inherited from the calling process are moved out of reach of the garbage collector, whose passes over
+    # them would otherwise write to (and so copy) every page of the shared frames.
+    gc.freeze()
+
+
+def decode_shard(hla_type, settings, bounds):
+    warm_up, start, end = bounds
+    hla = hla_type()
+    hla.get_capabilities()
+    hla.set_settings(settings)
+    decode = batch_decoder(hla)
+    for warm_up_start, warm_up_end in warm_up:
+        decode(worker_frames[warm_up_start:warm_up_end])
+    return decode(worker_frames[start:end])
+
+
+def decode_serial(hla_type, frames, settings=None):
+    hla = hla_type()
+    hla.get_capabilities()
+    hla.set_settings(settings or {})
+    return batch_decoder(hla)(frames)
+
+
+def decode_parallel(hla_type, frames, settings=None, shard_size=None, max_workers=None):
+    # Produces the same output frames as decode_serial, as a list. hla_type must be importable in the worker processes.
+    settings = settings or {}
+    check_settings(hla_type, settings)
+    frames = frames if isinstance(frames, list) else list(frames)
+    max_workers = max_workers or os.cpu_count() or 1
+    if shard_size is None:
+        shard_size = max(math.ceil(len(frames) / (max_workers * SHARDS_PER_WORKER)), 1)
+    bounds = shard_bounds(frames, shard_size)
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+    output = []
+    with ProcessPoolExecutor(max_workers, context, initializer=set_worker_frames, initargs=(frames,)) as executor:
+        # map() yields results in submission order, which keeps the output frames in time order.
+        for shard_output in executor.map(decode_shard, [hla_type] * len(bounds), [settings] * len(bounds), bounds):
+            output.extend(shard_output)
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('extension', help='extension.json listing the HLAs to decode with')
+    parser.add_argument('--entry', action='append', help='name of the HLA in extension.json (default: all of them)')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help='frame stream file, one JSON frame per line')
+    source.add_argument('--synthetic', choices=sorted(synthetic_frames.GENERATORS), help='generate input frames')
+    parser.add_argument('--count', type=int, default=1000000, help='number of synthetic frames')
+    parser.add_argument('--setting', action='append', default=[], help='HLA setting as "label=value"')
+    parser.add_argument('--workers', type=int, help='number of worker processes (default: one per core)')
+    parser.add_argument('--shard-size', type=int, help='approximate number of frames per shard')
+    args = parser.parse_args()
+
+    frames = list(open_frames(args))
+    for name, hla_type in load_entry_points(args.extension, args.entry):
+        settings = parse_settings(hla_type().get_capabilities(), args.setting)
+        try:
+            check_settings(hla_type, settings)
+        except ValueError as error:
+            raise SystemExit('{}: {}'.format(name, error))
+
+        start = time.perf_counter()
+        serial = decode_serial(hla_type, frames, settings)
+        serial_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parallel = decode_parallel(hla_type, frames, settings, args.shard_size, args.workers)
+        parallel_seconds = time.perf_counter() - start
+
+        if parallel != serial:
+            raise SystemExit('{}: the parallel output differs from the serial output'.format(name))
+        print('{}: {:,} input frames, {:,} output frames'.format(name, len(frames), len(serial)))
+        print('  serial   {:8.3f} s {:>14,.0f} frames/s'.format(serial_seconds, len(frames) / serial_seconds))
+        print('  parallel {:8.3f} s {:>14,.0f} frames/s ({:.1f}x)'.format(
+            parallel_seconds, len(frames) / parallel_seconds, serial_seconds / parallel_seconds))
+
+
+if __name__ == '__main__':
+    main()
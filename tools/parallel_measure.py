@@ -0,0 +1,53 @@
+"""Reduce the chunks of a range measurement in a process pool.
+
+Measurers that declare a `partial_state_type` (ClockStatsMeasurer and VoltageStatisticsMeasurer) can turn any
+contiguous chunk of data into a partial state with `partial_state_type.from_data(chunk)`, and merge the partial states
+of neighbouring chunks in time order with `merge`. The functions below build the partial states in worker processes and
+merge them in the calling process, so long range measurements scale with the number of cores.
+
+The chunks must be picklable, and the measurer's module must be importable in the worker processes (it is, as long as
+the extension directory and `saleae.range_measurements` are on `sys.path` when the pool is started).
+
+`measure_parallel` passes `from_data` the same options as the measurer's own `process_data` does (such as
+`percentiles=False` when no percentile metric was requested), so the workers do no more work than a serial measurement.
+ClockStatsMeasurer collects the entries of small chunks before building a partial state, so its percentile estimates
+can differ from a serial measurement, within their rank error; the other metrics are the same.
+
+    from clock_stats import ClockStatsMeasurer
+    values = measure_parallel(ClockStatsMeasurer, ['frequencyAvg'], chunks)
+"""
+from concurrent.futures import ProcessPoolExecutor
+import functools
+
+# Options of partial_state_type.from_data, and the measurer attribute holding the value its process_data passes.
+FROM_DATA_OPTIONS = {
+    'percentiles': 'needs_percentiles',
+    'total': 'needs_total',
+    'squares': 'needs_squares',
+    'm2': 'needs_m2',
+    'extrema': 'needs_extrema',
+}
+
+
+def from_data_options(measurer):
+    return {option: getattr(measurer, attribute) for option, attribute in FROM_DATA_OPTIONS.items()
+            if hasattr(measurer, attribute)}
+
+
+def reduce_partial_states(partial_state_type, chunks, max_workers=None, chunksize=1, **options):
+    # options are passed to partial_state_type.from_data with every chunk.
+    merged = partial_state_type()
+    from_data = functools.partial(partial_state_type.from_data, **options)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # map() yields results in submission order, which keeps the merge in time order.
+        for partial_state in executor.map(from_data, chunks, chunksize=chunksize):
+            merged.merge(partial_state)
+    return merged
+
+
+def measure_parallel(measurer_type, requested_measurements, chunks, max_workers=None, chunksize=1):
+    # Produces the same values as passing every chunk to process_data of a single measurer, then calling measure.
+    measurer = measurer_type(requested_measurements)
+    measurer.merge_partial_state(reduce_partial_states(
+        measurer_type.partial_state_type, chunks, max_workers, chunksize, **from_data_options(measurer)))
+    return measurer.measure()
@@ -0,0 +1,94 @@
+"""Look up I2C transactions in the transaction index of an I2C HLA.
+
+The Fancy I2C HLA in hla_simple_example and the gyroscope HLA add every transaction they decode to `hla.index`, a
+TransactionIndex (see transaction_index.py in either directory), which answers address, register and time range queries
+by binary search. In the Logic software, the HLAs only build the index when their Index File setting is given, and save
+it to that file. This decodes a frame stream with an HLA, optionally saves its index, and runs a query; with --load, the
+query runs on a saved index, such as an Index File, without decoding anything:
+
+    python tools/query_transactions.py hla_gyroscope/extension/extension.json --synthetic i2c --count 1000000 \\
+        --save gyro.index --register 0x20 --write
+    python tools/query_transactions.py --load gyro.index --address 0x69 --start 0.5 --end 0.6 --read
+
+Addresses are 7 bit addresses. Times are in seconds, and select the transactions starting in [start, end).
+"""
+import argparse
+import os
+import sys
+import time
+
+TOOLS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(TOOLS_DIRECTORY)
+sys.path.insert(0, TOOLS_DIRECTORY)
+
+from hla_batch import batch_decoder  # noqa: E402
+from replay_hla import batches, load_entry_points, open_frames  # noqa: E402
+import synthetic_frames  # noqa: E402
+
+# Both HLA directories hold the same transaction_index.py.
+sys.path.append(os.path.join(REPOSITORY_DIRECTORY, 'hla_gyroscope', 'extension'))
+from transaction_index import TransactionIndex  # noqa: E402
+
+BATCH_SIZE = 4096
+
+
+def decode_index(hla_type, frames):
+    hla = hla_type()
+    hla.get_capabilities()
+    hla.set_settings({})
+    # Without an Index File setting, the HLA only adds transactions to an index it is given.
+    hla.index = TransactionIndex()
+    decode = batch_decoder(hla)
+    for batch in batches(frames, BATCH_SIZE):
+        decode(batch)
+    return hla.index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('extension', nargs='?', help='extension.json of the HLA to decode with')
+    parser.add_argument('--entry', help='name of the HLA in extension.json (default: the first one)')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help='frame stream file, one JSON frame per line')
+    source.add_argument('--synthetic', choices=sorted(synthetic_frames.GENERATORS), help='generate input frames')
+    source.add_argument('--load', help='saved transaction index to query instead of decoding')
+    parser.add_argument('--count', type=int, default=100000, help='number of synthetic frames')
+    parser.add_argument('--save', help='save the transaction index to this file')
+    parser.add_argument('--address', type=lambda value: int(value, 0), help='7 bit address')
+    parser.add_argument('--register', type=lambda value: int(value, 0))
+    parser.add_argument('--start', type=float, help='start of the time range in seconds')
+    parser.add_argument('--end', type=float, help='end of the time range in seconds')
+    direction = parser.add_mutually_exclusive_group()
+    direction.add_argument('--read', dest='read', action='store_const', const=True, help='reads only')
+    direction.add_argument('--write', dest='read', action='store_const', const=False, help='writes only')
+    parser.add_argument('--show', type=int, default=10, help='number of matching transactions to print')
+    args = parser.parse_args()
+
+    if args.load:
+        start = time.perf_counter()
+        index = TransactionIndex.load(args.load)
+        print('loaded {:,} transactions in {:.3f} s'.format(len(index), time.perf_counter() - start))
+    else:
+        if not args.extension:
+            parser.error('an extension.json is required unless --load is used')
+        _, hla_type = load_entry_points(args.extension, [args.entry] if args.entry else None)[0]
+        start = time.perf_counter()
+        index = decode_index(hla_type, open_frames(args))
+        print('decoded {:,} transactions in {:.3f} s'.format(len(index), time.perf_counter() - start))
+    if args.save:
+        index.save(args.save)
+        print('saved to {} ({:,} bytes)'.format(args.save, os.path.getsize(args.save)))
+
+    start = time.perf_counter()
+    numbers = index.query(args.address, args.register, args.start, args.end, args.read)
+    print('{:,} matching transactions in {:.6f} s'.format(len(numbers), time.perf_counter() - start))
+    for number in numbers[:args.show]:
+        transaction = index.transaction(number)
+        print('  #{:<8} {:.9f} s to {:.9f} s  address 0x{:02x} {:<5} register {}'.format(
+            number, transaction['start_time'], transaction['end_time'], transaction['address'],
+            'read' if transaction['read'] else 'write',
+            '-' if transaction['register'] is None else '0x{:02x}'.format(transaction['register'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""Replay a stream of input frames through High Level Analyzers and report their cost.
+
+Loads the HLA entry points listed in an extension.json and drives each one through the same lifecycle as the Logic
+software: construct, `get_capabilities`, `set_settings`, then `decode` once per input frame. Frames are read lazily from
+a file written by frame_stream.py (or with --record), or generated on the fly, so replays of any length run in constant
+memory.
+
+    python tools/replay_hla.py hla_gyroscope/extension/extension.json --synthetic i2c --count 1000000
+    python tools/replay_hla.py hla_simple_example/extension.json --entry "Text Messages" \\
+        --input serial.jsonl --setting "Packet Delimiter=New Line [\\n]"
+    python tools/replay_hla.py --record serial.jsonl --synthetic serial --count 10000000
+
+With --compact, input frames are streamed through the columnar FrameBatch form and the output frames of the HLAs are
+turned into compact Frame objects (see compact_frames.py), which is counted as part of decoding.
+
+With --batch-size, frames are passed in lists of that many to `decode_batch` (see hla_batch.py), and the latencies
+reported are per batch.
+
+For every HLA it reports frames/s, p50/p99/max `decode` latency, output frame counts by type, and peak memory. By
+default peak memory is the peak RSS of the process; --trace-memory reports the peak of python allocations made while
+replaying instead, which is more precise but makes decoding several times slower. The peak RSS of a process never goes
+down, so when more than one HLA is replayed, each one is replayed in a new process of its own.
+"""
+import argparse
+import collections
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+TOOLS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TOOLS_DIRECTORY)
+
+import compact_frames  # noqa: E402
+import frame_stream  # noqa: E402
+from hla_batch import batch_decoder  # noqa: E402
+import synthetic_frames  # noqa: E402
+
+
+class LatencyHistogram:
+    # Log-linear histogram of nanosecond latencies, with a relative bucket width of at most 1 / 2**SUB_BUCKET_BITS. Its
+    # size depends only on the range of the latencies, not on how many there are.
+    SUB_BUCKET_BITS = 5
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.count = 0
+        self.maximum = 0
+
+    def add(self, nanoseconds):
+        shift = max(nanoseconds.bit_length() - self.SUB_BUCKET_BITS - 1, 0)
+        self.counts[(shift, nanoseconds >> shift)] += 1
+        self.count += 1
+        if nanoseconds > self.maximum:
+            self.maximum = nanoseconds
+
+    def percentile(self, percent):
+        if self.count == 0:
+            return None
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for shift, mantissa in sorted(self.counts, key=lambda bucket: bucket[1] << bucket[0]):
+            seen += self.counts[(shift, mantissa)]
+            if seen >= rank:
+                # Report the middle of the bucket.
+                return (mantissa << shift) + ((1 << shift) >> 1)
+        return self.maximum
+
+
+def load_entry_points(extension_path, names=None):
+    # Returns (name, class) for every HighLevelAnalyzer in the extension.json, or only the ones in names.
+    with open(extension_path) as f:
+        extension = json.load(f)
+    directory = os.path.dirname(os.path.abspath(extension_path))
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+
+    entry_points = []
+    for name, entry in extension['extensions'].items():
+        if entry['type'] != 'HighLevelAnalyzer' or (names and name not in names):
+            continue
+        module_name, class_name = entry['entryPoint'].rsplit('.', 1)
+        module = importlib.import_module(module_name)
+        entry_points.append((name, getattr(module, class_name)))
+    if names:
+        missing = set(names) - set(name for name, _ in entry_points)
+        if missing:
+            raise SystemExit('no HighLevelAnalyzer named {} in {}'.format(', '.join(sorted(missing)), extension_path))
+    return entry_points
+
+
+def parse_settings(capabilities, assignments):
+    # Converts "label=value" assignments to a settings dict, using the setting types from get_capabilities. As in the
+    # Logic software, settings that were not given are not passed at all.
+    declared = (capabilities or {}).get('settings', {})
+    settings = {}
+    for assignment in assignments:
+        label, _, value = assignment.partition('=')
+        if label not in declared:
+            raise SystemExit('unknown setting {!r}, expected one of: {}'.format(label, ', '.join(declared)))
+        if declared[label]['type'] == 'number':
+            value = float(value)
+        else:
+            value = value.encode().decode('unicode_escape')
+        settings[label] = value
+    return settings
+
+
+def batches(frames, batch_size):
+    frames = iter(frames)
+    while True:
+        batch = list(itertools.islice(frames, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def replay(hla_type, frames, setting_assignments=(), trace_memory=False, batch_size=None, compact=False):
+    hla = hla_type()
+    if compact:
+        frames = compact_frames.rows(frames)
+    capabilities = hla.get_capabilities()
+    hla.set_settings(parse_settings(capabilities, setting_assignments))
+
+    histogram = LatencyHistogram()
+    output_counts = collections.Counter()
+    input_count = 0
+    decode_nanoseconds = 0
+    clock = time.perf_counter_ns
+    if batch_size:
+        decode = batch_decoder(hla)
+        calls = batches(frames, batch_size)
+    else:
+        decode = hla.decode
+        calls = frames
+
+    if compact:
+        decode = compact_frames.compact_decoder(decode)
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    for call in calls:
+        before = clock()
+        output = decode(call)
+        elapsed = clock() - before
+
+        input_count += len(call) if batch_size else 1
+        decode_nanoseconds += elapsed
+        histogram.add(elapsed)
+        if output is None:
+            continue
+        if isinstance(output, (list, tuple)):
+            for item in output:
+                output_counts[item['type']] += 1
+        else:
+            output_counts[output['type']] += 1
+    wall_seconds = time.perf_counter() - start
+
+    if trace_memory:
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    else:
+        # ru_maxrss is in kilobytes on Linux, and in bytes on macOS.
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_memory *= 1 if sys.platform == 'darwin' else 1024
+
+    return {
+        'input_frames': input_count,
+        'output_frames': dict(output_counts),
+        'wall_seconds': wall_seconds,
+        'decode_seconds': decode_nanoseconds / 1e9,
+        'frames_per_second': input_count / wall_seconds if wall_seconds > 0 else None,
+        'decode_p50_ns': histogram.percentile(50),
+        'decode_p99_ns': histogram.percentile(99),
+        'decode_max_ns': histogram.maximum,
+        'peak_memory_bytes': peak_memory,
+        'peak_memory_kind': 'traced' if trace_memory else 'rss',
+        'latency_per': 'batch of {}'.format(batch_size) if batch_size else 'frame',
+    }
+
+
+def print_report(name, report):
+    print('{}:'.format(name))
+    print('  input frames   {:,}'.format(report['input_frames']))
+    output = ', '.join('{} {:,}'.format(type, count) for type, count in sorted(report['output_frames'].items()))
+    print('  output frames  {}'.format(output or 'none'))
+    print('  throughput     {:,.0f} frames/s ({:.3f} s total, {:.3f} s in decode)'.format(
+        report['frames_per_second'] or 0, report['wall_seconds'], report['decode_seconds']))
+    print('  decode latency p50 {} ns, p99 {} ns, max {} ns per {}'.format(
+        report['decode_p50_ns'], report['decode_p99_ns'], report['decode_max_ns'], report['latency_per']))
+    print('  peak memory    {:,.3f} MiB ({})'.format(report['peak_memory_bytes'] / 2 ** 20, report['peak_memory_kind']))
+
+
+def open_frames(args):
+    if args.input:
+        return frame_stream.read_frames(args.input)
+    return synthetic_frames.GENERATORS[args.synthetic](args.count)
+
+
+def replay_entry(args, name):
+    # Replays the HLA called name with the command line arguments, in a process started for it alone.
+    [(_, hla_type)] = load_entry_points(args.extension, [name])
+    return replay(hla_type, open_frames(args), args.setting, args.trace_memory, args.batch_size, args.compact)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('extension', nargs='?', help='extension.json listing the HLAs to replay')
+    parser.add_argument('--entry', action='append', help='name of the HLA in extension.json (default: all of them)')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help='frame stream file, one JSON frame per line')
+    source.add_argument('--synthetic', choices=sorted(synthetic_frames.GENERATORS), help='generate input frames')
+    parser.add_argument('--count', type=int, default=100000, help='number of synthetic frames')
+    parser.add_argument('--setting', action='append', default=[], help='HLA setting as "label=value"')
+    parser.add_argument('--batch-size', type=int, help='pass frames to decode_batch in lists of this size')
+    parser.add_argument('--compact', action='store_true', help='use compact input and output frames')
+    parser.add_argument('--trace-memory', action='store_true', help='report traced python allocations as peak memory')
+    parser.add_argument('--record', help='write the synthetic frames to this file instead of replaying them')
+    parser.add_argument('--json', help='also write the reports to this JSON file')
+    args = parser.parse_args()
+
+    if args.record:
+        count = frame_stream.write_frames(args.record, open_frames(args))
+        print('wrote {:,} frames to {}'.format(count, args.record))
+        return
+    if not args.extension:
+        parser.error('an extension.json is required unless --record is used')
+
+    reports = {}
+    entry_points = load_entry_points(args.extension, args.entry)
+    if len(entry_points) == 1:
+        [(name, hla_type)] = entry_points
+        reports[name] = replay(hla_type, open_frames(args), args.setting, args.trace_memory, args.batch_size, args.compact)
+        print_report(name, reports[name])
+    else:
+        # Otherwise the peak RSS reported for an HLA would include the peaks of the ones replayed before it. The pool
+        # starts a new process for every task, which imports only this module and the entry point it replays.
+        with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+            for name, _ in entry_points:
+                reports[name] = pool.apply(replay_entry, (args, name))
+                print_report(name, reports[name])
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
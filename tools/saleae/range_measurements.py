@@ -0,0 +1,107 @@
+"""Offline stand-in for `saleae.range_measurements`, which only ships inside the Logic 2 software.
+
+This implements the API documented in the repository README, so measurers can be run and profiled from a plain python
+interpreter. Put the `tools` directory on `sys.path` (ahead of any real `saleae` package) to use it.
+
+Like the Logic software, `run_measurement` constructs the measurer, passes every chunk to `process_data` in order, and
+calls `measure` once at the end. The first entry of the first `DigitalData` chunk is the bit state at the beginning of
+the range, not a transition.
+"""
+import math
+
+
+class GraphTime:
+    # An absolute time. Subtracting one GraphTime from another gives the difference in seconds, as a float. The whole and
+    # fractional seconds are kept apart so differences keep their precision far into a long capture.
+    def __init__(self, seconds, fraction=0.0):
+        whole = math.floor(fraction)
+        self.seconds = int(seconds) + int(whole)
+        self.fraction = float(fraction - whole) + (seconds - int(seconds))
+        if self.fraction >= 1.0:
+            self.seconds += 1
+            self.fraction -= 1.0
+
+    @classmethod
+    def from_parts(cls, seconds, fraction):
+        # Skips the normalization done by the constructor, fraction must already be in [0, 1).
+        time = cls.__new__(cls)
+        time.seconds = seconds
+        time.fraction = fraction
+        return time
+
+    def __sub__(self, other):
+        if not isinstance(other, GraphTime):
+            return NotImplemented
+        return (self.seconds - other.seconds) + (self.fraction - other.fraction)
+
+    def __add__(self, seconds):
+        return GraphTime(self.seconds, self.fraction + seconds)
+
+    def __repr__(self):
+        return 'GraphTime({!r})'.format(self.seconds + self.fraction)
+
+
+class DigitalData:
+    # The transitions of one chunk of digital data. Iterating yields (GraphTime, bool) pairs. The chunk is stored as
+    # arrays of offsets in seconds from start_time and bit states, so it is compact and can be pickled.
+    def __init__(self, start_time, offsets, states):
+        # NumPy is imported here rather than with the module, so importing a measurer does not import it through this
+        # stand-in when the measurer itself does not.
+        import numpy
+        self.start_time = start_time
+        self.offsets = numpy.asarray(offsets, dtype=numpy.float64)
+        self.states = numpy.asarray(states, dtype=bool)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __iter__(self):
+        # The times are split into whole and fractional seconds for the whole chunk at once, leaving only the
+        # construction of the GraphTime objects to the loop.
+        import numpy
+        fractions = self.start_time.fraction + self.offsets
+        whole = numpy.floor(fractions)
+        fractions -= whole
+        seconds = whole.astype(numpy.int64) + self.start_time.seconds
+        from_parts = GraphTime.from_parts
+        for second, fraction, state in zip(seconds.tolist(), fractions.tolist(), self.states.tolist()):
+            yield from_parts(second, fraction), state
+
+
+class AnalogData:
+    # One chunk of analog samples. sample_rate is not part of the Logic API: measurers that can use it should read it with
+    # getattr(data, 'sample_rate', None).
+    def __init__(self, samples, sample_rate=None):
+        self.samples = samples
+        self.sample_count = len(samples)
+        self.sample_rate = sample_rate
+
+    def __iter__(self):
+        return iter(self.samples)
+
+
+class DigitalMeasurer:
+    def __init__(self, requested_measurements):
+        self.requested_measurements = requested_measurements
+
+
+class AnalogMeasurer:
+    def __init__(self, requested_measurements):
+        self.requested_measurements = requested_measurements
+        # Updated after every call to process_data.
+        self.processed_sample_count = 0
+
+
+def process_chunks(measurer, chunks):
+    # Not part of the Logic API: passes chunks to process_data the way the Logic software does.
+    for data in chunks:
+        measurer.process_data(data)
+        if isinstance(data, AnalogData):
+            measurer.processed_sample_count += data.sample_count
+
+
+def run_measurement(measurer_type, requested_measurements, chunks):
+    # Not part of the Logic API: drives a measurer the way the Logic software does.
+    measurer = measurer_type(requested_measurements)
+    process_chunks(measurer, chunks)
+    return measurer.measure()
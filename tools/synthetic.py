@@ -0,0 +1,67 @@
+"""Synthetic captures for exercising measurers offline.
+
+Every generator returns a list of chunks in the shape the Logic software passes to `process_data`: `DigitalData` for
+the digital generators and `AnalogData` for the analog ones, from the stand-in in `saleae/range_measurements.py`.
+`chunk_size` is the number of entries (digital) or samples (analog) per chunk; the last chunk may be shorter.
+"""
+import numpy
+
+from saleae.range_measurements import AnalogData, DigitalData, GraphTime
+
+# An arbitrary, large start time, so time differences are computed the way they are deep into a long capture.
+DEFAULT_START_TIME = GraphTime(3600)
+
+
+def digital_chunks(offsets, states, chunk_size, start_time=DEFAULT_START_TIME):
+    return [
+        DigitalData(start_time, offsets[index:index + chunk_size], states[index:index + chunk_size])
+        for index in range(0, len(offsets), chunk_size)
+    ]
+
+
+def analog_chunks(samples, chunk_size, sample_rate=None):
+    return [AnalogData(samples[index:index + chunk_size], sample_rate) for index in range(0, len(samples), chunk_size)]
+
+
+def clock(frequency, edge_count, jitter=0.0, duty_cycle=0.5, chunk_size=65536, seed=0, start_time=DEFAULT_START_TIME):
+    # A clock starting high, with edge_count transitions after the initial state. jitter is the standard deviation of
+    # the (normally distributed) timing error of each edge, in seconds.
+    rng = numpy.random.default_rng(seed)
+    period = 1.0 / frequency
+    cycle = numpy.arange(edge_count) // 2
+    offsets = (cycle + numpy.where(numpy.arange(edge_count) % 2 == 0, duty_cycle, 1.0)) * period
+    if jitter > 0:
+        offsets += rng.normal(0.0, jitter, edge_count)
+    offsets = numpy.concatenate(([0.0], numpy.maximum.accumulate(offsets)))
+    # The initial high state is followed by a falling edge, then alternating edges.
+    states = numpy.arange(edge_count + 1) % 2 == 0
+    return digital_chunks(offsets, states, chunk_size, start_time)
+
+
+def pwm(frequency, period_count, duty_cycle_min=0.1, duty_cycle_max=0.9, modulation_periods=1000, chunk_size=65536,
+        start_time=DEFAULT_START_TIME):
+    # A fixed frequency signal starting low, whose duty cycle is swept sinusoidally between duty_cycle_min and
+    # duty_cycle_max once every modulation_periods periods.
+    period = 1.0 / frequency
+    cycle = numpy.arange(period_count)
+    duty_cycle = duty_cycle_min + (duty_cycle_max - duty_cycle_min) * 0.5 * (
+        1 + numpy.sin(2 * numpy.pi * cycle / modulation_periods))
+    rising = cycle * period + period
+    falling = rising + duty_cycle * period
+    offsets = numpy.concatenate(([0.0], numpy.column_stack((rising, falling)).ravel()))
+    states = numpy.concatenate(([False], numpy.tile([True, False], period_count)))
+    return digital_chunks(offsets, states, chunk_size, start_time)
+
+
+def sine(sample_rate, frequency, sample_count, amplitude=1.0, offset=0.0, noise=0.0, harmonics=(), chunk_size=1 << 20,
+         dtype=numpy.float32, seed=0):
+    # A sine wave plus normally distributed noise with a standard deviation of noise. harmonics is a sequence of
+    # (harmonic number, relative amplitude) pairs added on top of the fundamental.
+    rng = numpy.random.default_rng(seed)
+    phase = 2 * numpy.pi * frequency / sample_rate * numpy.arange(sample_count)
+    samples = offset + amplitude * numpy.sin(phase)
+    for harmonic, relative_amplitude in harmonics:
+        samples += amplitude * relative_amplitude * numpy.sin(harmonic * phase)
+    if noise > 0:
+        samples += rng.normal(0.0, noise, sample_count)
+    return analog_chunks(samples.astype(dtype), chunk_size, sample_rate)
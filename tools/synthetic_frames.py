@@ -0,0 +1,105 @@
+"""Synthetic input frame streams for replaying HLAs offline.
+
+The generators yield frames lazily, in the shapes documented under "Input Frame Types" in the repository README, so
+they can produce streams of any length without holding them in memory.
+"""
+import itertools
+import math
+
+DEFAULT_LINES = [
+    'boot: firmware 1.4.2 starting',
+    'sensor: gyro online, odr=800Hz',
+    'log: heartbeat',
+    'warning: fifo at 90% capacity',
+]
+
+# I2C address of the L3G4200D with SDO high, as the 8 bit write address.
+GYRO_WRITE_ADDRESS = 0xD2
+GYRO_OUT_X_L = 0x28
+GYRO_CTRL_REG1 = 0x20
+AUTO_INCREMENT = 0x80
+
+
+def frame(type, start_time, end_time, data):
+    return {'type': type, 'start_time': start_time, 'end_time': end_time, 'data': data}
+
+
+def serial_frames(count, baud_rate=115200, lines=DEFAULT_LINES, line_gap=1e-3):
+    # Text lines terminated with '\n', one frame per character, with line_gap seconds of idle time between lines.
+    character_time = 10.0 / baud_rate
+    time = 0.0
+    emitted = 0
+    for line in itertools.cycle(lines):
+        for character in line + '\n':
+            if emitted == count:
+                return
+            yield frame('data', time, time + character_time, {
+                'value': bytes((ord(character),)),
+                'parity_error': False,
+                'framing_error': False,
+                'address': False,
+            })
+            time += character_time
+            emitted += 1
+        time += line_gap
+
+
+def i2c_transaction(time, bit_time, address, data):
+    # Frames of one transaction, and the time after its stop condition.
+    frames = [frame('start', time, time + bit_time, {})]
+    time += bit_time
+    frames.append(frame('address', time, time + 9 * bit_time, {'address': bytes((address,))}))
+    time += 9 * bit_time
+    for byte in data:
+        frames.append(frame('data', time, time + 9 * bit_time, {'data': bytes((byte,))}))
+        time += 9 * bit_time
+    frames.append(frame('stop', time, time + bit_time, {}))
+    return frames, time + bit_time
+
+
+def i2c_frames(count, clock_rate=400e3, sample_rate=800.0, configure_every=100):
+    # Gyroscope traffic: for every sample, a write of the OUT_X_L register address (with the auto-increment bit) followed
+    # by a 6 byte read of the X, Y and Z registers. Every configure_every samples, CTRL_REG1 is rewritten.
+    bit_time = 1.0 / clock_rate
+    sample_index = 0
+    emitted = 0
+    while True:
+        time = sample_index / sample_rate
+        transactions = []
+        if sample_index % configure_every == 0:
+            transactions.append((GYRO_WRITE_ADDRESS, [GYRO_CTRL_REG1, 0x0F]))
+        phase = 2 * math.pi * sample_index / 1000.0
+        raw = [int(8000 * math.sin(phase + offset)) & 0xFFFF for offset in (0.0, 2.0, 4.0)]
+        transactions.append((GYRO_WRITE_ADDRESS, [GYRO_OUT_X_L | AUTO_INCREMENT]))
+        transactions.append((GYRO_WRITE_ADDRESS | 1, [byte for value in raw for byte in (value & 0xFF, value >> 8)]))
+
+        for address, data in transactions:
+            frames, time = i2c_transaction(time, bit_time, address, data)
+            for item in frames:
+                if emitted == count:
+                    return
+                yield item
+                emitted += 1
+        sample_index += 1
+
+
+def spi_frames(count, clock_rate=1e6, lines=DEFAULT_LINES, line_gap=1e-4):
+    # Text sent on MOSI one byte per frame, with MISO idle.
+    byte_time = 8.0 / clock_rate
+    time = 0.0
+    emitted = 0
+    for line in itertools.cycle(lines):
+        for character in line + '\n':
+            if emitted == count:
+                return
+            yield frame('result', time, time + byte_time, {'miso': 0, 'mosi': ord(character)})
+            time += byte_time
+            emitted += 1
+        time += line_gap
+
+
+GENERATORS = {
+    'serial': serial_frames,
+    'i2c': i2c_frames,
+    'spi': spi_frames,
+}
@@ -0,0 +1,386 @@
+# Multi-resolution summary index (a "mipmap") over blocks of analog samples.
+#
+# The Logic software passes the same underlying sample blocks to python every time a measurement over the same part of
+# a capture is computed, sliced to the measurement range. Dragging a measurement range around therefore re-reads mostly
+# the same samples over and over. This module keeps, for sample blocks that are read more than once, a pyramid of
+# per-block count, sum, M2 (sum of squared differences from the mean), min and max at several block sizes. Any range
+# of the block can then be summarized from O(log n) index entries plus the raw samples at the two partial edges.
+#
+# Samples are only summarized through the pyramid when they are read again, by a measurement overlapping the samples
+# read before: the chunks of a single measurement do not overlap, so a one-off measurement does a single pass over its
+# own range. The entries of a pyramid are only built for the samples of the slice being summarized, so building costs
+# at most one pass over the slice, whatever the size of the block.
+#
+# Samples are assumed not to change once they have been passed to a measurement. The pyramid never reads other samples
+# of the block, so a block filled in place by a live capture is only read where it has been filled.
+#
+# The cache lives in this module rather than in the measurer so it survives the measurer module being reloaded.
+import bisect
+from collections import OrderedDict
+import weakref
+
+from lazy_import import lazy_import
+
+# Imported by the first measurement, see lazy_import.py.
+numpy = lazy_import('numpy', globals())
+
+# Number of samples summarized by each entry of the finest level, and the number of entries of one level summarized by
+# each entry of the next level.
+BASE_BLOCK_SIZE = 1024
+FAN_OUT = 16
+
+# Number of samples summarized at a time when reading raw samples. A run and its float64 copy (512 KB) stay in the L2
+# cache, and runs are long enough that the python work per run does not show.
+KERNEL_RUN_SIZE = 1 << 16
+
+# Slices shorter than this are always summarized directly, which takes about as long as summarizing them from a pyramid.
+MINIMUM_INDEXED_SAMPLES = 1 << 16
+
+# Total size of all cached pyramids. The least recently used pyramids are evicted first.
+DEFAULT_BUDGET_BYTES = 64 * 1024 * 1024
+
+
+def combined_m2(totals, m2s, block_size, axis=None):
+    # The M2 of consecutive blocks of block_size samples each, from their sums and M2s, along axis. Like the parallel
+    # variance algorithm (Chan et al.), this adds the spread of the block means around their common mean, instead of
+    # subtracting squared sums, which would cancel out most of the digits of a signal with a large DC offset.
+    count = totals.shape[axis] if axis is not None else totals.size
+    if count == 0:
+        return 0.0
+    means = totals / block_size
+    mean = means.sum(axis=axis, keepdims=axis is not None) / count
+    means -= mean
+    return m2s.sum(axis=axis) + block_size * numpy.square(means).sum(axis=axis)
+
+
+class Summary:
+    # Count, sum, M2 (sum of squared differences from the mean), min and max of a run of samples. Sums are float64
+    # regardless of the sample type.
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count > 0 else 0.0
+
+    @property
+    def sum_of_squares(self):
+        return self.m2 + self.total * self.mean
+
+    @classmethod
+    def from_samples(cls, samples, total=True, squares=True, m2=True, extrema=True):
+        # Summarizes the samples in a single pass. They are processed in runs of KERNEL_RUN_SIZE that fit in the cache, and
+        # every statistic is taken from the run while it is there, with reductions that do not allocate a temporary the
+        # size of the run. Runs of non-float64 samples are first copied to one float64 scratch buffer to be summed.
+        #
+        # Only the statistics asked for are gathered: the sum when total is set, the sum of squares when squares is set,
+        # and the min and max when extrema is set. M2, which is needed for the variance, is only computed from the
+        # differences of every run from its mean when m2 is set, and the sum and sum of squares then come with it.
+        # Otherwise M2 is derived from the sum of squares, with the sum left at 0 when it is not gathered. This is not
+        # precise enough for the variance, but sum_of_squares gives back the sum of squares, also after merges.
+        summary = cls()
+        count = samples.size
+        if count == 0:
+            return summary
+        summary.count = int(count)
+        total = total and not m2
+        squares = squares and not m2
+        if not (total or squares or m2 or extrema):
+            return summary
+
+        scratch = numpy.empty(min(count, KERNEL_RUN_SIZE)) if squares or m2 else None
+        moment_summary = cls()
+        run_totals = 0.0
+        run_squares = 0.0
+        minimum = None
+        maximum = None
+
+        for start in range(0, count, KERNEL_RUN_SIZE):
+            run = samples[start:start + KERNEL_RUN_SIZE]
+            if extrema:
+                run_minimum = float(numpy.minimum.reduce(run))
+                run_maximum = float(numpy.maximum.reduce(run))
+                minimum = run_minimum if minimum is None else min(minimum, run_minimum)
+                maximum = run_maximum if maximum is None else max(maximum, run_maximum)
+            if scratch is not None and run.dtype != numpy.float64:
+                numpy.copyto(scratch[:len(run)], run)
+                run = scratch[:len(run)]
+            if m2:
+                deviations = scratch[:len(run)]
+                run_summary = cls()
+                run_summary.count = len(run)
+                run_summary.total = float(numpy.add.reduce(run))
+                numpy.subtract(run, run_summary.total / len(run), out=deviations)
+                run_summary.m2 = float(numpy.dot(deviations, deviations))
+                moment_summary.merge(run_summary)
+                continue
+            if total:
+                run_totals += float(numpy.add.reduce(run, dtype=numpy.float64))
+            if squares:
+                run_squares += float(numpy.dot(run, run))
+
+        if m2:
+            summary.total = moment_summary.total
+            summary.m2 = moment_summary.m2
+        else:
+            summary.total = run_totals
+            summary.m2 = run_squares - run_totals * run_totals / count if squares else 0.0
+        summary.minimum = minimum
+        summary.maximum = maximum
+        return summary
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        # The parallel variance algorithm (Chan et al.), as in the PeriodStats of clockStats.
+        total_count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total_count
+        self.count = total_count
+        self.total += other.total
+        if other.minimum is not None:
+            self.minimum = other.minimum if self.minimum is None else min(self.minimum, other.minimum)
+            self.maximum = other.maximum if self.maximum is None else max(self.maximum, other.maximum)
+        return self
+
+    def add_entries(self, level, start, stop):
+        if start >= stop:
+            return
+        summary = Summary()
+        summary.count = (stop - start) * level.block_size
+        summary.total = float(level.totals[start:stop].sum())
+        summary.m2 = float(combined_m2(level.totals[start:stop], level.m2s[start:stop], level.block_size))
+        summary.minimum = float(level.minimums[start:stop].min())
+        summary.maximum = float(level.maximums[start:stop].max())
+        self.merge(summary)
+
+
+class PyramidLevel:
+    def __init__(self, block_size, length, dtype):
+        self.block_size = block_size
+        self.totals = numpy.zeros(length)
+        self.m2s = numpy.zeros(length)
+        self.minimums = numpy.zeros(length, dtype=dtype)
+        self.maximums = numpy.zeros(length, dtype=dtype)
+        # Whether the entry has been built. The values of the other entries are meaningless.
+        self.built = numpy.zeros(length, dtype=bool)
+
+    def __len__(self):
+        return len(self.totals)
+
+    @property
+    def nbytes(self):
+        return (self.totals.nbytes + self.m2s.nbytes + self.minimums.nbytes + self.maximums.nbytes +
+                self.built.nbytes)
+
+    def update(self, finer, first, last):
+        # Rebuilds the entries made of entries first to last - 1 of the next finer level, and returns their range. An
+        # entry is built when all of its finer entries are.
+        first = first // FAN_OUT
+        last = min(-(-last // FAN_OUT), len(self))
+        if first >= last:
+            return first, first
+        shape = (last - first, FAN_OUT)
+        children = slice(first * FAN_OUT, last * FAN_OUT)
+        totals = finer.totals[children].reshape(shape)
+        self.totals[first:last] = totals.sum(axis=1)
+        self.m2s[first:last] = combined_m2(totals, finer.m2s[children].reshape(shape), finer.block_size, axis=1)
+        self.minimums[first:last] = finer.minimums[children].reshape(shape).min(axis=1)
+        self.maximums[first:last] = finer.maximums[children].reshape(shape).max(axis=1)
+        self.built[first:last] = finer.built[children].reshape(shape).all(axis=1)
+        return first, last
+
+
+class SummaryPyramid:
+    def __init__(self, length, dtype):
+        # The pyramid of a block of length samples of dtype, with no entry built. The pyramid does not keep a reference
+        # to the samples, so that cached pyramids do not keep freed capture data alive.
+        level = PyramidLevel(BASE_BLOCK_SIZE, length // BASE_BLOCK_SIZE, dtype)
+        self.levels = [level]
+        while len(level) >= 2 * FAN_OUT:
+            level = PyramidLevel(level.block_size * FAN_OUT, len(level) // FAN_OUT, dtype)
+            self.levels.append(level)
+
+    @property
+    def nbytes(self):
+        return sum(level.nbytes for level in self.levels)
+
+    def build(self, block, start, stop):
+        # Builds the entries of the base blocks within samples start to stop - 1 of block that are not built yet, and
+        # the coarser entries made of them. No other sample of the block is read.
+        base = self.levels[0]
+        first = -(-start // BASE_BLOCK_SIZE)
+        last = min(stop // BASE_BLOCK_SIZE, len(base))
+        missing = numpy.flatnonzero(~base.built[first:last]) + first
+        if missing.size == 0:
+            return
+        for run in numpy.split(missing, numpy.flatnonzero(numpy.diff(missing) > 1) + 1):
+            self.build_blocks(block, int(run[0]), int(run[-1]) + 1)
+
+        first, last = int(missing[0]), int(missing[-1]) + 1
+        for finer, level in zip(self.levels, self.levels[1:]):
+            first, last = level.update(finer, first, last)
+
+    def build_blocks(self, block, first, last):
+        # Builds base blocks first to last - 1, working through them in slices of KERNEL_RUN_SIZE samples, whose float64
+        # copy stays in the cache.
+        base = self.levels[0]
+        rows = max(1, KERNEL_RUN_SIZE // BASE_BLOCK_SIZE)
+        for row in range(first, last, rows):
+            end = min(row + rows, last)
+            blocks = block[row * BASE_BLOCK_SIZE:end * BASE_BLOCK_SIZE].reshape((end - row, BASE_BLOCK_SIZE))
+            part = blocks.astype(numpy.float64)
+            totals = part.sum(axis=1)
+            part -= (totals / BASE_BLOCK_SIZE)[:, numpy.newaxis]
+            base.totals[row:end] = totals
+            base.m2s[row:end] = numpy.einsum('ij,ij->i', part, part)
+            base.minimums[row:end] = blocks.min(axis=1)
+            base.maximums[row:end] = blocks.max(axis=1)
+        base.built[first:last] = True
+
+    def summarize(self, samples, offset, total=True, squares=True, m2=True, extrema=True):
+        # samples is a slice of the block the pyramid was built from, starting at offset, whose entries have been built.
+        # The flags are those of Summary.from_samples, for the raw samples at the edges.
+        summary = Summary()
+        start = offset
+        stop = offset + len(samples)
+        first = -(-start // BASE_BLOCK_SIZE)
+        last = min(stop // BASE_BLOCK_SIZE, len(self.levels[0]))
+        if first >= last:
+            return summary.merge(Summary.from_samples(samples, total, squares, m2, extrema))
+
+        # The raw samples at both edges are summarized together, which halves the fixed cost of from_samples.
+        edges = numpy.concatenate((samples[:first * BASE_BLOCK_SIZE - offset], samples[last * BASE_BLOCK_SIZE - offset:]))
+        summary.merge(Summary.from_samples(edges, total, squares, m2, extrema))
+
+        # At each level, summarize the partial runs of entries at both ends and hand the fully covered middle to the next
+        # (coarser) level. Each level contributes less than 2 * FAN_OUT entries.
+        for index, level in enumerate(self.levels):
+            if index + 1 == len(self.levels):
+                summary.add_entries(level, first, last)
+                break
+            coarse_first = -(-first // FAN_OUT)
+            coarse_last = min(last // FAN_OUT, len(self.levels[index + 1]))
+            if coarse_first >= coarse_last:
+                summary.add_entries(level, first, last)
+                break
+            summary.add_entries(level, first, coarse_first * FAN_OUT)
+            summary.add_entries(level, coarse_last * FAN_OUT, last)
+            first, last = coarse_first, coarse_last
+
+        return summary
+
+
+class ReadRanges:
+    # The samples of a block read so far, as the sorted starts and stops of disjoint ranges. Ranges that touch are
+    # merged, so the chunks of a measurement add up to a single range.
+    def __init__(self):
+        self.starts = []
+        self.stops = []
+
+    def add(self, start, stop):
+        # Adds samples start to stop - 1. Returns whether any of them had been read before, and the range of samples read
+        # so far that contains them.
+        first = bisect.bisect_left(self.stops, start)
+        last = bisect.bisect_right(self.starts, stop)
+        # The ranges first to last - 1 overlap or touch the new range.
+        overlaps = any(self.starts[index] < stop and start < self.stops[index] for index in range(first, last))
+        if first < last:
+            start = min(start, self.starts[first])
+            stop = max(stop, self.stops[last - 1])
+        self.starts[first:last] = [start]
+        self.stops[first:last] = [stop]
+        return overlaps, start, stop
+
+
+class CachedBlock:
+    def __init__(self, block):
+        # The weak reference guards against a new block reusing the id of a block that has been freed.
+        self.reference = weakref.ref(block)
+        self.read_ranges = ReadRanges()
+        self.pyramid = None
+
+
+def find_block(samples):
+    # Returns the array that owns the memory of samples, and the offset of samples within it, if samples is a plain
+    # contiguous slice of a one dimensional array. Returns None otherwise.
+    block = samples
+    while isinstance(block.base, numpy.ndarray):
+        block = block.base
+    if block.ndim != 1 or samples.ndim != 1 or block.dtype != samples.dtype:
+        return None
+    if not block.flags.c_contiguous or samples.strides[0] != samples.itemsize:
+        return None
+    offset, remainder = divmod(samples.ctypes.data - block.ctypes.data, samples.itemsize)
+    if remainder != 0 or offset < 0 or offset + len(samples) > len(block):
+        return None
+    return block, offset
+
+
+class SummaryIndexCache:
+    def __init__(self, budget_bytes=DEFAULT_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        # id(block) -> CachedBlock, least recently used first.
+        self.entries = OrderedDict()
+
+    def summarize(self, samples, total=True, squares=True, m2=True, extrema=True):
+        # Samples read for the first time are summarized directly, with the statistics asked for. Samples read again are
+        # summarized through the pyramid of their block, which is built for them first, and the summary then includes
+        # every statistic.
+        found = find_block(samples) if len(samples) >= MINIMUM_INDEXED_SAMPLES else None
+        if found is None:
+            return Summary.from_samples(samples, total, squares, m2, extrema)
+        block, offset = found
+
+        key = id(block)
+        entry = self.entries.get(key)
+        if entry is not None and entry.reference() is not block:
+            self.evict(key)
+            entry = None
+        if entry is None:
+            entry = self.entries[key] = CachedBlock(block)
+            self.trim()
+        self.entries.move_to_end(key)
+
+        stop = offset + len(samples)
+        overlaps, read_start, read_stop = entry.read_ranges.add(offset, stop)
+        if not overlaps:
+            return Summary.from_samples(samples, total, squares, m2, extrema)
+        if entry.pyramid is None:
+            pyramid = SummaryPyramid(len(block), block.dtype)
+            if pyramid.nbytes > self.budget_bytes:
+                return Summary.from_samples(samples, total, squares, m2, extrema)
+            entry.pyramid = pyramid
+            self.used_bytes += pyramid.nbytes
+            self.trim()
+
+        # The base blocks at the edges of the samples are also built when all of their samples have been read, such as the
+        # block shared with the previous chunk of a measurement, which neither chunk covers.
+        build_start = max(read_start, offset // BASE_BLOCK_SIZE * BASE_BLOCK_SIZE)
+        build_stop = min(read_stop, -(-stop // BASE_BLOCK_SIZE) * BASE_BLOCK_SIZE)
+        entry.pyramid.build(block, build_start, build_stop)
+        return entry.pyramid.summarize(samples, offset, total, squares, m2, extrema)
+
+    def evict(self, key):
+        entry = self.entries.pop(key)
+        if entry.pyramid is not None:
+            self.used_bytes -= entry.pyramid.nbytes
+
+    def trim(self):
+        # Drop blocks that have been freed, then the least recently used blocks until the cache is within budget.
+        for key in [key for key, entry in self.entries.items() if entry.reference() is None]:
+            self.evict(key)
+        while self.used_bytes > self.budget_bytes:
+            self.evict(next(iter(self.entries)))
+
+    def clear(self):
+        self.entries.clear()
+        self.used_bytes = 0
+
+
+cache = SummaryIndexCache()
@@ -1,31 +1,109 @@
 import math
 
-import numpy
-
 from saleae.range_measurements import AnalogMeasurer
 
+from instrumentation import instrument
+import summary_index
+
 VOLTAGE_RMS = 'voltageRms'
+VOLTAGE_MEAN = 'voltageMean'
+VOLTAGE_MIN = 'voltageMin'
+VOLTAGE_MAX = 'voltageMax'
+VOLTAGE_PEAK_TO_PEAK = 'voltagePeakToPeak'
+VOLTAGE_STD_DEV = 'voltageStdDev'
+
+# Metrics computed from the sum, from the sum of squares, from M2 (sum of squared differences from the mean), and from the
+# min and max, along with the sample count.
+TOTAL_MEASUREMENTS = [VOLTAGE_MEAN]
+SQUARES_MEASUREMENTS = [VOLTAGE_RMS]
+M2_MEASUREMENTS = [VOLTAGE_STD_DEV]
+EXTREMA_MEASUREMENTS = [VOLTAGE_MIN, VOLTAGE_MAX, VOLTAGE_PEAK_TO_PEAK]
+
+# When enabled, samples that are measured again (for example while the user drags a measurement range around) are
+# summarized through a cached multi-resolution index instead of re-reading every sample. See summary_index.py.
+USE_SUMMARY_INDEX = True
+
 
+class VoltageStatisticsPartial(summary_index.Summary):
+    # The state of VoltageStatisticsMeasurer for one contiguous run of samples: the sample count, sum, M2 (sum of squared
+    # differences from the mean), min and max.
+    #
+    # A partial state can be built from any chunk on its own, and partial states can be merged in any grouping, so chunks
+    # can be reduced independently (for instance in a process pool) and combined afterwards. Instances are plain objects
+    # and can be pickled to move them between processes.
+    @classmethod
+    def from_data(cls, data, total=True, squares=True, m2=True, extrema=True):
+        if USE_SUMMARY_INDEX:
+            summary = summary_index.cache.summarize(data.samples, total, squares, m2, extrema)
+        else:
+            summary = summary_index.Summary.from_samples(data.samples, total, squares, m2, extrema)
+
+        partial = cls()
+        partial.merge(summary)
+        return partial
+
+
+@instrument
 class VoltageStatisticsMeasurer(AnalogMeasurer):
-    supported_measurements = [VOLTAGE_RMS]
+    supported_measurements = [VOLTAGE_RMS, VOLTAGE_MEAN, VOLTAGE_MIN, VOLTAGE_MAX, VOLTAGE_PEAK_TO_PEAK, VOLTAGE_STD_DEV]
+    partial_state_type = VoltageStatisticsPartial
 
     def __init__(self, requested_measurements):
         super().__init__(requested_measurements)
-        self.voltage_square = None
+        self.partial_state = None
 
-        if VOLTAGE_RMS in self.requested_measurements:
-            self.voltage_square = 0
+        # All of the requested metrics are computed in a single pass over each chunk, but only the statistics they need
+        # are gathered: the RMS alone, for instance, only needs the sum of squares.
+        self.needs_total = any(m in self.requested_measurements for m in TOTAL_MEASUREMENTS)
+        self.needs_squares = any(m in self.requested_measurements for m in SQUARES_MEASUREMENTS)
+        self.needs_m2 = any(m in self.requested_measurements for m in M2_MEASUREMENTS)
+        self.needs_extrema = any(m in self.requested_measurements for m in EXTREMA_MEASUREMENTS)
+        if self.needs_total or self.needs_squares or self.needs_m2 or self.needs_extrema:
+            self.partial_state = VoltageStatisticsPartial()
 
     def process_data(self, data):
-        if self.voltage_square is not None:
-            square_sum = numpy.average(numpy.square(data.samples))
-            self.voltage_square += (square_sum - self.voltage_square) * (data.sample_count / (self.processed_sample_count + data.sample_count))
-    
+        if self.partial_state is not None:
+            self.partial_state.merge(VoltageStatisticsPartial.from_data(
+                data, self.needs_total, self.needs_squares, self.needs_m2, self.needs_extrema))
+
+    def merge_partial_state(self, partial_state):
+        # Used instead of process_data when the chunks were reduced elsewhere, for instance in a process pool.
+        if self.partial_state is not None:
+            self.partial_state.merge(partial_state)
+
+    def snapshot(self):
+        # Metrics of the samples passed so far. The running sums are only read, so more samples can still be passed to
+        # process_data afterwards, for instance as a live capture grows.
+        return self.measure()
+
     def measure(self):
         values = {}
+        state = self.partial_state
+        if state is None:
+            return values
 
-        if self.voltage_square is not None:
-            values[VOLTAGE_RMS] = math.sqrt(self.voltage_square)
+        if VOLTAGE_RMS in self.requested_measurements:
+            mean_square = state.sum_of_squares / state.count if state.count > 0 else 0.0
+            values[VOLTAGE_RMS] = math.sqrt(mean_square)
 
-        return values
+        if VOLTAGE_MEAN in self.requested_measurements:
+            if state.count > 0:
+                values[VOLTAGE_MEAN] = state.total / state.count
+
+        if VOLTAGE_STD_DEV in self.requested_measurements:
+            if state.count > 1:
+                values[VOLTAGE_STD_DEV] = math.sqrt(state.m2 / (state.count - 1))
 
+        if VOLTAGE_MIN in self.requested_measurements:
+            if state.minimum is not None:
+                values[VOLTAGE_MIN] = state.minimum
+
+        if VOLTAGE_MAX in self.requested_measurements:
+            if state.maximum is not None:
+                values[VOLTAGE_MAX] = state.maximum
+
+        if VOLTAGE_PEAK_TO_PEAK in self.requested_measurements:
+            if state.minimum is not None:
+                values[VOLTAGE_PEAK_TO_PEAK] = state.maximum - state.minimum
+
+        return values
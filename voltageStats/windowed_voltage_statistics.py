@@ -0,0 +1,150 @@
+import math
+
+import numpy
+from numpy.lib.stride_tricks import sliding_window_view
+
+from summary_index import combined_m2
+from voltage_statistics import VoltageStatisticsMeasurer
+
+# Fields of the array returned by WindowedVoltageStatisticsMeasurer.windows(). start and end are sample indexes from the
+# first sample of the range (end excluded), and metrics that cannot be computed for a window are NaN.
+WINDOW_DTYPE = numpy.dtype([
+    ('start', numpy.int64),
+    ('end', numpy.int64),
+    ('voltageRms', numpy.float64),
+    ('voltageMean', numpy.float64),
+    ('voltageStdDev', numpy.float64),
+    ('voltageMin', numpy.float64),
+    ('voltageMax', numpy.float64),
+    ('voltagePeakToPeak', numpy.float64),
+])
+
+# Windows are reduced through tiles when the tiles have at least this many samples, and sample by sample otherwise.
+MINIMUM_TILE_SIZE = 16
+
+
+class WindowedVoltageStatisticsMeasurer(VoltageStatisticsMeasurer):
+    # VoltageStatisticsMeasurer that also measures windows of window samples, starting every hop samples from the first
+    # sample of the range, so the metrics can be followed through a range in a single pass over its data.
+    #
+    # The samples of windows that are not complete yet are kept between calls to process_data (at most window samples,
+    # plus the chunk), and all of the windows completed by a chunk are then measured at once with numpy, whatever their
+    # number. measure() returns the metrics of the whole range as usual, and windows() the metrics of every window.
+    def __init__(self, requested_measurements, window, hop=None):
+        super().__init__(requested_measurements)
+        window = int(window)
+        hop = window if hop is None else int(hop)
+        if window <= 0 or hop <= 0:
+            raise ValueError('window and hop must be positive')
+        self.window = window
+        self.hop = hop
+        # Samples kept for the windows still to be measured, and the index in the range of the first of them.
+        self.samples = numpy.empty(0)
+        self.samples_start = 0
+        self.completed = []
+        self.next_window = 0
+
+    def process_data(self, data):
+        super().process_data(data)
+        samples = numpy.asarray(data.samples)
+        self.samples = numpy.concatenate((self.samples, samples)) if self.samples.size > 0 else samples
+        end = self.samples_start + self.samples.size
+
+        complete_count = (end - self.window) // self.hop + 1 - self.next_window
+        if complete_count > 0:
+            starts = (self.next_window + numpy.arange(complete_count)) * self.hop
+            self.completed.append(self.measure_windows(starts, starts + self.window))
+            self.next_window += complete_count
+
+        # Samples before the start of the next window are not part of any window still to be measured. When the hop is
+        # longer than the window, the next window may even start after the samples passed so far.
+        dropped = min(self.next_window * self.hop - self.samples_start, self.samples.size)
+        if dropped > 0:
+            self.samples = self.samples[dropped:]
+            self.samples_start += dropped
+
+    def measure_windows(self, starts, ends):
+        windows = numpy.zeros(starts.size, dtype=WINDOW_DTYPE)
+        windows['start'] = starts
+        windows['end'] = ends
+        counts = ends - starts
+
+        tile = math.gcd(self.window, self.hop)
+        if tile >= MINIMUM_TILE_SIZE and (counts == self.window).all():
+            minimums, maximums, totals, m2s = self.reduce_tiles(starts, tile)
+        else:
+            minimums, maximums, totals, m2s = self.reduce_windows(starts, ends)
+
+        means = totals / counts
+        windows['voltageMean'] = means
+        windows['voltageRms'] = numpy.sqrt((m2s + totals * means) / counts)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            # Rounding can push the M2 of a nearly constant signal slightly below zero.
+            variances = numpy.maximum(m2s / (counts - 1), 0.0)
+        windows['voltageStdDev'] = numpy.where(counts > 1, numpy.sqrt(variances), numpy.nan)
+        windows['voltageMin'] = minimums
+        windows['voltageMax'] = maximums
+        windows['voltagePeakToPeak'] = maximums - minimums
+        return windows
+
+    def reduce_tiles(self, starts, tile):
+        # Every window is made of whole tiles of tile samples (the largest size dividing both the window and the hop),
+        # so the samples are reduced once per tile, as the rows of a 2D view, whatever the overlap of the windows. The
+        # window statistics are then combined from the sum and M2 of each tile, taken around the tile's mean, so a large
+        # DC offset does not cancel out the digits of the variance.
+        first = starts[0] - self.samples_start
+        tile_count = (starts[-1] - starts[0] + self.window) // tile
+        rows = self.samples[first:first + tile_count * tile].reshape(tile_count, tile)
+        tile_minimums = rows.min(axis=1)
+        tile_maximums = rows.max(axis=1)
+        deviations = rows.astype(numpy.float64)
+        tile_totals = deviations.sum(axis=1)
+        deviations -= (tile_totals / tile)[:, numpy.newaxis]
+        tile_m2s = numpy.einsum('ij,ij->i', deviations, deviations)
+
+        tiles_per_window = self.window // tile
+        firsts = numpy.arange(starts.size) * (self.hop // tile)
+        if tiles_per_window == 1:
+            return tile_minimums[firsts], tile_maximums[firsts], tile_totals[firsts], tile_m2s[firsts]
+        minimums = sliding_window_view(tile_minimums, tiles_per_window)[firsts].min(axis=1)
+        maximums = sliding_window_view(tile_maximums, tiles_per_window)[firsts].max(axis=1)
+        window_totals = sliding_window_view(tile_totals, tiles_per_window)[firsts]
+        window_m2s = sliding_window_view(tile_m2s, tiles_per_window)[firsts]
+        return minimums, maximums, window_totals.sum(axis=1), combined_m2(window_totals, window_m2s, tile, axis=1)
+
+    def reduce_windows(self, starts, ends):
+        # Each window's samples are reduced with reduceat over the (start, stop) pairs of all of the windows, which
+        # handles windows of any length. reduceat needs every index within the samples: a single stop at the end of the
+        # samples is left out, as reduceat reduces the last start to the end anyway, and otherwise (windows cut short
+        # by the end of the samples) a trailing sample is added.
+        indexes = numpy.stack((starts, ends), axis=1).ravel() - self.samples_start
+        samples = self.samples.astype(numpy.float64, copy=False)
+        # Deviations are taken from the mean of all of the samples first, so the sum of squares does not lose the noise
+        # on a large DC offset to rounding.
+        reference = samples.mean() if samples.size > 0 else 0.0
+        deviations = samples - reference
+        if (indexes[:-1] == samples.size).any():
+            samples = numpy.append(samples, 0.0)
+            deviations = numpy.append(deviations, 0.0)
+        elif indexes[-1] == samples.size:
+            indexes = indexes[:-1]
+        counts = ends - starts
+        minimums = numpy.minimum.reduceat(samples, indexes)[::2]
+        maximums = numpy.maximum.reduceat(samples, indexes)[::2]
+        sums = numpy.add.reduceat(deviations, indexes)[::2]
+        squares = numpy.add.reduceat(deviations * deviations, indexes)[::2]
+        return minimums, maximums, sums + counts * reference, squares - sums * sums / counts
+
+    def windows(self):
+        # The metrics of every window, as an array of WINDOW_DTYPE. The windows that start within the samples passed so
+        # far but end after them are included, measured over the samples they have. Like measure, this does not change
+        # the state, so process_data can be called again afterwards.
+        completed = list(self.completed)
+        end = self.samples_start + self.samples.size
+        count = -(-end // self.hop) - self.next_window
+        if count > 0:
+            starts = (self.next_window + numpy.arange(count)) * self.hop
+            completed.append(self.measure_windows(starts, numpy.minimum(starts + self.window, end)))
+        if not completed:
+            return numpy.zeros(0, dtype=WINDOW_DTYPE)
+        return numpy.concatenate(completed)